@@ -72,7 +72,7 @@ class SpreadLog(Base):
 # ==== ДОБАВИТЬ В КОНЕЦ db/models.py ====
 from sqlalchemy import (
     Column, Integer, String, DateTime, ForeignKey, JSON,
-    UniqueConstraint, Index
+    UniqueConstraint, Index, Text
 )
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -144,3 +144,17 @@ class PassUsage(Base):
     day = Column(Date, index=True, nullable=False)        # UTC-дата
     used = Column(Integer, default=0, nullable=False)     # сколько раскладов за день
     last_ts = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class InterpretationCache(Base):
+    """
+    Кэш «сырых» толкований одиночных карт (карта дня, пункты сценариев).
+    На один ключ (карта × положение × тема × пункт) — несколько вариантов текста.
+    """
+    __tablename__ = "interpretation_cache"
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String(64), nullable=False, index=True)   # sha1 нормализованного ключа
+    variant = Column(Integer, nullable=False, default=0)   # порядковый номер варианта (для отладки)
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -15,6 +15,10 @@ from db.models import User
 
 from keyboards_inline import main_menu_inline
 from services.billing import grant_credits, get_user_balance
+from services.tarot_ai import llm_stats
+from services.daily import daily_pool_stats
+from services.advice_prefetch import get_advice_prefetcher
+from handlers.stream_delivery import TG_TEXT_LIMIT
 from services.payments import (
     get_recent_uncredited,
     get_purchase_by_charge,
@@ -80,6 +84,59 @@ async def cmd_recredit(message: Message):
     await message.answer(f"✅ Пользователю {p.tg_id} добавлено {p.credits}. Баланс: {bal}")
 
 
+# ---------------------------
+# Статистика LLM-слоя
+# ---------------------------
+def _is_zero(v) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool) and v == 0
+
+
+def _pack_messages(blocks: list[str], limit: int = TG_TEXT_LIMIT) -> list[str]:
+    """Склеивает блоки в сообщения не длиннее limit (длинный блок режется по строкам)."""
+    messages: list[str] = []
+    current = ""
+    for block in blocks:
+        # секция целиком переносится в новое сообщение, если в текущее не влезает
+        if current and len(block) <= limit and len(current) + 1 + len(block) > limit:
+            messages.append(current)
+            current = ""
+        for line in block.split("\n"):
+            line = line[:limit]
+            if current and len(current) + 1 + len(line) > limit:
+                messages.append(current)
+                current = ""
+            current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
+
+@router.message(F.text.startswith("/llm_stats"))
+async def cmd_llm_stats(message: Message):
+    """/llm_stats — все секции без нулевых счётчиков; /llm_stats limiter — только секции с таким началом."""
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет прав на эту команду.")
+        return
+    parts = (message.text or "").split(maxsplit=1)
+    only = parts[1].strip().lower() if len(parts) > 1 else ""
+    sections = {
+        **llm_stats(),
+        "daily": daily_pool_stats(),
+        "advice_prefetch": get_advice_prefetcher().prefetch_stats(),
+    }
+    blocks = []
+    for section, values in sections.items():
+        if only and not section.lower().startswith(only):
+            continue
+        lines = [f"  {k}: {v}" for k, v in values.items() if not _is_zero(v)]
+        blocks.append("\n".join([f"[{section}]"] + (lines or ["  (всё по нулям)"])))
+    if not blocks:
+        await message.answer(f"Нет секций, начинающихся с «{only}». Разделы: {', '.join(sections)}")
+        return
+    for text in _pack_messages(["📊 LLM:"] + blocks):
+        await message.answer(text)
+
+
 # ---------------------------
 # Админ-рассылка
 # ---------------------------
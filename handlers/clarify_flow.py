@@ -21,9 +21,19 @@ from aiogram.fsm.state import StatesGroup, State
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.enums import ChatAction
 
-from services.tarot_ai import draw_cards, gpt_make_prediction
-from services.billing import ensure_user, spend_one_or_pass
+from services.tarot_ai import (
+    draw_cards, gpt_make_prediction, gpt_make_prediction_stream, gpt_make_scenario_reading, TAROT_STREAMING,
+    note_scenario_failure, template_prediction,
+)
+from services.text_normalizer import EMOJI_RX, clean_point_text, clean_summary_text
+from services.billing import ensure_user, spend_one_or_pass, pass_is_active
+from services.advice_prefetch import get_advice_prefetcher
+from services.advice_lexicon import get_advice_lexicon
+from services.card_registry import get_card_registry, pack_cards
+from services.context_digest import compact_context
+from services.llm_errors import LLMError, LLMOverloaded
 from keyboards_inline import advice_inline_limits
+from handlers.stream_delivery import StreamingReply
 from db import SessionLocal, models
 
 
@@ -335,21 +345,9 @@ class ClarifyFSM(StatesGroup):
 MAGIC_FOOTER = "🔮✨🌙✨🔮"
 
 # ------------------ Утилиты форматирования/очистки ------------------
-EMOJI_RX = re.compile(
-    r"[\U0001F300-\U0001FAFF\U00002500-\U00002BEF\U00002600-\U000026FF\U00002700-\U000027BF\U0001F1E6-\U0001F1FF\ufe0f\ufe0e]",
-    flags=re.UNICODE,
-)
 _SENT_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
 _ITOG_HEADER_RE = re.compile(r"(?im)^\s*(?:🌙\s*)?Итог\s*:?\s*")
 
-ADVICE_HINTS = [
-    "совет", "советую", "рекоменд", "стоит", "следует", "лучше",
-    "нужно", "необходимо", "постарайтесь", "попробуйте", "сделайте",
-    "возьмите", "должны", "вам стоит", "вам следует", "рекомендую",
-    "избегайте", "продолжайте", "планируйте", "подума", "уделите",
-    "сконцентрируйтесь", "сосредоточьтесь", "начните", "перестаньте"
-]
-
 def _collapse_spaces(text: str) -> str:
     if not isinstance(text, str):
         return text
@@ -363,53 +361,6 @@ def _collapse_spaces(text: str) -> str:
 def strip_emojis(text: str) -> str:
     return EMOJI_RX.sub("", text or "")
 
-def strip_bullets(text: str) -> str:
-    t = re.sub(r"(?m)^\s*[•\-\*\u2022\u25CF>\u27A1\u279C\u25B6]+\s*", "", text or "")
-    return re.sub(r"\n{3,}", "\n\n", t).strip()
-
-LINE_DROP_RX = re.compile(r"(?im)^\s*(итог|вывод|совет|рекомендац\w*)\s*:\s*.*$", re.UNICODE | re.MULTILINE)
-INLINE_ITOG_RX = re.compile(r"(?im)\b(итог|вывод|совет)\s*:\s*[^.\n]*[^\n]*")
-
-def remove_itog_advice_lines(text: str) -> str:
-    t = LINE_DROP_RX.sub("", text or "")
-    t = INLINE_ITOG_RX.sub("", t)
-    t = re.sub(r"\n{3,}", "\n\n", t).strip()
-    return t
-
-def collapse_card_named_lines_to_paragraph(text: str) -> str:
-    lines = [l.strip() for l in (text or "").splitlines() if l.strip()]
-    rhs_parts, other = [], []
-    pattern = re.compile(r'^[\-\*\•\u25CF\s]*[A-Za-zА-Яа-яЁё0-9 ]{1,30}\s*[—\-:]\s*(.+)$')
-    for l in lines:
-        m = pattern.match(l)
-        if m:
-            rhs_parts.append(m.group(1).strip())
-        else:
-            other.append(l)
-    if len(rhs_parts) >= 2:
-        paragraph = " ".join(rhs_parts)
-        text = ("\n\n".join(other + [paragraph])).strip() if other else paragraph
-    return text
-
-def sanitize_answer(text: str) -> str:
-    t = remove_itog_advice_lines(text)
-    t = strip_emojis(t)
-    t = strip_bullets(t)
-    return _collapse_spaces(t)
-
-def sanitize_summary(text: str) -> str:
-    t = remove_itog_advice_lines(text)
-    t = strip_emojis(t)
-    t = strip_bullets(t)
-    t = re.sub(r"(?m)^\s*(\d+[\).\:]|\-|\•)\s+.*$", "", t)
-    t = collapse_card_named_lines_to_paragraph(t)
-    t = re.sub(r"\s*\n\s*", " ", t)
-    t = re.sub(r"\s{2,}", " ", t).strip()
-    # убрать возможные упоминания карт из итога
-    t = re.sub(r"(?i)\b(туз|двойка|тройка|четвёрка|пятёрка|шестёрка|семёрка|восьмёрка|девятка|десятка|паж|рыцарь|королева|король|шут|маг|жрица|императрица|император|жрец|влюблённые|колесница|сила|отшельник|колесо фортуны|справедливость|повешенный|смерть|умеренность|дьявол|башня|звезда|луна|солнце|суд|мир)\b.*?(жезл|чаш|кубк|меч|пентакл)", "", t)
-    t = re.sub(r"\(\s*перев[ёе]рнут[аяы].*?\)", "", t)
-    return t.strip()
-
 def starify_card_header_block(text: str) -> str:
     """Гарантируем '🃏 Карта:' в начале сообщения по карте (заменили ⭐️ на 🃏)."""
     if not isinstance(text, str):
@@ -430,7 +381,7 @@ def itog_three_sentences_no_advice(text: str) -> str:
 
     # фильтруем предложения с советными словами
     sentences = [s.strip() for s in _SENT_SPLIT_RE.split(t) if s.strip()]
-    clean = [s for s in sentences if not any(h in s.lower() for h in ADVICE_HINTS)]
+    clean = get_advice_lexicon().drop_advice(sentences, "scenario")
 
     # доводим до ровно трёх
     clean = clean[:3]
@@ -456,49 +407,7 @@ def itog_three_sentences_no_advice(text: str) -> str:
 
     return joined
 
-# ---------- НОВОЕ: нормализация имени карты и устойчивое удаление дублей ----------
-def normalize_card_base(name: str) -> str:
-    """
-    Возвращает «базовое» имя карты без приписок про перевёрнутость и прочих скобок.
-    Пример: 'Туз Жезлы (перевёрнутая)' -> 'Туз Жезлы'
-    """
-    if not isinstance(name, str):
-        return name or ""
-    t = name.strip()
-    # убрать (перевёрнутая) / (reversed) и любые скобочные хвосты в конце
-    t = re.sub(r"\s*\((?:перев[ёе]рнут\w*|reversed)[^)]*\)\s*$", "", t, flags=re.IGNORECASE)
-    # иногда встречается '— перевёрнутая' без скобок
-    t = re.sub(r"\s*[—\-:]\s*перев[ёе]рнут\w*\s*$", "", t, flags=re.IGNORECASE)
-    return t.strip()
-
-def _card_name_variants_regex(card_name_base: str) -> str:
-    """
-    Строит regex по БАЗОВОМУ имени карты (без '(перевёрнутая)') и допускает частые падежи мастей.
-    """
-    if not isinstance(card_name_base, str) or not card_name_base.strip():
-        return re.escape(card_name_base or "")
-
-    words = card_name_base.strip().split()
-    suit_map = {
-        "жезлы": r"Жезл(?:ы|ов)",
-        "кубки": r"Кубк(?:и|ов)",
-        "чаши": r"Чаш(?:и|)",
-        "мечи": r"Меч(?:и|ей)",
-        "пентакли": r"Пентакл(?:и|ей)",
-        "пентаклей": r"Пентакл(?:и|ей)",
-    }
-
-    def suit_pattern(token: str) -> str:
-        low = token.lower().replace("ё", "е")
-        return suit_map.get(low, re.escape(token))
-
-    if len(words) >= 2:
-        head = r"\s+".join(re.escape(w) for w in words[:-1])
-        tail_pat = suit_pattern(words[-1])
-        return rf"{head}\s+{tail_pat}"
-    else:
-        return re.escape(words[0])
-
+# ---------- устойчивое удаление дублей имени карты (шаблоны — services/card_registry.py) ----------
 def drop_leading_card_header(text: str, card_name: str) -> str:
     """
     Убирает дубли в начале толкования:
@@ -515,17 +424,14 @@ def drop_leading_card_header(text: str, card_name: str) -> str:
     # 0) Сносим любую 'Карта: ...' шапку в начале блока
     t = re.sub(r'^(?:[⭐️🃏]\s*)?Карта:\s*[^\n]*\n+', '', t, flags=re.IGNORECASE)
 
-    # 1) Готовим базовое имя карты (без '(перевёрнутая)')
-    base = normalize_card_base(card_name)
-    name_pat = _card_name_variants_regex(base)
+    # 1) Шаблоны имени карты (падежи мастей, с/без '(перевёрнутая)') — заранее скомпилированы в реестре
+    repeat_line_rx, repeat_inline_rx = get_card_registry().header_rx(card_name)
 
     # 2) Вариант с отдельной строкой-заголовком
-    repeat_line_rx = rf'^(?:{name_pat})(?:\s*\((?:перев[ёе]рнут\w*|reversed)[^)]*\))?\s*(?:[—\-:]\s*)?(?:\n+|$)'
-    t = re.sub(repeat_line_rx, '', t, flags=re.IGNORECASE)
+    t = repeat_line_rx.sub('', t)
 
     # 3) Вариант без переноса: 'Туз Жезлов (перевёрнутая) ...' или 'Туз Жезлов в перевёрнутом положении ...'
-    repeat_inline_rx = rf'^(?:{name_pat})(?:\s*\((?:перев[ёе]рнут\w*|reversed)[^)]*\))?(?:\s+в\s+перев[ёе]рнут\w*\s+положени[ие])?\s*(?:[—\-:]\s*)?'
-    t = re.sub(repeat_inline_rx, '', t, count=1, flags=re.IGNORECASE)
+    t = repeat_inline_rx.sub('', t, count=1)
 
     # 4) Уберём пустые начала/двойные переносы
     t = re.sub(r'^\s*\n+', '', t)
@@ -584,6 +490,107 @@ class _TypingAction:
 def typing_action(bot, chat_id: int, interval: float = 4.0) -> _TypingAction:
     return _TypingAction(bot, chat_id, interval)
 
+# ------------------ Толкование пунктов и итог ------------------
+# Пункты сценария генерируются параллельно: не больше CLARIFY_READING_CONCURRENCY
+# на один расклад и не больше CLARIFY_GLOBAL_CONCURRENCY на весь бот.
+CLARIFY_READING_CONCURRENCY = int(os.getenv("CLARIFY_READING_CONCURRENCY", "3"))
+CLARIFY_GLOBAL_CONCURRENCY = int(os.getenv("CLARIFY_GLOBAL_CONCURRENCY", "12"))
+_POINTS_GLOBAL_SEM = asyncio.Semaphore(max(1, CLARIFY_GLOBAL_CONCURRENCY))
+
+# Режим генерации: "parallel" — вызов на пункт + вызов на итог;
+# "single" — один структурированный вызов на весь сценарий, добор по нераспознанным пунктам.
+CLARIFY_GENERATION_MODE = os.getenv("CLARIFY_GENERATION_MODE", "parallel").strip().lower()
+
+SUMMARY_QUESTION = (
+    "Сформулируй общий ИТОГ расклада строго в 3 предложениях. "
+    "Проанализируй весь расклад целиком по смыслу. "
+    "Не упоминай названия карт и не перечисляй пункты. "
+    "Пиши от второго лица («Вы»), обращаясь к задающему вопрос. "
+    "Избегай третьего лица («он», «она», «человек»). "
+    "Без советов/рекомендаций, без списков и эмодзи."
+)
+
+def _render_point_block(text: str, card: str) -> str:
+    # text уже очищен профилем "point" (services/text_normalizer.py)
+    a = drop_leading_card_header(text, card)
+    return starify_card_header_block(f"Карта: {card}\n\n{a}")
+
+async def _interpret_point(
+    cb: CallbackQuery,
+    *,
+    point: str,
+    card: str,
+    theme: str,
+    scenario_title: str,
+    stream: bool = False,
+) -> Tuple[str, bool]:
+    """
+    Толкование одной карты по пункту сценария → (блок «🃏 Карта: …», уже_отправлен).
+    stream=True — блок сразу публикуется и дописывается правками (для первого пункта),
+    иначе только генерируется, а отправляет вызывающий — строго по порядку пунктов.
+    """
+    kwargs = dict(
+        question=point, theme=theme, spread="auto", cards_list=card, scenario_ctx=scenario_title, output="point",
+    )
+    reply = StreamingReply(cb.message, render=lambda t: _render_point_block(t, card), single=True) if stream else None
+
+    try:
+        if reply is not None:
+            raw = await asyncio.wait_for(reply.run(gpt_make_prediction_stream(**kwargs)), timeout=60)
+        else:
+            raw = await asyncio.wait_for(gpt_make_prediction(**kwargs), timeout=60)
+        block = _render_point_block(raw, card)
+    except (asyncio.TimeoutError, LLMOverloaded):
+        # LLM не успела/перегружена/breaker открыт — толкование по значению карты
+        block = _render_point_block(template_prediction(theme, "auto", card, point, output="point"), card)
+    except Exception:
+        block = starify_card_header_block(f"Карта: {card}\n\nНе удалось получить толкование. Попробуйте ещё раз позже.")
+
+    if reply is not None and reply.delivered:
+        if reply.text != block:
+            # поток оборвался — оставляем уже показанную часть
+            await reply.finish()
+            block = reply.text
+        return block, True
+    return block, False
+
+def _normalize_summary(summary_clean: str) -> str:
+    # итог уже очищен (профиль "summary" / clean_summary_text) — доводим до 3 предложений от «Вы»
+    final_summary = itog_three_sentences_no_advice(summary_clean)
+    return enforce_second_person(final_summary)
+
+async def _make_summary(theme: str, scenario_title: str, card_names: List[str], parts: List[str]) -> str:
+    """Общий итог расклада по уже готовым толкованиям пунктов (3 предложения, без советов)."""
+    try:
+        # Вместо полных толкований — дайджест: карта (с ориентацией) + 1–2 ключевые фразы
+        full_context = compact_context("\n\n".join(parts), purpose="scenario_summary")
+
+        summary_raw = await asyncio.wait_for(
+            gpt_make_prediction(
+                question=SUMMARY_QUESTION,
+                theme=theme,
+                spread="summary",
+                cards_list=", ".join(card_names),
+                scenario_ctx=f"{scenario_title}\n\n{full_context}",
+                output="summary",
+            ),
+            timeout=90
+        )
+
+        final_summary = _normalize_summary(summary_raw)
+
+    except Exception:
+        # Итог по значениям карт (3 предложения) вместо общей заглушки
+        final_summary = template_prediction(theme, "summary", ", ".join(card_names))
+
+    return _capitalize_first(final_summary)
+
+def _capitalize_first(text: str) -> str:
+    # Заглавная буква
+    if text and len(text) > 1:
+        text = text[0].upper() + text[1:]
+    return text
+
 # ------------------ Медиа из data/spreads (опционально) ------------------
 def _pick_intro_media() -> str | None:
     folder = os.path.join("data", "spreads")
@@ -778,9 +785,9 @@ async def scenario_chosen(cb: CallbackQuery, state: FSMContext):
     # тянем карты
     try:
         cards = draw_cards(n)
-        card_names = [c.get("name") or c.get("title") for c in cards]
+        card_names = [c.name for c in cards]
     except Exception:
-        card_names = ["—"] * n
+        cards, card_names = [], ["—"] * n
 
     await state.set_state(ClarifyFSM.processing)
 
@@ -791,7 +798,7 @@ async def scenario_chosen(cb: CallbackQuery, state: FSMContext):
             user_id=user.id,
             theme=dir_title,
             spread=f"{dir_key}_scenario_{idx+1}",
-            cards={"cards": card_names},
+            cards=pack_cards(cards),
             cost=1
         ))
         await s.commit()
@@ -803,105 +810,56 @@ async def scenario_chosen(cb: CallbackQuery, state: FSMContext):
     # Интро (если есть медиа)
     await send_intro_with_caption(cb, header)
 
-    # ---------- первый пункт ----------
-    start_i = 0
-    if points:
-        c0 = card_names[0] if card_names else "—"
-        c0_base = normalize_card_base(c0)
-        async with typing_action(cb.message.bot, cb.message.chat.id):
+    # ---------- режим «одним запросом» (если включён) ----------
+    parsed: List[str | None] = [None] * len(points)
+    parsed_itog: str | None = None
+    if CLARIFY_GENERATION_MODE == "single" and len(points) > 1:
+        async with typing_action(cb.message.bot, cb.message.chat.id), _POINTS_GLOBAL_SEM:
             try:
-                raw0 = await asyncio.wait_for(
-                    gpt_make_prediction(
-                        question=points[0], theme=dir_title, spread="auto", cards_list=c0, scenario_ctx=scenario["title"]
+                parsed, parsed_itog = await asyncio.wait_for(
+                    gpt_make_scenario_reading(
+                        theme=dir_title, scenario_title=scenario["title"], points=points, cards=card_names
                     ),
-                    timeout=60
+                    timeout=90
                 )
-                a0 = sanitize_answer(raw0)
-                a0 = drop_leading_card_header(a0, c0_base)
-            except asyncio.TimeoutError:
-                a0 = "Толкование готовится дольше обычного. Попробуйте ещё раз."
-            except Exception:
-                a0 = "Не удалось получить толкование. Попробуйте ещё раз позже."
-
-        first_block = starify_card_header_block(f"Карта: {c0}\n\n{a0}")
-        await cb.message.answer(first_block, parse_mode=None)
+            except (asyncio.TimeoutError, LLMError) as e:
+                note_scenario_failure(isinstance(e, asyncio.TimeoutError))
+                print(f"[clarify] общий запрос сценария не удался ({e!r}), пункты пойдут отдельными вызовами")
 
-        combined_parts += [first_block, ""]
-        start_i = 1
+    # ---------- пункты сценария (параллельно, выдача по порядку) ----------
+    reading_sem = asyncio.Semaphore(max(1, CLARIFY_READING_CONCURRENCY))
 
-    # ---------- остальные пункты ----------
-    for i in range(start_i, len(points)):
+    async def _point(i: int, point: str) -> Tuple[str, bool]:
         c = card_names[i] if i < len(card_names) else "—"
-        c_base = normalize_card_base(c)
-        async with typing_action(cb.message.bot, cb.message.chat.id):
-            try:
-                raw = await asyncio.wait_for(
-                    gpt_make_prediction(
-                        question=points[i], theme=dir_title, spread="auto", cards_list=c, scenario_ctx=scenario["title"]
-                    ),
-                    timeout=60
-                )
-                a = sanitize_answer(raw)
-                a = drop_leading_card_header(a, c_base)
-            except asyncio.TimeoutError:
-                a = "Толкование готовится дольше обычного. Попробуйте ещё раз."
-            except Exception:
-                a = "Не удалось получить толкование. Попробуйте ещё раз позже."
-
-        block = starify_card_header_block(f"Карта: {c}\n\n{a}")
-        await cb.message.answer(block, parse_mode=None)
-        combined_parts += [block, ""]
-
-    # ---------- общий итог ----------
-    async with typing_action(cb.message.bot, cb.message.chat.id):
-        try:
-            # Собираем ТОЛЬКО тексты толкований без заголовков "Карта: ..."
-            card_texts_only: List[str] = []
-            for block in combined_parts:
-                cleaned = re.sub(r"(?im)^[🃏⭐️]?\s*Карта:\s*[^\n]*\n+", "", block).strip()
-                if cleaned:
-                    card_texts_only.append(cleaned)
-            full_context = "\n".join(card_texts_only)
-
-            summary_raw = await asyncio.wait_for(
-                gpt_make_prediction(
-                    question=(
-                        "Сформулируй общий ИТОГ расклада строго в 3 предложениях. "
-                        "Проанализируй весь расклад целиком по смыслу. "
-                        "Не упоминай названия карт и не перечисляй пункты. "
-                        "Пиши от второго лица («Вы»), обращаясь к задающему вопрос. "
-                        "Избегай третьего лица («он», «она», «человек»). "
-                        "Без советов/рекомендаций, без списков и эмодзи."
-                    ),
-                    theme=dir_title,
-                    spread="summary",
-                    cards_list=", ".join(card_names),
-                    scenario_ctx=f"{scenario['title']}\n\n{full_context}",
-                ),
-                timeout=90
+        if parsed[i] is not None:
+            return _render_point_block(clean_point_text(parsed[i]), c), False
+        # отдельный вызов — только для пунктов, которые не пришли в общем ответе
+        async with reading_sem, _POINTS_GLOBAL_SEM:
+            return await _interpret_point(
+                cb, point=point, card=c, theme=dir_title, scenario_title=scenario["title"],
+                stream=(i == 0 and TAROT_STREAMING),
             )
 
-            # чистим и нормализуем итог под требования
-            summary_clean = sanitize_summary(summary_raw)
-            final_summary = itog_three_sentences_no_advice(summary_clean)
-            final_summary = enforce_second_person(final_summary)
-
-        except asyncio.TimeoutError:
-            final_summary = (
-                "Ситуация развивается последовательно. "
-                "Динамика остаётся устойчивой. "
-                "Основные тенденции уже проявились."
-            )
-        except Exception:
-            final_summary = (
-                "Карты указывают на ключевые тенденции. "
-                "Важные влияния продолжают действовать. "
-                "Контекст остаётся неизменным."
-            )
+    async def _summary(point_tasks: List[asyncio.Task]) -> str:
+        # итог стартует сразу, как готов последний пункт, не дожидаясь отправки в чат
+        results = await asyncio.gather(*point_tasks)
+        if parsed_itog:
+            return _capitalize_first(_normalize_summary(clean_summary_text(parsed_itog)))
+        return await _make_summary(dir_title, scenario["title"], card_names, combined_parts[:2] + [b for b, _ in results])
 
-    # Заглавная буква
-    if final_summary and len(final_summary) > 1:
-        final_summary = final_summary[0].upper() + final_summary[1:]
+    point_tasks = [asyncio.create_task(_point(i, p)) for i, p in enumerate(points)]
+    summary_task = asyncio.create_task(_summary(point_tasks))
+    try:
+        async with typing_action(cb.message.bot, cb.message.chat.id):
+            for t in point_tasks:
+                block, delivered = await t
+                if not delivered:
+                    await cb.message.answer(block, parse_mode=None)
+                combined_parts += [block, ""]
+            final_summary = await summary_task
+    finally:
+        for t in (*point_tasks, summary_task):
+            t.cancel()
 
     await cb.message.answer(f"Итог\n\n{final_summary}\n\n{MAGIC_FOOTER}", parse_mode=None)
 
@@ -911,7 +869,7 @@ async def scenario_chosen(cb: CallbackQuery, state: FSMContext):
         last_prediction_text=combined_text,
         last_theme=dir_title,
         last_spread=f"{dir_key}_scenario_{idx+1}",
-        last_cards=card_names,
+        last_cards=pack_cards(cards),
         last_question=scenario["title"],
         last_scenario=scenario["title"],
         last_summary=final_summary,
@@ -919,6 +877,13 @@ async def scenario_chosen(cb: CallbackQuery, state: FSMContext):
         current_direction_title=dir_title,
     )
 
+    # ---------- советы заранее (в фоне, пока читают расклад) ----------
+    try:
+        has_pass = await pass_is_active(cb.from_user.id)
+    except Exception:
+        has_pass = False
+    get_advice_prefetcher().start(cb.from_user.id, combined_text, counts=(1, 3) if has_pass else (1,))
+
     # ---------- кнопки: советы + навигация ----------
     base_advice_kb = advice_inline_limits(allow_one=True, allow_three=True)
     final_kb = merge_advice_nav_kb(base_advice_kb)
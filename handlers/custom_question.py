@@ -5,6 +5,7 @@ from aiogram.fsm.state import StatesGroup, State
 
 from services.billing import spend_one_credit
 from services.tarot_ai import draw_cards, gpt_make_prediction
+from services.card_registry import pack_cards
 from db import SessionLocal, models
 from keyboards import main_menu, custom_question_keyboard
 
@@ -47,7 +48,7 @@ async def process_custom_question(message: Message, state: FSMContext):
             user_id=message.from_user.id,
             question=question,
             spread="custom",
-            cards={"cards": cards},
+            cards=pack_cards(cards),
             cost=1,
         )
         session.add(log)
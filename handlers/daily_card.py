@@ -1,7 +1,6 @@
 # handlers/daily_card.py
 import os
 import re
-import json
 import random
 from pathlib import Path
 from typing import Iterable
@@ -16,9 +15,10 @@ from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
 
 from services.daily import (
     subscribe_daily, unsubscribe_daily, resolve_card_image,
-    draw_random_card
+    draw_random_card, get_daily_interpretation, pregenerate_daily_interpretations,
 )
 from services.tarot_ai import gpt_make_prediction
+from services.card_registry import get_card_registry
 
 router = Router()
 
@@ -384,34 +384,25 @@ def find_card_image_path(card_name: str) -> str | None:
 # Чтение списка карт и выбор ограниченного поднабора
 # =========================
 def _load_tarot_list() -> list[dict]:
-    for p in (Path("data/tarot_cards.json"), Path("tarot_cards.json")):
-        if p.is_file():
-            try:
-                return json.loads(p.read_text("utf-8"))
-            except Exception:
-                pass
-    return []
+    try:
+        return [c.as_dict() for c in get_card_registry()]
+    except (OSError, ValueError):
+        return []
 
 def _draw_random_card_limited() -> dict:
     """
     Выбираем карту только из _ALLOWED_CARD_NAMES.
-    Если файл JSON не найден/пуст — используем исходную draw_random_card().
+    Если ни одной из них нет в колоде — используем исходную draw_random_card().
     """
-    all_cards = _load_tarot_list()
-    if not all_cards:
-        return draw_random_card()
-
     allowed_set = set(_ALLOWED_CARD_NAMES)
-    filtered = []
-    for it in all_cards:
-        nm = (it.get("name") or it.get("title") or "").strip()
-        if nm in allowed_set:
-            filtered.append(it)
-
-    if not filtered:
+    allowed = [c for c in get_card_registry() if c.name in allowed_set]
+    if not allowed:
         return draw_random_card()
+    return random.choice(allowed).as_dict()
 
-    return random.choice(filtered)
+async def pregenerate_daily_cards() -> int:
+    """Готовит толкования на сегодня для всего поднабора _ALLOWED_CARD_NAMES."""
+    return await pregenerate_daily_interpretations(_ALLOWED_CARD_NAMES)
 
 # =========================
 # Отправка «Карты дня» (ТОЛЬКО фото карты)
@@ -424,9 +415,9 @@ async def send_card_of_day(bot, chat_id: int):
     card = _draw_random_card_limited()
     name = card.get("name") or card.get("title") or str(card)
 
-    # Получаем толкование
+    # Толкование: из пула на день (готовится один раз на карту), иначе — LLM
     try:
-        interpretation = await gpt_make_prediction(
+        interpretation = await get_daily_interpretation(name) or await gpt_make_prediction(
             question="Карта дня",
             theme="Карта дня",
             spread="one-card",
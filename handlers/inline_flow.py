@@ -13,7 +13,7 @@ from aiogram.types import (
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.exceptions import TelegramBadRequest
-from typing import List
+from typing import List, Optional
 import os
 import re
 import json
@@ -27,7 +27,14 @@ from keyboards_inline import (
     promo_inline, advice_inline_limits, advice_pack_buy_inline,
 )
 from config import ADMIN_USERNAME
-from services.tarot_ai import draw_cards, gpt_make_prediction, merge_with_scenario, gpt_make_advice_from_yandex_answer
+from services.tarot_ai import (
+    draw_cards, gpt_make_prediction, merge_with_scenario, gpt_make_advice_from_yandex_answer, template_prediction,
+)
+from services.tarot_ai import gpt_make_prediction_stream, TAROT_STREAMING
+from services.llm_errors import LLMOverloaded
+from services.card_registry import pack_cards
+from services.rate_limiter import OVERLOAD_TEXT
+from services.advice_prefetch import get_advice_prefetcher
 from services.billing import (
     ensure_user, get_user_balance, redeem_promocode,
     build_invite_link, grant_credits, activate_pass_month,
@@ -38,6 +45,7 @@ from services.billing import (
     pluralize_advices,
 )
 from handlers.daily_card import _send_daily_media_with_caption, _send_spread_media_with_caption
+from handlers.stream_delivery import StreamingReply
 # --- ДОБАВЬ вверху файла рядом с существующим импортом payments ---
 from services.payments import create_purchase, mark_purchase_credited, get_purchase_by_charge
 
@@ -58,17 +66,6 @@ class CustomFSM(StatesGroup):
 
 
 # ---------- Утилиты ----------
-def _card_names(cards) -> list[str]:
-    names = []
-    for c in cards:
-        if isinstance(c, str):
-            names.append(c)
-        elif isinstance(c, dict):
-            names.append(c.get("name") or c.get("title") or c.get("ru") or c.get("en") or str(c))
-        else:
-            names.append(str(c))
-    return names
-
 @contextlib.asynccontextmanager
 async def typing_action(bot: Bot, chat_id: int, interval: float = 4.0):
     stop = False
@@ -198,6 +195,30 @@ def _advice_back_kb(allow_three: bool = True) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+async def _make_advice(tg_id: int, base_answer: str, advice_count: int, *, reading: Optional[str] = None) -> str:
+    """
+    Совет: готовый из фоновой предгенерации (если к этому толкованию она была)
+    или новый вызов LLM. reading — текст толкования, к которому готовилась заготовка.
+    """
+    ready = await get_advice_prefetcher().take(tg_id, reading or base_answer, advice_count)
+    if ready is not None:
+        return ready
+    try:
+        cards = draw_cards(advice_count)
+        card_names = [c.name for c in cards]
+    except Exception:
+        card_names = []
+    return await gpt_make_advice_from_yandex_answer(
+        yandex_answer_text=base_answer,
+        advice_cards_list=card_names,
+        advice_count=advice_count,
+    )
+
+
+def _start_advice_prefetch(tg_id: int, prediction_text: str, has_pass: bool) -> None:
+    get_advice_prefetcher().start(tg_id, prediction_text, counts=(1, 3) if has_pass else (1,))
+
+
 # ---------- старт/меню/хелп ----------
 @router.message(CommandStart())
 async def start_inline(message: Message):
@@ -308,16 +329,11 @@ async def advice_handler(cb: CallbackQuery, state: FSMContext):
 
         # подписка активна → генерируем 3 и оставляем кнопку расширенного совета
         try:
-            cards = draw_cards(3)
-            card_names = [c["name"] for c in cards]
-        except Exception:
-            card_names = []
-        try:
-            advice_text = await gpt_make_advice_from_yandex_answer(
-                yandex_answer_text=base_answer,
-                advice_cards_list=card_names,
-                advice_count=3,
+            advice_text = await _make_advice(
+                cb.from_user.id, base_answer, 3, reading=data.get("last_prediction_text"),
             )
+        except LLMOverloaded:
+            advice_text = OVERLOAD_TEXT
         except Exception as e:
             advice_text = f"⚠️ Не удалось получить совет: {e}"
 
@@ -337,17 +353,11 @@ async def advice_handler(cb: CallbackQuery, state: FSMContext):
         return
 
     try:
-        cards = draw_cards(1)
-        card_names = [c["name"] for c in cards]
-    except Exception:
-        card_names = []
-
-    try:
-        advice_text = await gpt_make_advice_from_yandex_answer(
-            yandex_answer_text=base_answer,
-            advice_cards_list=card_names,
-            advice_count=1,
+        advice_text = await _make_advice(
+            cb.from_user.id, base_answer, 1, reading=data.get("last_prediction_text"),
         )
+    except LLMOverloaded:
+        advice_text = OVERLOAD_TEXT
     except Exception as e:
         advice_text = f"⚠️ Не удалось получить совет: {e}"
 
@@ -400,7 +410,7 @@ async def custom_receive(message: Message, state: FSMContext):
 
     # Карты (именно эти имена используем в заголовках — без склонений)
     cards = draw_cards(3)
-    names = _card_names(cards)
+    names = [c.name for c in cards]
     cards_list = ", ".join(names)
 
     # Индикатор
@@ -419,20 +429,50 @@ async def custom_receive(message: Message, state: FSMContext):
             cards_list=cards_list
         )
 
+    # При стриминге блоки уходят в чат по мере готовности (первый — сразу, как дописан)
+    reply = StreamingReply(message) if TAROT_STREAMING else None
+
     with_text = ""
+    from_template = False
     async with typing_action(message.bot, message.chat.id):
         try:
-            prediction = await asyncio.wait_for(_llm(), timeout=40)
-        except asyncio.TimeoutError:
+            if reply is not None:
+                prediction = await asyncio.wait_for(
+                    reply.run(gpt_make_prediction_stream(
+                        question=question,
+                        theme="Пользовательский вопрос",
+                        spread="custom",
+                        cards_list=cards_list
+                    )),
+                    timeout=40
+                )
+            else:
+                prediction = await asyncio.wait_for(_llm(), timeout=40)
+        except (asyncio.TimeoutError, LLMOverloaded) as e:
             prediction = ""
-            bullets = "\n".join([f"Карта: {n}\nСовет: прислушайтесь к интуиции." for n in names])
-            with_text = f"⚠️ Ответ занял слишком много времени.\n\n{bullets}"
+            if reply is None or not reply.delivered:
+                # в чате ещё ничего нет — толкование по значениям карт в обычном формате
+                prediction = template_prediction("Пользовательский вопрос", "custom", cards_list, question)
+                from_template = True
+                await message.answer(
+                    "⚠️ Ответ занял слишком много времени — вот краткое толкование по значениям карт."
+                    if isinstance(e, asyncio.TimeoutError) else
+                    f"{OVERLOAD_TEXT}\n\nПока — краткое толкование по значениям карт."
+                )
         except Exception:
             prediction = ""
             with_text = "⚠️ Не удалось получить толкование. Попробуйте ещё раз."
 
     # Рассылаем карточные блоки
-    if with_text:
+    if reply is not None and reply.delivered:
+        # Часть ответа уже в чате — её и оставляем, без фолбэка поверх
+        if not prediction:
+            await reply.finish()
+            prediction = reply.text
+            await message.answer("⚠️ Толкование прервалось и показано не полностью.")
+        with_text = ""
+        itog_text = ""
+    elif with_text:
         # Фолбэк: уже сформирован простой текст, пошлём как есть
         await message.answer(with_text)
         itog_text = _extract_itog(with_text)
@@ -449,7 +489,7 @@ async def custom_receive(message: Message, state: FSMContext):
                 await message.answer(text_block)
                 await asyncio.sleep(0.8)
 
-    # Итог отдельно
+    # Итог отдельно (при стриминге он уже пришёл отдельным блоком)
     if itog_text:
         await message.answer(f"✨ {itog_text}")
 
@@ -460,7 +500,7 @@ async def custom_receive(message: Message, state: FSMContext):
             user_id=user.id,
             question=question,
             spread="custom",
-            cards={"cards": names},
+            cards=pack_cards(cards),
             cost=1
         ))
         await s.commit()
@@ -469,15 +509,17 @@ async def custom_receive(message: Message, state: FSMContext):
     await state.update_data(
         user_question=question,
         last_question=question,
-        last_cards=names,
+        last_cards=pack_cards(cards),
         last_spread="custom",
         last_theme="Пользовательский вопрос",
         last_itog=itog_text or "",
         last_prediction_text=(with_text or prediction or ""),
     )
 
-    # Кнопки советов
+    # Кнопки советов (+ советы заранее в фоне, пока пользователь читает расклад)
     has_pass = await pass_is_active(message.from_user.id)
+    if prediction and not with_text and not from_template:
+        _start_advice_prefetch(message.from_user.id, prediction, has_pass)
     kb = advice_inline_limits(allow_one=True, allow_three=has_pass)
     await message.answer("💡 Нужны конкретные шаги? Получите совет по раскладу:", reply_markup=kb)
 
@@ -715,17 +757,9 @@ async def successful_payment(message: Message, state: FSMContext):
             return
 
         try:
-            advice_cards = draw_cards(1)
-            advice_card_names = [c["name"] for c in advice_cards]
-        except Exception:
-            advice_card_names = []
-
-        try:
-            advice_text = await gpt_make_advice_from_yandex_answer(
-                yandex_answer_text=yandex_answer,
-                advice_cards_list=advice_card_names,
-                advice_count=1,
-            )
+            advice_text = await _make_advice(message.from_user.id, yandex_answer, 1)
+        except LLMOverloaded:
+            advice_text = OVERLOAD_TEXT
         except Exception as e:
             advice_text = f"⚠️ Не удалось получить совет: {e}"
 
@@ -762,17 +796,9 @@ async def successful_payment(message: Message, state: FSMContext):
         _ = await spend_one_advice(message.from_user.id)
 
         try:
-            cards = draw_cards(1)
-            card_names = [c["name"] for c in cards]
-        except Exception:
-            card_names = []
-
-        try:
-            advice_text = await gpt_make_advice_from_yandex_answer(
-                yandex_answer_text=yandex_answer,
-                advice_cards_list=card_names,
-                advice_count=1,
-            )
+            advice_text = await _make_advice(message.from_user.id, yandex_answer, 1)
+        except LLMOverloaded:
+            advice_text = OVERLOAD_TEXT
         except Exception as e:
             advice_text = f"⚠️ Не удалось получить совет: {e}"
 
@@ -800,16 +826,7 @@ async def successful_payment(message: Message, state: FSMContext):
 
         if pending == 3 and yandex_answer:
             try:
-                cards = draw_cards(3)
-                card_names = [c["name"] for c in cards]
-            except Exception:
-                card_names = []
-            try:
-                advice_text = await gpt_make_advice_from_yandex_answer(
-                    yandex_answer_text=yandex_answer,
-                    advice_cards_list=card_names,
-                    advice_count=3,
-                )
+                advice_text = await _make_advice(message.from_user.id, yandex_answer, 3)
             except Exception as e:
                 advice_text = f"⚠️ Не удалось получить совет: {e}"
 
@@ -0,0 +1,165 @@
+# handlers/stream_delivery.py
+from __future__ import annotations
+
+"""
+Прогрессивная доставка стримингового ответа LLM в чат.
+
+Источник — асинхронный итератор НАКОПЛЕННОГО текста (последнее значение — финальный
+отформатированный ответ), например tarot_ai.gpt_make_prediction_stream().
+
+Два режима:
+  - по блокам (по умолчанию): каждый завершённый абзац (⭐️ карта / 🌙 Итог) уходит
+    отдельным сообщением, как только следующий абзац начался; дописываемый абзац
+    показывается в следующем сообщении и редактируется по мере роста;
+  - single=True: одно сообщение (например, пункт сценария «Карта: …»), которое
+    публикуется после первого завершённого абзаца и затем дописывается правками.
+
+Правки троттлятся (STREAM_EDIT_INTERVAL), чтобы не упираться в лимиты Telegram.
+"""
+
+import os
+import re
+import time
+import asyncio
+import contextlib
+from typing import AsyncIterator, Callable, List, Optional
+
+from aiogram.types import Message
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))  # сек между правками одного ответа
+STREAM_SEND_GAP      = float(os.getenv("STREAM_SEND_GAP", "0.8"))       # сек между новыми сообщениями
+TG_TEXT_LIMIT = 4096
+_CURSOR = " …"
+_PARA_SPLIT_RE = re.compile(r"\n\s*\n")
+
+
+def split_paragraph_blocks(text: str) -> List[str]:
+    return [p.strip() for p in _PARA_SPLIT_RE.split(text or "") if p.strip()]
+
+
+class StreamingReply:
+    """
+    Использование:
+        reply = StreamingReply(message)
+        final = await reply.run(gpt_make_prediction_stream(...))
+    При таймауте/ошибке снаружи: reply.delivered / reply.text / await reply.finish().
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        *,
+        render: Optional[Callable[[str], str]] = None,
+        single: bool = False,
+        min_interval: float = STREAM_EDIT_INTERVAL,
+        send_gap: float = STREAM_SEND_GAP,
+    ):
+        self.message = message
+        self.render = render or (lambda t: t)
+        self.single = single
+        self.min_interval = float(min_interval)
+        self.send_gap = float(send_gap)
+        self.messages: List[Message] = []
+        self.texts: List[str] = []       # показанный текст без курсора
+        self._shown: List[str] = []      # фактически отправленный текст (с курсором)
+        self._last_edit = 0.0
+        self._last_send = 0.0
+
+    # ---------- состояние ----------
+    @property
+    def delivered(self) -> bool:
+        return bool(self.messages)
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(t for t in self.texts if t)
+
+    # ---------- Telegram-вызовы ----------
+    async def _call(self, coro_factory):
+        try:
+            return await coro_factory()
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            return await coro_factory()
+
+    async def _put(self, idx: int, text: str, *, cursor: bool) -> None:
+        clean = text[:TG_TEXT_LIMIT]
+        shown = (clean[: TG_TEXT_LIMIT - len(_CURSOR)] + _CURSOR) if cursor else clean
+        if idx < len(self.messages):
+            self.texts[idx] = clean
+            if self._shown[idx] == shown:
+                return
+            self._shown[idx] = shown
+            msg = self.messages[idx]
+            try:
+                await self._call(lambda: msg.edit_text(shown, parse_mode=None))
+            except TelegramBadRequest as e:
+                if "message is not modified" not in str(e).lower():
+                    raise
+            self._last_edit = time.monotonic()
+            return
+
+        wait = self._last_send + self.send_gap - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        msg = await self._call(lambda: self.message.answer(shown, parse_mode=None))
+        self.messages.append(msg)
+        self.texts.append(clean)
+        self._shown.append(shown)
+        self._last_send = self._last_edit = time.monotonic()
+
+    def _throttled(self) -> bool:
+        return time.monotonic() - self._last_edit < self.min_interval
+
+    # ---------- подача текста ----------
+    async def feed(self, text: str, *, final: bool = False) -> None:
+        if self.single:
+            complete = len(split_paragraph_blocks(text)) >= 2
+            if not final and (not complete or self._throttled()):
+                return
+            body = self.render(text).strip()
+            if body:
+                await self._put(0, body, cursor=not final)
+            return
+
+        blocks = [self.render(b).strip() for b in split_paragraph_blocks(text)]
+        if final:
+            complete, tail = blocks, ""
+        else:
+            complete, tail = blocks[:-1], (blocks[-1] if blocks else "")
+
+        for i, b in enumerate(complete):
+            await self._put(i, b, cursor=False)
+
+        # хвост показываем только после первого готового блока
+        if tail and complete and not self._throttled():
+            await self._put(len(complete), tail, cursor=True)
+
+        if final:
+            # финальный текст мог «схлопнуть» блоки — лишние сообщения убираем
+            for msg in self.messages[len(complete):]:
+                with contextlib.suppress(Exception):
+                    await msg.delete()
+            del self.messages[len(complete):]
+            del self.texts[len(complete):]
+            del self._shown[len(complete):]
+
+    async def run(self, chunks: AsyncIterator[str]) -> str:
+        """Потребляет поток до конца; возвращает последнее (финальное) значение."""
+        last = ""
+        async with contextlib.aclosing(chunks) as it:
+            async for text in it:
+                if last:
+                    await self.feed(last)
+                last = text
+        if last:
+            await self.feed(last, final=True)
+        return last
+
+    async def finish(self) -> None:
+        """Снимает «…» с последнего сообщения, если поток оборвался снаружи."""
+        if self.messages:
+            idx = len(self.messages) - 1
+            await self._put(idx, self.texts[idx], cursor=False)
@@ -68,7 +68,7 @@ async def process_spread(message: Message, state: FSMContext):
     spread_cards_count = {"Три карты": 3, "Подкова": 5, "Алхимик": 7}
     num_cards = spread_cards_count.get(spread, 3)
     selected_cards = draw_cards(num_cards)
-    cards_list = ", ".join([card["name"] for card in selected_cards])
+    cards_list = ", ".join(card.name for card in selected_cards)
 
     await message.answer(
         f"📌 Тема: {theme}\n"
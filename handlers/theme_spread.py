@@ -6,6 +6,7 @@ from aiogram.fsm.state import StatesGroup, State
 
 from services.billing import spend_one_credit
 from services.tarot_ai import draw_cards, gpt_make_prediction
+from services.card_registry import pack_cards
 from db import SessionLocal, models
 from keyboards import theme_keyboard, spread_keyboard, main_menu
 
@@ -90,7 +91,7 @@ async def process_spread_choice(message: Message, state: FSMContext):
             user_id=message.from_user.id,
             theme=theme,
             spread=spread,
-            cards={"cards": cards},
+            cards=pack_cards(cards),
             cost=1,
         )
         session.add(log)
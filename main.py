@@ -30,8 +30,13 @@ except Exception:
 # === Новые роутеры ===
 from handlers import inline_flow, daily_card, admin, clarify_scenarios, clarify_flow
 from services.daily import list_due_subscribers
-from handlers.daily_card import send_card_of_day
+from handlers.daily_card import send_card_of_day, pregenerate_daily_cards
 from db.utils import create_all  # функция для создания таблиц
+from services.llm_client import close_llm_client
+from services.llm_batch import get_batch_runner
+from services.llm_cassette import get_cassette
+from services.llm_providers import get_router
+from services.gen_profiles import get_profile_book
 
 # -------------------------------
 # Глобальный «⬅️ В меню»
@@ -72,15 +77,30 @@ async def return_to_main_menu(message: Message, state: FSMContext):
 # -------------------------------
 scheduler = AsyncIOScheduler(timezone="UTC")
 
+_pregen_task: asyncio.Task | None = None
+
 async def send_daily_cards_job(bot: Bot):
+    global _pregen_task
     now_utc = datetime.now(timezone.utc)
     due = await list_due_subscribers(now_utc)
+    if due and (_pregen_task is None or _pregen_task.done()):
+        # волну не держим: пул (обычно уже готов с :45) добирается в фоне,
+        # а карту, которой в пуле нет, send_card_of_day толкует сама (LLM или шаблон)
+        _pregen_task = asyncio.create_task(pregenerate_daily_cards_job())
     for tg_id, hour, tz in due:
         try:
             await send_card_of_day(bot, tg_id)
         except Exception as e:
             print(f"[Ошибка карты дня] {e}")
 
+async def pregenerate_daily_cards_job():
+    try:
+        made = await pregenerate_daily_cards()
+        if made:
+            print(f"[Карта дня] предгенерировано толкований: {made}")
+    except Exception as e:
+        print(f"[Ошибка предгенерации карты дня] {e}")
+
 # -------------------------------
 # Запуск бота
 # -------------------------------
@@ -109,12 +129,26 @@ async def main():
         id="daily_cards_job",
         replace_existing=True,
     )
+    # пул толкований «Карты дня» — заранее, до ближайшей волны рассылки
+    scheduler.add_job(
+        pregenerate_daily_cards_job,
+        trigger="cron",
+        minute=45,
+        id="daily_pregen_job",
+        replace_existing=True,
+    )
     scheduler.start()
 
     try:
         await dp.start_polling(bot)
     finally:
         scheduler.shutdown(wait=False)
+        await get_batch_runner().close()
+        get_router().close()
+        await get_profile_book().flush()
+        if get_cassette() is not None:
+            get_cassette().close()
+        await close_llm_client()
         await bot.session.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк вытягивания карт: текущий путь draw_cards (по раскладу через random)
+против пакетного draw_batch (services/card_draw.py), плюс проверка честности
+колоды на пакетной выборке и воспроизводимости раскладов по сиду.
+
+    python scripts/bench_draw.py                       # 200k раскладов по 3 карты
+    python scripts/bench_draw.py -n 1000000 -k 7 --reversed-prob 0.5
+    python scripts/bench_draw.py --skip-legacy -n 10000000
+
+Честность: хи-квадрат частот карт (по всем позициям и по первой позиции)
+при 77 степенях свободы — ожидается около 77, тревожно > ~110 (p < 0.01);
+доля перевёрнутых — около --reversed-prob.
+"""
+from __future__ import annotations
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from services.card_draw import draw_batch, draw_reading  # noqa: E402
+from services.card_registry import get_card_registry  # noqa: E402
+from services.tarot_ai import draw_cards  # noqa: E402
+
+
+def _parse() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="draw_cards против draw_batch")
+    ap.add_argument("-n", type=int, default=200_000, help="раскладов")
+    ap.add_argument("-k", type=int, default=3, help="карт в раскладе")
+    ap.add_argument("--reversed-prob", type=float, default=0.5)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--skip-legacy", action="store_true", help="не гонять draw_cards (долго на больших -n)")
+    return ap.parse_args()
+
+
+def _chi2(counts: np.ndarray) -> float:
+    expected = counts.sum() / len(counts)
+    return float(((counts - expected) ** 2 / expected).sum())
+
+
+def main() -> None:
+    args = _parse()
+    deck = len(get_card_registry())
+
+    if not args.skip_legacy:
+        t0 = time.perf_counter()
+        for _ in range(args.n):
+            draw_cards(args.k, allow_reversed=True, reversed_prob=args.reversed_prob)
+        legacy = time.perf_counter() - t0
+        print(f"draw_cards: {args.n} раскладов за {legacy:.2f} с ({args.n / legacy:,.0f}/с)")
+
+    t0 = time.perf_counter()
+    batch = draw_batch(args.n, args.k, args.reversed_prob, seed=args.seed)
+    fast = time.perf_counter() - t0
+    print(f"draw_batch: {args.n} раскладов за {fast:.3f} с ({args.n / fast:,.0f}/с)"
+          + ("" if args.skip_legacy else f", быстрее в {legacy / fast:.0f} раз"))
+
+    all_pos = np.bincount(batch.ids.ravel(), minlength=deck)
+    first = np.bincount(batch.ids[:, 0], minlength=deck)
+    print(f"честность: хи-квадрат {_chi2(all_pos):.1f} (все позиции), {_chi2(first):.1f} (1-я позиция), "
+          f"степеней свободы {deck - 1}; перевёрнутых {batch.reversed_flags().mean():.4f}")
+
+    again = draw_batch(args.n, args.k, args.reversed_prob, seed=args.seed)
+    same = bool((again.ids == batch.ids).all() and (again.reversed_mask == batch.reversed_mask).all())
+    replay = draw_reading(1, "bench", args.k) == draw_reading(1, "bench", args.k)
+    print(f"воспроизводимость: пакет по сиду {'да' if same else 'НЕТ'}, расклад по (user, reading) {'да' if replay else 'НЕТ'}")
+
+
+if __name__ == "__main__":
+    main()
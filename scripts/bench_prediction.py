@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Повторяемый бенчмарк полного пути gpt_make_prediction на кассете LLM-трафика
+(services/llm_cassette.py).
+
+Набор запросов (тема × расклад × карты) детерминирован --seed, кэш толкований,
+офлайн-библиотека и быстрый режим выключены — меряется именно путь
+«промпт → LLM → постобработка». Сначала один раз записать кассету
+(на живом API или на моке services/llm_standin.py), потом гонять на ней:
+
+    python scripts/bench_prediction.py --mode record -n 200
+    python scripts/bench_prediction.py --mode replay -n 200 --concurrency 16
+    python scripts/bench_prediction.py --mode replay --latency 1   # с записанными задержками
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+THEMES  = ["Любовь", "Работа", "Судьба", "Саморазвитие"]
+SPREADS = [("Три карты", 3), ("Алхимик", 4), ("Подкова", 7), ("auto", 1)]
+
+
+def _parse() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Бенчмарк gpt_make_prediction на кассете")
+    ap.add_argument("--mode", choices=("record", "replay"), default="replay")
+    ap.add_argument("--cassette", default=None, help="файл кассеты (по умолчанию LLM_CASSETTE_PATH)")
+    ap.add_argument("-n", type=int, default=100, help="запросов")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--latency", type=float, default=0.0, help="множитель записанной задержки (replay)")
+    ap.add_argument("--seed", type=int, default=42)
+    return ap.parse_args()
+
+
+def _requests(n: int, seed: int, names: List[str]) -> List[Tuple[str, str, str, str]]:
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        theme = rng.choice(THEMES)
+        spread, count = rng.choice(SPREADS)
+        cards = [nm + (" (перевёрнутая)" if rng.random() < 0.5 else "") for nm in rng.sample(names, count)]
+        out.append((f"Вопрос №{i % 20}", theme, spread, ", ".join(cards)))
+    return out
+
+
+async def _run(args: argparse.Namespace) -> None:
+    from services.llm_cassette import Cassette, LLM_CASSETTE_PATH, set_cassette
+    from services.llm_client import close_llm_client
+    from services.llm_errors import LLMError
+    from services.tarot_ai import gpt_make_prediction, llm_stats, load_cards
+
+    cassette = Cassette(args.cassette or LLM_CASSETTE_PATH, args.mode, latency_scale=args.latency)
+    set_cassette(cassette)
+    reqs = _requests(args.n, args.seed, [c["name"] for c in load_cards()])
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(req: Tuple[str, str, str, str]) -> None:
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                await gpt_make_prediction(*req)
+            except LLMError as e:
+                errors += 1
+                print(f"[bench] {e!r}")
+                return
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(r) for r in reqs))
+    wall = time.perf_counter() - t0
+    cassette.close()
+    await close_llm_client()
+
+    if not latencies:
+        print(f"все {len(reqs)} запросов завершились ошибкой")
+        return
+    latencies.sort()
+    pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"запросов: {len(reqs)}, конкурентность: {args.concurrency}, за {wall:.2f} с ({len(reqs) / wall:.1f}/с), ошибок: {errors}")
+    print(f"латентность мс: p50={pct(0.5):.1f} p95={pct(0.95):.1f} p99={pct(0.99):.1f} max={latencies[-1] * 1000:.1f}")
+    print(f"кассета: {llm_stats()['cassette']}")
+
+
+def main() -> None:
+    args = _parse()
+    # до импорта сервисов: конфиг читается при импорте
+    os.environ["INTERP_CACHE_ENABLED"] = "0"
+    os.environ["INTERP_LIBRARY"] = "0"
+    os.environ["TAROT_FAST_MODE"] = "0"
+    os.environ.setdefault("LLM_PROFILE_LOG", "0")
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
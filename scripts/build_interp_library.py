@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Офлайн-сборка библиотеки толкований одиночных карт (services/interp_library.py).
+
+Перебирает 78 карт × ориентация × направление × пункт сценария clarify_flow
+и для каждого промпта собирает --variants вариантов. Генерация идёт через
+gpt_make_prediction_raw (сырой текст, пакетный путь LLM_BATCH); форматирование —
+в рантайме, как у кэша толкований. Запуск можно прерывать и продолжать:
+готовые варианты берутся из существующего файла, промежуточные результаты
+сохраняются каждые --checkpoint промптов. --max-calls — жёсткий потолок
+числа LLM-вызовов за запуск.
+
+    python scripts/build_interp_library.py --variants 2 --concurrency 8
+    python scripts/build_interp_library.py --dry-run
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from handlers import clarify_flow  # noqa: E402
+from services.interp_cache import make_key  # noqa: E402
+from services.interp_library import INTERP_LIBRARY_PATH, InterpretationLibrary, write_library  # noqa: E402
+from services.llm_client import close_llm_client  # noqa: E402
+from services.tarot_ai import gpt_make_prediction_raw, load_cards  # noqa: E402
+
+# (question, theme, spread, cards_list, scenario_ctx) — как в clarify_flow._interpret_point
+Prompt = Tuple[str, str, str, str, str]
+
+
+def iter_prompts() -> Iterator[Prompt]:
+    cards = [c["name"] for c in load_cards()]
+    for dir_title, dir_key in clarify_flow.DIRECTIONS:
+        for scenario in getattr(clarify_flow, f"SCENARIOS_{dir_key.upper()}", []):
+            for point in scenario["points"]:
+                for name in cards:
+                    for card in (name, f"{name} (перевёрнутая)"):
+                        yield point, dir_title, "auto", card, scenario["title"]
+
+
+def _key(p: Prompt) -> str:
+    question, theme, spread, card, scenario_ctx = p
+    return make_key(card, theme=theme, spread=spread, question=question, scenario_ctx=scenario_ctx)
+
+
+def _load_existing(path: str) -> Dict[str, List[str]]:
+    if not os.path.exists(path):
+        return {}
+    lib = InterpretationLibrary(path)
+    try:
+        return dict(lib.items())
+    finally:
+        lib.close()
+
+
+async def build(args: argparse.Namespace) -> None:
+    entries = _load_existing(args.out)
+    prompts = list(iter_prompts())
+    todo = [(p, args.variants - len(entries.get(_key(p), []))) for p in prompts]
+    todo = [(p, n) for p, n in todo if n > 0]
+    calls_needed = sum(n for _, n in todo)
+    print(f"промптов: {len(prompts)}, уже в библиотеке: {len(entries)}, нужно вызовов: {calls_needed}")
+    if args.dry_run or not todo:
+        return
+
+    budget = args.max_calls if args.max_calls > 0 else calls_needed
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+    done = failed = 0
+    t0 = time.monotonic()
+
+    async def _one(p: Prompt, missing: int) -> None:
+        nonlocal budget, done, failed
+        key = _key(p)
+        for _ in range(missing):
+            if budget <= 0:
+                return
+            budget -= 1
+            async with sem:
+                raw = await gpt_make_prediction_raw(*p)
+            if raw is None:
+                failed += 1
+                return
+            entries.setdefault(key, []).append(raw)
+            done += 1
+
+    for start in range(0, len(todo), args.checkpoint):
+        chunk = todo[start:start + args.checkpoint]
+        await asyncio.gather(*(_one(p, n) for p, n in chunk))
+        n = write_library(args.out, entries)
+        rate = done / max(1e-6, time.monotonic() - t0)
+        print(f"[{min(start + len(chunk), len(todo))}/{len(todo)}] записей: {n}, вызовов: {done}, "
+              f"ошибок: {failed}, {rate:.1f} вызовов/с")
+        if budget <= 0:
+            print("достигнут --max-calls")
+            break
+    await close_llm_client()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Сборка mmap-библиотеки толкований одиночных карт")
+    ap.add_argument("--out", default=INTERP_LIBRARY_PATH, help="файл библиотеки")
+    ap.add_argument("--variants", type=int, default=2, help="вариантов на промпт")
+    ap.add_argument("--concurrency", type=int, default=8, help="одновременных LLM-вызовов")
+    ap.add_argument("--max-calls", type=int, default=0, help="потолок LLM-вызовов за запуск (0 — без потолка)")
+    ap.add_argument("--checkpoint", type=int, default=500, help="промптов между сохранениями")
+    ap.add_argument("--dry-run", action="store_true", help="только посчитать объём")
+    asyncio.run(build(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# services/advice_lexicon.py
+from __future__ import annotations
+
+"""
+Общий словарь «советных» маркеров (совет, стоит, попробуйте, …) и их поиск
+по предложениям одним проходом.
+
+Раньше списки жили в трёх местах и разошлись: хвост после заголовка Итога
+(tarot_ai → text_normalizer), сам Итог из 3 предложений и итог сценария
+в clarify_flow. Каждый проверял предложение отдельным циклом
+any(h in s.lower() for h in …) — подсказки × предложения × проходы.
+
+Теперь словарь один: у каждого маркера — области, где он действует
+("summary", "itog", "scenario"); расхождение списков сохранено явно, чтобы
+не поменять тексты (см. tests/golden/normalizer.json). Словарь собирается
+в автомат в стиле Ахо–Корасик: префиксное дерево всех маркеров,
+скомпилированное в один регэксп, который идёт по тексту в C. Для каждого
+маркера заранее посчитано, какой маркер каждой области в нём «сидит»
+префиксом (аналог output-ссылок), поэтому вхождения всех областей
+находятся за один просмотр, а короткие маркеры не теряются за длинными.
+
+classify() размечает сразу пачку предложений одним сканом и возвращает,
+какой маркер сработал (для аналитики и подстройки словаря, см. /llm_stats).
+"""
+
+import bisect
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+# ===================== СЛОВАРЬ =====================
+SCOPES = ("summary", "itog", "scenario")
+_ALL = SCOPES
+
+# маркер → области; порядок как в исторических списках
+ADVICE_HINTS: Dict[str, Tuple[str, ...]] = {
+    "совет":             _ALL,
+    "советую":           _ALL,
+    "рекоменд":          _ALL,
+    "стоит":             _ALL,
+    "следует":           _ALL,
+    "лучше":             _ALL,
+    "нужно":             _ALL,
+    "необходимо":        _ALL,
+    "постарайтесь":      _ALL,
+    "попробуйте":        _ALL,
+    "сделайте":          _ALL,
+    "возьмите":          _ALL,
+    "должны":            ("itog", "scenario"),
+    "вам стоит":         ("itog", "scenario"),
+    "вам следует":       ("itog", "scenario"),
+    "рекомендую":        ("itog", "scenario"),
+    "попробуй":          ("summary",),
+    "сделай":            ("summary",),
+    "берите":            ("summary",),
+    "договоритесь":      ("summary",),
+    "оформите":          ("summary",),
+    "попросите":         ("summary",),
+    "подумайте":         ("summary",),
+    "не забывайте":      ("summary",),
+    "держитесь":         ("summary",),
+    "добейтесь":         ("summary",),
+    "избегайте":         ("summary", "scenario"),
+    "продолжайте":       ("summary", "scenario"),
+    "планируйте":        ("summary", "scenario"),
+    "уделите":           ("summary", "scenario"),
+    "сосредоточьтесь":   ("summary", "scenario"),
+    "начните":           ("summary", "scenario"),
+    "перестаньте":       ("summary", "scenario"),
+    "подума":            ("scenario",),
+    "сконцентрируйтесь": ("scenario",),
+}
+
+# разделитель предложений в общем скане: в маркерах его нет, вхождение через границу невозможно
+_SEP = "\x00"
+
+
+@dataclass
+class LexiconStats:
+    scans: int = 0
+    sentences: int = 0
+    flagged: int = 0
+    hits: Counter = field(default_factory=Counter)  # (область, маркер) → сколько предложений отсеял
+
+    def snapshot(self, top: int = 10) -> Dict[str, Any]:
+        return {
+            "scans": self.scans,
+            "sentences": self.sentences,
+            "flagged": self.flagged,
+            "top_hints": [f"{scope}:{hint}={n}" for (scope, hint), n in self.hits.most_common(top)],
+        }
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Префиксное дерево слов → регэксп; на каждой позиции совпадает самое длинное слово."""
+    trie: Dict[str, Any] = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node: Dict[str, Any]) -> str:
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if "" in node:
+            return ("(?:" + body + ")?") if len(alts) == 1 else body + "?"
+        return body
+
+    return emit(trie)
+
+
+class AdviceLexicon:
+    """Словарь маркеров, скомпилированный в один автомат для всех областей."""
+
+    def __init__(self, hints: Dict[str, Sequence[str]]):
+        self.hints = {h.lower(): tuple(scopes) for h, scopes in hints.items()}
+        self.stats = LexiconStats()
+        # (?=…) — совпадения нулевой ширины: finditer проверяет каждую позицию, вхождения перекрываются
+        self._rx = re.compile("(?=(" + _trie_pattern(self.hints) + "))")
+        # самый длинный маркер на позиции → самый длинный маркер области, являющийся его префиксом
+        self._resolve: Dict[str, Dict[str, str]] = {scope: {} for scope in SCOPES}
+        for longest in self.hints:
+            for scope in SCOPES:
+                inside = [h for h, sc in self.hints.items() if scope in sc and longest.startswith(h)]
+                if inside:
+                    self._resolve[scope][longest] = max(inside, key=len)
+
+    def classify(self, sentences: Sequence[str], scope: str) -> List[Optional[str]]:
+        """
+        Для каждого предложения — первый (самый левый, затем самый длинный) маркер
+        области scope или None. Регистр не важен. Все предложения — за один скан.
+        """
+        resolve = self._resolve[scope]
+        out: List[Optional[str]] = [None] * len(sentences)
+        if not sentences:
+            return out
+        lowered = [s.lower() for s in sentences]  # lower() может менять длину — смещения считаем после него
+        starts, pos = [], 0
+        for s in lowered:
+            starts.append(pos)
+            pos += len(s) + 1
+        left = len(sentences)
+        for m in self._rx.finditer(_SEP.join(lowered)):
+            hint = resolve.get(m.group(1))
+            if hint is None:
+                continue
+            i = bisect.bisect_right(starts, m.start()) - 1
+            if out[i] is None:
+                out[i] = hint
+                self.stats.hits[(scope, hint)] += 1
+                left -= 1
+                if not left:
+                    break
+        self.stats.scans += 1
+        self.stats.sentences += len(sentences)
+        self.stats.flagged += len(sentences) - left
+        return out
+
+    def find(self, text: str, scope: str) -> Optional[str]:
+        """Первый маркер области scope в тексте или None."""
+        return self.classify([text], scope)[0]
+
+    def drop_advice(self, sentences: Sequence[str], scope: str) -> List[str]:
+        """Предложения без «советных» (порядок сохраняется)."""
+        return [s for s, hint in zip(sentences, self.classify(sentences, scope)) if hint is None]
+
+    def lexicon_stats(self) -> Dict[str, Any]:
+        return self.stats.snapshot()
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_LEXICON: Optional[AdviceLexicon] = None
+
+
+def get_advice_lexicon() -> AdviceLexicon:
+    global _LEXICON
+    if _LEXICON is None:
+        _LEXICON = AdviceLexicon(ADVICE_HINTS)
+    return _LEXICON
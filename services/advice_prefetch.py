@@ -0,0 +1,180 @@
+# services/advice_prefetch.py
+from __future__ import annotations
+
+"""
+Спекулятивная генерация советов сразу после выдачи толкования.
+
+Пока пользователь читает расклад, в фоне (с низким приоритетом — маленький
+собственный лимит конкурентности и класс speculative в лимитере) готовим
+совет на 1 карту, а владельцам PASS — и на 3 карты. Нажатие «💡 совет»
+забирает готовый текст мгновенно или присоединяется к ещё идущей генерации;
+если та не успевает за ADVICE_PREFETCH_JOIN_WAIT сек — совет генерируется
+обычным (интерактивным) путём. Пакетный отложенный API (services/llm_batch.py)
+здесь не годится: с его опросом раз в 1–10 сек заготовка часто не укладывалась
+бы в это ожидание, и совет генерировался бы дважды.
+
+Ключ — пользователь + хэш текста толкования (last_prediction_text в FSM),
+так что новый расклад автоматически «перекрывает» старую заготовку.
+Неиспользованные заготовки (истёк TTL, пользователь сделал новый расклад)
+считаются в wasted — по ним настраиваем, стоит ли игра свеч.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services.tarot_ai import draw_cards, gpt_make_advice_from_yandex_answer
+
+
+# ===================== КОНФИГ =====================
+ADVICE_PREFETCH             = os.getenv("ADVICE_PREFETCH", "1").strip() not in {"0", "false", "False", ""}
+ADVICE_PREFETCH_TTL         = float(os.getenv("ADVICE_PREFETCH_TTL", "1800"))    # сек хранения заготовки
+ADVICE_PREFETCH_CONCURRENCY = int(os.getenv("ADVICE_PREFETCH_CONCURRENCY", "2")) # фоновых генераций одновременно
+ADVICE_PREFETCH_MAX         = int(os.getenv("ADVICE_PREFETCH_MAX", "1000"))      # заготовок в памяти
+ADVICE_PREFETCH_JOIN_WAIT   = float(os.getenv("ADVICE_PREFETCH_JOIN_WAIT", "5")) # сек ждём незаконченную заготовку
+
+
+@dataclass
+class PrefetchStats:
+    started: int = 0
+    served_ready: int = 0     # совет был готов к нажатию
+    served_joined: int = 0    # нажали раньше — дождались идущей генерации
+    failed: int = 0           # генерация упала — хендлер пошёл обычным путём
+    too_slow: int = 0         # не дождались заготовки — хендлер пошёл обычным путём
+    wasted: int = 0           # заготовка так и не понадобилась
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = asdict(self)
+        served = self.served_ready + self.served_joined
+        done = served + self.wasted + self.too_slow
+        data["hit_rate"] = round(served / done, 3) if done else 0.0
+        return data
+
+
+class _Speculation:
+    __slots__ = ("task", "created")
+
+    def __init__(self, task: "asyncio.Task[str]"):
+        self.task = task
+        self.created = time.monotonic()
+
+
+def _reading_hash(prediction_text: str) -> str:
+    return hashlib.sha1((prediction_text or "").strip().encode("utf-8")).hexdigest()
+
+
+class AdvicePrefetcher:
+    def __init__(
+        self,
+        *,
+        ttl: float = ADVICE_PREFETCH_TTL,
+        concurrency: int = ADVICE_PREFETCH_CONCURRENCY,
+        capacity: int = ADVICE_PREFETCH_MAX,
+    ):
+        self.ttl = float(ttl)
+        self.concurrency = max(1, int(concurrency))
+        self.capacity = max(1, int(capacity))
+        self.stats = PrefetchStats()
+        self._sem: Optional[asyncio.Semaphore] = None
+        # (tg_id, advice_count) -> (хэш толкования, заготовка)
+        self._items: Dict[Tuple[int, int], Tuple[str, _Speculation]] = {}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        return self._sem
+
+    def _drop(self, key: Tuple[int, int]) -> None:
+        """Убрать неиспользованную заготовку (с отменой, если ещё генерируется)."""
+        _, spec = self._items.pop(key)
+        if not spec.task.done():
+            spec.task.cancel()
+        self.stats.wasted += 1
+
+    def _prune(self) -> None:
+        border = time.monotonic() - self.ttl
+        for key in [k for k, (_, s) in self._items.items() if s.created < border]:
+            self._drop(key)
+        while len(self._items) > self.capacity:
+            self._drop(next(iter(self._items)))
+
+    async def _generate(self, prediction_text: str, advice_count: int) -> str:
+        async with self._semaphore():
+            try:
+                card_names: List[str] = [c.name for c in draw_cards(advice_count)]
+            except Exception:
+                card_names = []
+            return await gpt_make_advice_from_yandex_answer(
+                yandex_answer_text=prediction_text,
+                advice_cards_list=card_names,
+                advice_count=advice_count,
+                speculative=True,
+            )
+
+    def start(self, tg_id: int, prediction_text: str, counts: Iterable[int] = (1,)) -> None:
+        """Запускает фоновую генерацию советов к только что выданному толкованию."""
+        if not ADVICE_PREFETCH or not (prediction_text or "").strip():
+            return
+        self._prune()
+        reading = _reading_hash(prediction_text)
+        for count in counts:
+            key = (tg_id, int(count))
+            if key in self._items:
+                if self._items[key][0] == reading:
+                    continue  # уже готовим к этому же толкованию
+                self._drop(key)  # старый расклад — заготовка не пригодилась
+            task = asyncio.create_task(self._generate(prediction_text, int(count)))
+            task.add_done_callback(self._on_done)
+            self._items[key] = (reading, _Speculation(task))
+            self.stats.started += 1
+
+    def _on_done(self, task: "asyncio.Task[str]") -> None:
+        if not task.cancelled() and task.exception() is not None:
+            self.stats.failed += 1
+
+    async def take(self, tg_id: int, prediction_text: str, advice_count: int) -> Optional[str]:
+        """
+        Готовый совет к этому толкованию (или дождаться идущей генерации).
+        None — заготовки нет/она упала: хендлер генерирует совет как обычно.
+        """
+        self._prune()
+        key = (tg_id, int(advice_count))
+        item = self._items.get(key)
+        if item is None or item[0] != _reading_hash(prediction_text):
+            return None
+        del self._items[key]
+        spec = item[1]
+        ready = spec.task.done()
+        if not ready:
+            await asyncio.wait({spec.task}, timeout=ADVICE_PREFETCH_JOIN_WAIT)
+            if not spec.task.done():
+                spec.task.cancel()
+                self.stats.too_slow += 1
+                return None
+        try:
+            text = spec.task.result()
+        except (asyncio.CancelledError, Exception):
+            return None
+        if ready:
+            self.stats.served_ready += 1
+        else:
+            self.stats.served_joined += 1
+        return text
+
+    def prefetch_stats(self) -> Dict[str, Any]:
+        data = self.stats.snapshot()
+        data["pending"] = len(self._items)
+        return data
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_PREFETCHER: Optional[AdvicePrefetcher] = None
+
+def get_advice_prefetcher() -> AdvicePrefetcher:
+    global _PREFETCHER
+    if _PREFETCHER is None:
+        _PREFETCHER = AdvicePrefetcher()
+    return _PREFETCHER
@@ -0,0 +1,150 @@
+# services/card_draw.py
+from __future__ import annotations
+
+"""
+Пакетные вытягивания карт на NumPy — для нагрузочных тестов, предрасчёта
+карт дня и проверок честности колоды, где нужны миллионы раскладов.
+
+draw_cards (tarot_ai) тянет по одному раскладу через random.sample и
+random.random() на каждую карту — медленно и невоспроизводимо. Здесь
+draw_batch(n_spreads, k, reversed_prob) возвращает сразу
+    ids           — int16-массив (n_spreads, k): id карт реестра, без повторов в раскладе;
+    reversed_mask — uint64 на расклад: бит j = карта j перевёрнута.
+
+Обычные расклады (до 12 карт) выбираются последовательно без возвращения —
+k векторных шагов по всем раскладам сразу; длинные — argpartition случайных
+ключей по всей колоде. В обоих случаях и набор карт, и их порядок в раскладе
+равновероятны. Считается кусками по CARD_DRAW_CHUNK раскладов, чтобы не
+держать в памяти n × 78 ключей.
+
+Воспроизводимость: seed — int или SeedSequence; reading_seed(user_id, reading)
+даёт свой поток на пользователя и расклад (соль — CARD_DRAW_SALT), так что
+расклад можно переиграть в точности: draw_reading(user_id, reading, k).
+Карты и ориентация идут из двух независимых подпотоков, поэтому результат
+не зависит от размера кусков.
+"""
+
+import os
+import hashlib
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+from services.card_registry import DrawnCard, get_card_registry
+
+
+# ===================== КОНФИГ =====================
+CARD_DRAW_CHUNK = int(os.getenv("CARD_DRAW_CHUNK", "65536"))   # раскладов на кусок
+CARD_DRAW_SALT  = os.getenv("CARD_DRAW_SALT", "taro")           # соль для reading_seed
+
+_MAX_K = 64             # ориентация — биты одного uint64
+_SEQUENTIAL_MAX_K = 12  # до стольких карт быстрее последовательный выбор, дальше — сортировка ключей
+_U64 = 0xFFFFFFFFFFFFFFFF
+
+Seed = Union[None, int, np.random.SeedSequence]
+
+
+class DrawBatch(NamedTuple):
+    ids: np.ndarray            # (n_spreads, k) int16
+    reversed_mask: np.ndarray  # (n_spreads,) uint64
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    def reversed_flags(self) -> np.ndarray:
+        """Маска → bool-массив (n_spreads, k)."""
+        k = self.ids.shape[1]
+        return ((self.reversed_mask[:, None] >> np.arange(k, dtype=np.uint64)) & np.uint64(1)).astype(bool)
+
+    def spread(self, i: int) -> List[DrawnCard]:
+        """i-й расклад в виде DrawnCard — как у draw_cards."""
+        mask = int(self.reversed_mask[i])
+        return [DrawnCard(int(card_id), bool(mask >> j & 1)) for j, card_id in enumerate(self.ids[i])]
+
+
+def _hash64(value: object) -> int:
+    return int.from_bytes(hashlib.sha256(str(value).encode("utf-8")).digest()[:8], "little")
+
+
+def reading_seed(user_id: int, reading: Union[int, str]) -> np.random.SeedSequence:
+    """Свой поток случайности на (пользователь, расклад): одинаковые аргументы — тот же расклад."""
+    return np.random.SeedSequence(_hash64(CARD_DRAW_SALT), spawn_key=(int(user_id) & _U64, _hash64(reading)))
+
+
+def _streams(seed: Seed) -> Tuple[np.random.Generator, np.random.Generator]:
+    """Два независимых генератора (карты, ориентация); сама SeedSequence не меняется."""
+    ss = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return tuple(
+        np.random.Generator(np.random.PCG64(np.random.SeedSequence(ss.entropy, spawn_key=(*ss.spawn_key, i))))
+        for i in (0, 1)
+    )
+
+
+def _sample_sequential(u: np.ndarray, deck: int) -> np.ndarray:
+    """
+    Без возвращения, карта за картой: j-я карта — равновероятно одна из deck - j
+    оставшихся (номер среди оставшихся сдвигается за уже взятые). O(k²) векторных
+    операций — для малых k в разы быстрее сортировки ключей всей колоды.
+    """
+    m, k = u.shape
+    picks = np.empty((m, k), dtype=np.int64)
+    for j in range(k):
+        v = (u[:, j] * (deck - j)).astype(np.int64)
+        if j:
+            taken = np.sort(picks[:, :j], axis=1)
+            for t in range(j):
+                v += v >= taken[:, t]
+        picks[:, j] = v
+    return picks
+
+
+def _sample_by_keys(keys: np.ndarray, k: int) -> np.ndarray:
+    """k карт с наименьшими случайными ключами, по возрастанию ключа."""
+    top = np.argpartition(keys, k - 1, axis=1)[:, :k] if k < keys.shape[1] else np.argsort(keys, axis=1)
+    order = np.argsort(np.take_along_axis(keys, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def _default_prob() -> float:
+    from services.tarot_ai import TAROT_ALLOW_REVERSED, TAROT_REVERSED_PROB
+    return TAROT_REVERSED_PROB if TAROT_ALLOW_REVERSED else 0.0
+
+
+def draw_batch(
+    n_spreads: int,
+    k: int,
+    reversed_prob: Optional[float] = None,
+    *,
+    seed: Seed = None,
+) -> DrawBatch:
+    """
+    n_spreads раскладов по k карт из реестра колоды.
+    reversed_prob: None -> как у draw_cards (TAROT_ALLOW_REVERSED / TAROT_REVERSED_PROB).
+    """
+    deck = len(get_card_registry())
+    if not 0 < k <= min(deck, _MAX_K):
+        raise ValueError(f"Запрошено {k} карт, а можно от 1 до {min(deck, _MAX_K)}")
+    prob = _default_prob() if reversed_prob is None else max(0.0, min(1.0, float(reversed_prob)))
+    card_rng, orient_rng = _streams(seed)
+
+    ids = np.empty((n_spreads, k), dtype=np.int16)
+    mask = np.zeros(n_spreads, dtype=np.uint64)
+    bits = np.uint64(1) << np.arange(k, dtype=np.uint64)
+    chunk = max(1, CARD_DRAW_CHUNK)
+    for lo in range(0, n_spreads, chunk):
+        m = min(chunk, n_spreads - lo)
+        if k <= _SEQUENTIAL_MAX_K:
+            ids[lo:lo + m] = _sample_sequential(card_rng.random((m, k)), deck)
+        else:
+            ids[lo:lo + m] = _sample_by_keys(card_rng.random((m, deck)), k)
+        if prob > 0.0:
+            flags = orient_rng.random((m, k)) < prob
+            mask[lo:lo + m] = (flags * bits).sum(axis=1, dtype=np.uint64)
+    return DrawBatch(ids, mask)
+
+
+def draw_reading(
+    user_id: int, reading: Union[int, str], k: int, reversed_prob: Optional[float] = None,
+) -> List[DrawnCard]:
+    """Воспроизводимый расклад пользователя: те же (user_id, reading) — те же карты и ориентация."""
+    return draw_batch(1, k, reversed_prob, seed=reading_seed(user_id, reading)).spread(0)
@@ -0,0 +1,285 @@
+# services/card_registry.py
+from __future__ import annotations
+
+"""
+Единый реестр карт: data/tarot_cards.json читается один раз, дальше все
+берут карты отсюда.
+
+Раньше колоду грузили по-своему tarot_ai._cards(), services/daily.load_cards()
+(заново на каждый draw_random_card), daily_card._load_tarot_list() (заново на
+каждую карту дня), template_engine, мок LLM и старый tarot_ai_orig, а шаблоны
+имён карт собирались на лету в clarify_flow и в огромном регэкспе очистки итога.
+
+Реестр неизменяемый: у карты целочисленный id (позиция в JSON), имя, масть,
+значения и заранее скомпилированные шаблоны имени — с падежами мастей
+(«Жезлы/Жезлов», «Мечи/Мечей»…) и хвостом «(перевёрнутая)». Если JSON на диске
+поменялся (mtime), get_card_registry() не чаще раза в CARD_REGISTRY_RECHECK_S
+секунд собирает новый реестр и подменяет его целиком; при ошибке чтения
+остаётся прежний.
+"""
+
+import os
+import re
+import json
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Pattern, Sequence, Tuple
+
+
+# ===================== КОНФИГ =====================
+CARDS_PATH               = Path(__file__).resolve().parent.parent / "data" / "tarot_cards.json"
+CARD_REGISTRY_RECHECK_S  = float(os.getenv("CARD_REGISTRY_RECHECK_S", "5"))   # как часто смотреть mtime
+
+REVERSED_SUFFIX = "(перевёрнутая)"
+
+# масть в имени карты → регэксп с падежами
+_SUIT_FORMS = {
+    "жезлы": r"Жезл(?:ы|ов)",
+    "кубки": r"Кубк(?:и|ов)",
+    "чаши": r"Чаш(?:и|)",
+    "мечи": r"Меч(?:и|ей)",
+    "пентакли": r"Пентакл(?:и|ей)",
+    "пентаклей": r"Пентакл(?:и|ей)",
+}
+# основы мастей для поиска упоминаний (Кубки — они же Чаши)
+_SUIT_STEMS = {"Жезлы": ("жезл",), "Кубки": ("чаш", "кубк"), "Мечи": ("меч",), "Пентакли": ("пентакл",)}
+# ранг младшей карты словом, как его пишет модель
+_RANK_WORDS = {
+    "Туз": "туз", "2": "двойка", "3": "тройка", "4": "четвёрка", "5": "пятёрка", "6": "шестёрка",
+    "7": "семёрка", "8": "восьмёрка", "9": "девятка", "10": "десятка",
+    "Паж": "паж", "Рыцарь": "рыцарь", "Королева": "королева", "Король": "король",
+}
+# старшие арканы, которые модель чаще называет иначе
+_MAJOR_ALIASES = {"Верховная Жрица": "жрица", "Иерофант": "жрец"}
+
+_REVERSED_TAIL_RX = re.compile(r"\s*\((?:перев[ёе]рнут\w*|reversed)[^)]*\)\s*$", re.IGNORECASE)
+_REVERSED_DASH_RX = re.compile(r"\s*[—\-:]\s*перев[ёе]рнут\w*\s*$", re.IGNORECASE)
+_REVERSED_NOTE = r"(?:\s*\((?:перев[ёе]рнут\w*|reversed)[^)]*\))?"
+
+
+def base_name(name: str) -> str:
+    """
+    «Базовое» имя карты без приписок про перевёрнутость.
+    Пример: 'Туз Жезлы (перевёрнутая)' -> 'Туз Жезлы'
+    """
+    if not isinstance(name, str):
+        return name or ""
+    t = _REVERSED_TAIL_RX.sub("", name.strip())
+    # иногда встречается '— перевёрнутая' без скобок
+    return _REVERSED_DASH_RX.sub("", t).strip()
+
+
+def name_pattern(card_base: str) -> str:
+    """Регэксп по БАЗОВОМУ имени карты, допускающий частые падежи мастей."""
+    if not isinstance(card_base, str) or not card_base.strip():
+        return re.escape(card_base or "")
+    words = card_base.strip().split()
+    if len(words) < 2:
+        return re.escape(words[0])
+    head = r"\s+".join(re.escape(w) for w in words[:-1])
+    tail = _SUIT_FORMS.get(words[-1].lower().replace("ё", "е"), re.escape(words[-1]))
+    return rf"{head}\s+{tail}"
+
+
+@lru_cache(maxsize=256)
+def _header_rx(card_base: str) -> Tuple[Pattern[str], Pattern[str]]:
+    """Повтор имени карты в начале толкования: отдельной строкой и в начале первой фразы."""
+    pat = name_pattern(card_base)
+    line = re.compile(rf"^(?:{pat}){_REVERSED_NOTE}\s*(?:[—\-:]\s*)?(?:\n+|$)", re.IGNORECASE)
+    inline = re.compile(
+        rf"^(?:{pat}){_REVERSED_NOTE}(?:\s+в\s+перев[ёе]рнут\w*\s+положени[ие])?\s*(?:[—\-:]\s*)?", re.IGNORECASE,
+    )
+    return line, inline
+
+
+@dataclass(frozen=True)
+class Card:
+    id: int
+    name: str
+    arcana: str
+    suit: Optional[str]
+    rank: Optional[str]
+    meaning_upright: str
+    meaning_reversed: str
+    header_line_rx: Pattern[str] = field(repr=False, compare=False)
+    header_inline_rx: Pattern[str] = field(repr=False, compare=False)
+    raw: Dict[str, Any] = field(repr=False, compare=False)
+
+    def display(self, reversed_: bool = False) -> str:
+        return f"{self.name} {REVERSED_SUFFIX}" if reversed_ else self.name
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Копия исходной записи JSON (её можно менять)."""
+        return dict(self.raw)
+
+
+class DrawnCard(NamedTuple):
+    """
+    Вытянутая карта — просто (id, перевёрнута ли): без словаря на экземпляр
+    и без копий записи JSON. Имя для показа собирается лениво из реестра.
+    """
+    card_id: int
+    reversed: bool = False
+
+    @property
+    def card(self) -> Card:
+        return get_card_registry()[self.card_id]
+
+    @property
+    def base_name(self) -> str:
+        return self.card.name
+
+    @property
+    def name(self) -> str:
+        """«Туз Жезлы» или «Туз Жезлы (перевёрнутая)»."""
+        return self.card.display(self.reversed)
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class CardRegistry:
+    """Неизменяемая колода: карты по id и по имени, шаблоны имён и упоминаний."""
+
+    def __init__(self, records: Sequence[Dict[str, Any]], *, path: Optional[Path] = None, mtime: float = 0.0):
+        self.path = path
+        self.mtime = mtime
+        cards: List[Card] = []
+        for i, rec in enumerate(records):
+            name = (rec.get("name") or rec.get("title") or str(rec)).strip()
+            line_rx, inline_rx = _header_rx(name)
+            cards.append(Card(
+                id=i, name=name, arcana=rec.get("arcana", ""), suit=rec.get("suit"), rank=rec.get("rank"),
+                meaning_upright=rec.get("meaning_upright", ""), meaning_reversed=rec.get("meaning_reversed", ""),
+                header_line_rx=line_rx, header_inline_rx=inline_rx, raw=dict(rec),
+            ))
+        self.cards: Tuple[Card, ...] = tuple(cards)
+        self.names: Tuple[str, ...] = tuple(c.name for c in cards)
+        self._by_name: Dict[str, int] = {c.name.lower(): c.id for c in cards}
+        self.suit_stems: Tuple[str, ...] = self._suit_stems()
+        self.mention_rx: Pattern[str] = self._mention_rx()
+
+    @classmethod
+    def load(cls, path: Path = CARDS_PATH) -> "CardRegistry":
+        mtime = os.stat(path).st_mtime
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), path=Path(path), mtime=mtime)
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def __iter__(self) -> Iterator[Card]:
+        return iter(self.cards)
+
+    def __getitem__(self, card_id: int) -> Card:
+        if not 0 <= card_id < len(self.cards):
+            raise IndexError(f"нет карты с id {card_id} (в колоде {len(self.cards)})")
+        return self.cards[card_id]
+
+    def id_of(self, name: str) -> Optional[int]:
+        """id карты по имени (регистр и «(перевёрнутая)» не важны) или None."""
+        return self._by_name.get(base_name(name or "").lower())
+
+    def get(self, name: str) -> Optional[Card]:
+        card_id = self.id_of(name)
+        return None if card_id is None else self.cards[card_id]
+
+    def header_rx(self, name: str) -> Tuple[Pattern[str], Pattern[str]]:
+        """Шаблоны повтора имени в начале толкования; для карт не из колоды — собираются и кэшируются."""
+        card = self.get(name)
+        if card is not None:
+            return card.header_line_rx, card.header_inline_rx
+        return _header_rx(base_name(name))
+
+    def _suit_stems(self) -> Tuple[str, ...]:
+        stems: List[str] = []
+        for c in self.cards:
+            for stem in _SUIT_STEMS.get(c.suit or "", ()):
+                if stem not in stems:
+                    stems.append(stem)
+        return tuple(stems)
+
+    def _mention_rx(self) -> Pattern[str]:
+        """Упоминание карты в тексте: ранг/старший аркан … масть (для очистки общего итога)."""
+        ranks: List[str] = []
+        majors: List[str] = []
+        for c in self.cards:
+            if c.arcana == "minor":
+                word, bucket = _RANK_WORDS.get(c.rank or "", (c.rank or "").lower()), ranks
+            else:
+                word, bucket = _MAJOR_ALIASES.get(c.name, c.name.lower()), majors
+            if word and word not in bucket:
+                bucket.append(word)
+        return re.compile(rf"(?i)\b({'|'.join(ranks + majors)})\b.*?({'|'.join(self.suit_stems)})")
+
+
+# ===================== ХРАНЕНИЕ =====================
+# id карты — позиция в JSON и живёт только до перечитывания колоды, поэтому
+# в БД и FSM уходят базовые имена: {"keys": [имена], "rev": [0/1, …]}.
+def pack_cards(cards: Iterable[DrawnCard]) -> Dict[str, List[Any]]:
+    """Расклад для БД (SpreadLog.cards) и FSM: базовые имена карт и флаги ориентации."""
+    keys: List[str] = []
+    rev: List[int] = []
+    for c in cards:
+        keys.append(c.base_name)
+        rev.append(int(c.reversed))
+    return {"keys": keys, "rev": rev}
+
+
+def unpack_cards(data: Optional[Dict[str, Any]]) -> List[DrawnCard]:
+    """
+    Обратно в карты. Понимает и старые записи: {"cards": [имена или словари]}
+    и {"ids": [...]} (позиции в колоде на момент записи — берутся, только если
+    такая позиция есть). Карты, которых в колоде нет, пропускаются.
+    """
+    if not data:
+        return []
+    registry = get_card_registry()
+    out: List[DrawnCard] = []
+    rev = data.get("rev") or []
+    if "keys" in data or "ids" in data:
+        for k, key in enumerate(data.get("keys", data.get("ids")) or []):
+            if "keys" in data:
+                card_id = registry.id_of(str(key))
+            else:
+                card_id = key if isinstance(key, int) and 0 <= key < len(registry) else None
+            if card_id is not None:
+                out.append(DrawnCard(card_id, bool(rev[k]) if k < len(rev) else False))
+        return out
+    for item in data.get("cards") or []:
+        name = (item.get("name") or item.get("title") or "") if isinstance(item, dict) else str(item)
+        card_id = registry.id_of(name)
+        if card_id is not None:
+            out.append(DrawnCard(card_id, base_name(name) != name.strip()))
+    return out
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_REGISTRY: Optional[CardRegistry] = None
+_CHECKED_AT = 0.0
+
+
+def get_card_registry() -> CardRegistry:
+    """Реестр колоды; при изменении JSON на диске — перечитывается (не чаще раза в CARD_REGISTRY_RECHECK_S)."""
+    global _REGISTRY, _CHECKED_AT
+    if _REGISTRY is None:
+        _REGISTRY = CardRegistry.load()
+        _CHECKED_AT = time.monotonic()
+        return _REGISTRY
+    now = time.monotonic()
+    if _REGISTRY.path is not None and now - _CHECKED_AT >= CARD_REGISTRY_RECHECK_S:
+        _CHECKED_AT = now
+        try:
+            if os.stat(_REGISTRY.path).st_mtime != _REGISTRY.mtime:
+                _REGISTRY = CardRegistry.load(_REGISTRY.path)
+                print(f"[cards] колода перечитана: {len(_REGISTRY)} карт")
+        except (OSError, ValueError) as e:
+            print(f"[cards] не удалось перечитать {_REGISTRY.path}: {e!r}, остаётся прежняя колода")
+    return _REGISTRY
+
+
+def set_card_registry(registry: Optional[CardRegistry]) -> None:
+    global _REGISTRY, _CHECKED_AT
+    _REGISTRY, _CHECKED_AT = registry, time.monotonic()
@@ -0,0 +1,133 @@
+# services/context_digest.py
+from __future__ import annotations
+
+"""
+Сжатие контекста для «вторичных» LLM-вызовов (итог сценария, советы).
+
+Вместо полного текста толкования (несколько тысяч токенов) в промпт уходит
+дайджест:
+    Шут (перевёрнутая): <1–2 ключевых предложения>
+    Маг: <…>
+    Итог: <итог целиком>
+
+Понимает блоки «⭐️ Карта: текст», «🃏 Карта: X» + абзац текста и «🌙 Итог: …».
+Если ни одной карты распознать не удалось — возвращает исходный текст.
+Экономия считается суммарно (/llm_stats); по каждому вызову — в лог при CONTEXT_DIGEST_LOG=1.
+"""
+
+import os
+import re
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# ===================== КОНФИГ =====================
+CONTEXT_DIGEST           = os.getenv("CONTEXT_DIGEST", "1").strip() not in {"0", "false", "False", ""}
+CONTEXT_DIGEST_SENTENCES = int(os.getenv("CONTEXT_DIGEST_SENTENCES", "2"))       # предложений на карту
+CONTEXT_DIGEST_SENT_MAX  = int(os.getenv("CONTEXT_DIGEST_SENT_MAX", "240"))      # символов на предложение
+CONTEXT_CHARS_PER_TOKEN  = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3.0"))    # грубая оценка для русского
+CONTEXT_DIGEST_LOG       = os.getenv("CONTEXT_DIGEST_LOG", "0").strip() not in {"0", "false", "False", ""}
+
+_PARA_SPLIT_RE = re.compile(r"\n\s*\n")
+_SENT_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+")
+_ITOG_RE = re.compile(r"^\s*(?:🌙\s*|✨\s*)?Итог\s*:?\s*", re.IGNORECASE)
+_CARD_HEADER_RE = re.compile(r"^\s*(?:🃏|⭐️|⭐)?\s*Карта\s*:\s*(?P<name>[^\n]+?)\s*$", re.IGNORECASE)
+_STAR_CARD_RE = re.compile(r"^\s*(?:⭐️|⭐)\s*(?P<name>[^:\n—]{2,60}?)\s*(?::|—)\s*(?P<body>.*)$", re.DOTALL)
+
+
+def estimate_tokens(text: str) -> int:
+    return int(round(len(text or "") / CONTEXT_CHARS_PER_TOKEN))
+
+
+def _key_sentences(text: str, limit: int) -> str:
+    sentences = [s.strip() for s in _SENT_SPLIT_RE.split(" ".join((text or "").split())) if s.strip()]
+    picked = []
+    for s in sentences[:limit]:
+        if len(s) > CONTEXT_DIGEST_SENT_MAX:
+            s = s[:CONTEXT_DIGEST_SENT_MAX].rsplit(" ", 1)[0] + "…"
+        picked.append(s)
+    return " ".join(picked)
+
+
+def parse_reading(text: str) -> Tuple[List[Tuple[str, str]], Optional[str]]:
+    """Текст толкования → ([(карта, текст), …], итог)."""
+    cards: List[Tuple[str, str]] = []
+    itog: Optional[str] = None
+    pending: Optional[str] = None  # «🃏 Карта: X» без текста — текст в следующем абзаце
+
+    for para in _PARA_SPLIT_RE.split(text or ""):
+        para = para.strip()
+        if not para:
+            continue
+        if _ITOG_RE.match(para):
+            itog = _ITOG_RE.sub("", para, count=1).strip() or itog
+            pending = None
+            continue
+
+        first, _, rest = para.partition("\n")
+        header = _CARD_HEADER_RE.match(first)
+        if header:
+            pending = header.group("name")
+            if rest.strip():
+                cards.append((pending, rest.strip()))
+                pending = None
+            continue
+
+        star = _STAR_CARD_RE.match(para)
+        if star:
+            cards.append((star.group("name").strip(), star.group("body").strip()))
+            pending = None
+            continue
+
+        if pending is not None:
+            cards.append((pending, para))
+            pending = None
+        elif cards and not para.startswith(("Карты:", "🃏 Карты:")):
+            # продолжение толкования предыдущей карты
+            name, body = cards[-1]
+            cards[-1] = (name, f"{body} {para}")
+    return cards, itog
+
+
+def build_digest(text: str, *, sentences: int = CONTEXT_DIGEST_SENTENCES) -> str:
+    cards, itog = parse_reading(text)
+    if not cards:
+        return (text or "").strip()
+    lines = [f"{name}: {_key_sentences(body, sentences)}".rstrip() for name, body in cards]
+    if itog:
+        lines.append(f"Итог: {itog}")
+    return "\n".join(lines)
+
+
+@dataclass
+class DigestStats:
+    calls: int = 0
+    tokens_raw: int = 0
+    tokens_digest: int = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["tokens_saved"] = self.tokens_raw - self.tokens_digest
+        data["saved_ratio"] = round(1 - self.tokens_digest / self.tokens_raw, 3) if self.tokens_raw else 0.0
+        return data
+
+
+_STATS = DigestStats()
+
+
+def compact_context(text: str, *, purpose: str) -> str:
+    """Дайджест для промпта (если включён) + учёт экономии токенов."""
+    if not CONTEXT_DIGEST:
+        return text
+    digest = build_digest(text)
+    raw_t, dig_t = estimate_tokens(text), estimate_tokens(digest)
+    _STATS.calls += 1
+    _STATS.tokens_raw += raw_t
+    _STATS.tokens_digest += dig_t
+    if CONTEXT_DIGEST_LOG and raw_t:
+        print(f"[digest] {purpose}: ~{raw_t} → ~{dig_t} токенов ({100 * (raw_t - dig_t) // raw_t}% экономии)")
+    return digest
+
+
+def digest_stats() -> Dict[str, Any]:
+    return _STATS.snapshot()
@@ -2,32 +2,31 @@
 import os
 import json
 import random
-from datetime import datetime
-from typing import Optional, List, Tuple
+import asyncio
+from datetime import datetime, date
+from typing import Optional, List, Tuple, Iterable
 import pytz
 from sqlalchemy import select, delete, update
 
 from db import SessionLocal
 from db.models import User, DailySubscription  # DailySubscription добавили в models.py
+from services.interp_cache import InterpretationCache, make_key as interp_cache_key
+from services.tarot_ai import gpt_make_prediction_raw, format_prediction
+from services.card_registry import get_card_registry
 
 # пути к файлам
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-CARDS_JSON = os.path.join(BASE_DIR, "data", "tarot_cards.json")
 CARDS_DIR = os.getenv("CARDS_DIR", os.path.join(BASE_DIR, "assets", "cards"))
 CARDS_MAP_PATH = os.path.join(CARDS_DIR, "cards_map.json")
 
 # ----------- Загрузка списка карт и выбор случайной карты -----------
 def load_cards() -> List[dict]:
-    """Читает список карт из data/tarot_cards.json"""
-    if not os.path.exists(CARDS_JSON):
-        raise FileNotFoundError(f"Нет файла {CARDS_JSON}")
-    with open(CARDS_JSON, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """Список карт (копии записей data/tarot_cards.json) из общего реестра."""
+    return [c.as_dict() for c in get_card_registry()]
 
 def draw_random_card() -> dict:
-    """Возвращает одну случайную карту (dict) из tarot_cards.json"""
-    cards = load_cards()
-    return random.choice(cards)
+    """Возвращает одну случайную карту (dict) из колоды — без перечитывания JSON."""
+    return random.choice(get_card_registry().cards).as_dict()
 
 # ----------- Картинка для карты -----------
 def resolve_card_image(card_name: str) -> Optional[str]:
@@ -122,3 +121,66 @@ async def list_due_subscribers(now_utc: datetime) -> List[Tuple[int, int, str]]:
             if local_now.minute == 0 and local_now.hour == sub.hour:
                 out.append((user.tg_id, sub.hour, sub.tz))
     return out
+
+
+# ----------- Предгенерация толкований «Карты дня» -----------
+# Толкования готовим один раз на день для каждой карты поднабора (по DAILY_VARIANTS
+# вариантов), а рассылка только выбирает готовый текст — без LLM-вызова на подписчика.
+DAILY_VARIANTS           = int(os.getenv("DAILY_VARIANTS", "2"))
+DAILY_PREGEN_CONCURRENCY = int(os.getenv("DAILY_PREGEN_CONCURRENCY", "4"))
+DAILY_TZ                 = os.getenv("DAILY_TZ", "Europe/Moscow")
+
+_DAILY_POOL = InterpretationCache(variants=DAILY_VARIANTS, capacity=512, ttl_hours=48)
+_DAILY_LOCK = asyncio.Lock()
+
+def daily_pool_day(now_utc: Optional[datetime] = None) -> date:
+    """«Сегодня» для пула карт дня — по DAILY_TZ (по умолчанию Москва)."""
+    now_utc = now_utc or datetime.now(pytz.utc)
+    return now_utc.astimezone(pytz.timezone(DAILY_TZ)).date()
+
+def _daily_key(card_name: str, day: date) -> str:
+    return interp_cache_key(
+        card_name, theme="Карта дня", spread="one-card", question="Карта дня",
+        scenario_ctx=f"day:{day.isoformat()}",
+    )
+
+async def pregenerate_daily_interpretations(card_names: Iterable[str], day: Optional[date] = None) -> int:
+    """
+    Догенерирует недостающие варианты толкований на день для всех карт.
+    Идемпотентна: уже готовые варианты (в памяти или в БД) не трогает.
+    Возвращает число новых LLM-вызовов.
+    """
+    day = day or daily_pool_day()
+    sem = asyncio.Semaphore(max(1, DAILY_PREGEN_CONCURRENCY))
+    made = 0
+
+    async def _one(name: str) -> None:
+        nonlocal made
+        key = _daily_key(name, day)
+        missing = DAILY_VARIANTS - await _DAILY_POOL.variant_count(key)
+        for _ in range(max(0, missing)):
+            async with sem:
+                try:
+                    raw = await gpt_make_prediction_raw(
+                        question="Карта дня", theme="Карта дня", spread="one-card", cards_list=name,
+                    )
+                except Exception as e:
+                    print(f"[Карта дня] предгенерация {name}: {e}")
+                    return
+            made += 1
+            if raw is None:
+                return
+            await _DAILY_POOL.put_variant(key, raw)
+
+    # один прогон за раз: плановая задача и волна рассылки не дублируют вызовы
+    async with _DAILY_LOCK:
+        await asyncio.gather(*(_one(n) for n in dict.fromkeys(card_names)))
+    return made
+
+async def get_daily_interpretation(card_name: str, day: Optional[date] = None) -> Optional[str]:
+    """Готовое (отформатированное) толкование карты на день; None — пул ещё не готов."""
+    raw = await _DAILY_POOL.get_variant(_daily_key(card_name, day or daily_pool_day()), min_variants=1)
+    return format_prediction(raw) if raw is not None else None
+
+def daily_pool_stats() -> dict:
+    return _DAILY_POOL.cache_stats()
@@ -0,0 +1,256 @@
+# services/gen_profiles.py
+from __future__ import annotations
+
+"""
+Профили генерации: свой maxTokens и temperature у каждого типа вызова.
+
+Раньше любой вызов уходил с maxTokens=2000 — и пункт на одну карту, и Итог
+из трёх предложений, и Подкова на 7 карт. Щедрый лимит позволяет модели
+«растекаться», что бьёт по латентности.
+
+Профили: point, summary, advice_short, advice_long, full_spread, daily.
+Стартовые значения — из кода/окружения (LLM_PROFILE_<ИМЯ>="maxTokens,temperature"),
+дальше профиль калибруется по распределению длин реальных ответов:
+  - maxTokens = p99 длины × LLM_PROFILE_HEADROOM, в пределах [floor, ceiling];
+    если ответы часто упираются в лимит (обрезаны) — лимит поднимается;
+  - temperature: большой разброс длин (модель «гуляет») — чуть ниже,
+    стабильные ответы — обратно к базовой.
+Калибровка — каждые LLM_PROFILE_RECALIBRATE ответов профиля; замеры
+переживают рестарт (data/gen_profiles.json): файл пишется в отдельном потоке
+после калибровки и при остановке бота (flush()), цикл событий диском не занят.
+Выбранный профиль печатается в лог на каждом вызове при LLM_PROFILE_LOG=1.
+"""
+
+import os
+import json
+import asyncio
+import math
+import statistics
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, Optional
+
+from services.context_digest import estimate_tokens
+
+
+# ===================== КОНФИГ =====================
+LLM_PROFILES_AUTO        = os.getenv("LLM_PROFILES_AUTO", "1").strip() not in {"0", "false", "False", ""}
+LLM_PROFILE_MIN_SAMPLES  = int(os.getenv("LLM_PROFILE_MIN_SAMPLES", "30"))     # до этого — стартовые значения
+LLM_PROFILE_WINDOW       = int(os.getenv("LLM_PROFILE_WINDOW", "500"))         # замеров длины на профиль
+LLM_PROFILE_RECALIBRATE  = int(os.getenv("LLM_PROFILE_RECALIBRATE", "25"))     # ответов между калибровками
+LLM_PROFILE_HEADROOM     = float(os.getenv("LLM_PROFILE_HEADROOM", "1.3"))     # запас над p99
+LLM_PROFILE_TRUNC_RATE   = float(os.getenv("LLM_PROFILE_TRUNC_RATE", "0.05"))  # доля обрезанных — поднять лимит
+LLM_PROFILE_LOG          = os.getenv("LLM_PROFILE_LOG", "0").strip() not in {"0", "false", "False", ""}
+LLM_PROFILES_PATH        = os.getenv(
+    "LLM_PROFILES_PATH", str(Path(__file__).resolve().parent.parent / "data" / "gen_profiles.json")
+)
+
+_TEMP_STEP = 0.05
+_CV_HIGH, _CV_LOW = 0.5, 0.3   # коэффициент вариации длин: выше — понижаем t, ниже — возвращаем
+_TRUNC_SHARE = 0.95            # ответ длиной ≥ 95% лимита считаем обрезанным
+
+
+@dataclass
+class GenProfile:
+    name: str
+    max_tokens: int
+    temperature: float
+    floor: int            # ниже не калибруем
+    ceiling: int          # выше не калибруем
+    base_temperature: float = 0.0
+    samples: Deque[int] = field(default_factory=lambda: deque(maxlen=max(1, LLM_PROFILE_WINDOW)))
+    calls: int = 0
+    truncated: int = 0
+    since_calibration: int = 0
+    calibrations: int = 0
+
+    def __post_init__(self):
+        if not self.base_temperature:
+            self.base_temperature = self.temperature
+
+    def snapshot(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "max_tokens": self.max_tokens,
+            "temperature": round(self.temperature, 2),
+            "calls": self.calls,
+            "truncated": self.truncated,
+            "samples": len(self.samples),
+            "calibrations": self.calibrations,
+        }
+        if self.samples:
+            data["p50_tokens"] = _percentile(self.samples, 0.5)
+            data["p99_tokens"] = _percentile(self.samples, 0.99)
+        return data
+
+
+# имя: (maxTokens, temperature, floor, ceiling)
+_DEFAULTS: Dict[str, tuple] = {
+    "point":        (500,  0.7,  200,  900),
+    "summary":      (250,  0.6,  120,  500),
+    "advice_short": (250,  0.7,  120,  500),
+    "advice_long":  (700,  0.7,  300, 1200),
+    "full_spread":  (1600, 0.7,  600, 2000),
+    "daily":        (500,  0.75, 200,  900),
+}
+
+# тип вызова маршрутизатора → профиль (advice уточняется по числу карт совета)
+_KIND_PROFILES = {
+    "point": "point",
+    "summary": "summary",
+    "advice": "advice_short",
+    "prediction": "full_spread",
+    "scenario": "full_spread",
+    "daily": "daily",
+}
+
+
+def _percentile(values, q: float) -> int:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _from_env(name: str, default: tuple) -> tuple:
+    raw = os.getenv(f"LLM_PROFILE_{name.upper()}", "").strip()
+    if not raw:
+        return default
+    try:
+        max_tokens, temperature = (x.strip() for x in raw.split(","))
+        return (int(max_tokens), float(temperature)) + default[2:]
+    except ValueError:
+        print(f"[profiles] не разобрал LLM_PROFILE_{name.upper()}={raw!r} — беру значения по умолчанию")
+        return default
+
+
+def advice_profile(advice_count: int) -> str:
+    return "advice_long" if int(advice_count) >= 3 else "advice_short"
+
+
+class ProfileBook:
+    def __init__(self, *, path: Optional[str] = LLM_PROFILES_PATH, auto: bool = LLM_PROFILES_AUTO):
+        self.path = path
+        self.auto = auto
+        self.profiles: Dict[str, GenProfile] = {}
+        self._saving: Optional[asyncio.Task] = None
+        for name, default in _DEFAULTS.items():
+            max_tokens, temperature, floor, ceiling = _from_env(name, default)
+            self.profiles[name] = GenProfile(name, max_tokens, temperature, floor, ceiling)
+        self._load()
+
+    def resolve(self, kind: str, profile: Optional[str] = None) -> GenProfile:
+        """Профиль по явному имени, иначе — по типу вызова (неизвестный тип → full_spread)."""
+        name = profile or _KIND_PROFILES.get(kind, "full_spread")
+        p = self.profiles.get(name) or self.profiles["full_spread"]
+        p.calls += 1
+        if LLM_PROFILE_LOG:
+            print(f"[profile] {kind} → {p.name}: maxTokens={p.max_tokens}, t={p.temperature:.2f}")
+        return p
+
+    def observe(self, p: GenProfile, text: str, max_tokens: int) -> None:
+        """Длина ответа (оценка в токенах) в распределение профиля."""
+        tokens = estimate_tokens(text)
+        p.samples.append(tokens)
+        if tokens >= _TRUNC_SHARE * max_tokens:
+            p.truncated += 1
+        p.since_calibration += 1
+        if self.auto and p.since_calibration >= LLM_PROFILE_RECALIBRATE and len(p.samples) >= LLM_PROFILE_MIN_SAMPLES:
+            self.calibrate(p)
+
+    def calibrate(self, p: GenProfile) -> None:
+        window = list(p.samples)[-p.since_calibration:] if p.since_calibration else []
+        truncated_share = (
+            sum(1 for t in window if t >= _TRUNC_SHARE * p.max_tokens) / len(window) if window else 0.0
+        )
+        p.since_calibration = 0
+
+        old_tokens, old_temp = p.max_tokens, p.temperature
+        target = int(math.ceil(_percentile(p.samples, 0.99) * LLM_PROFILE_HEADROOM))
+        if truncated_share > LLM_PROFILE_TRUNC_RATE:
+            # ответы упираются в лимит — распределение «срезано», p99 ему не верим
+            target = max(target, int(p.max_tokens * 1.25))
+        p.max_tokens = max(p.floor, min(p.ceiling, target))
+
+        mean = statistics.fmean(p.samples)
+        cv = statistics.pstdev(p.samples) / mean if mean else 0.0
+        if cv > _CV_HIGH:
+            p.temperature = max(0.3, p.temperature - _TEMP_STEP)
+        elif cv < _CV_LOW and p.temperature < p.base_temperature:
+            p.temperature = min(p.base_temperature, p.temperature + _TEMP_STEP)
+
+        p.calibrations += 1
+        if (p.max_tokens, p.temperature) != (old_tokens, old_temp):
+            print(
+                f"[profiles] {p.name}: maxTokens {old_tokens} → {p.max_tokens}, "
+                f"t {old_temp:.2f} → {p.temperature:.2f} (p99={_percentile(p.samples, 0.99)}, cv={cv:.2f}, "
+                f"обрезано {truncated_share:.0%})"
+            )
+        self._save_soon()
+
+    # ---------- хранение замеров ----------
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[profiles] не прочитал {self.path}: {e!r}")
+            return
+        for name, item in saved.items():
+            p = self.profiles.get(name)
+            if p is None:
+                continue
+            p.samples.extend(int(x) for x in item.get("samples", []))
+            if self.auto:
+                p.max_tokens = max(p.floor, min(p.ceiling, int(item.get("max_tokens", p.max_tokens))))
+                p.temperature = float(item.get("temperature", p.temperature))
+
+    def _dump(self) -> Dict[str, Any]:
+        return {
+            name: {"max_tokens": p.max_tokens, "temperature": p.temperature, "samples": list(p.samples)}
+            for name, p in self.profiles.items()
+        }
+
+    def _save_soon(self) -> None:
+        """Запись в фоне (снимок берём сразу, пишем в потоке); без цикла событий — синхронно."""
+        if not self.path:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._save(self._dump())
+            return
+        if self._saving is not None and not self._saving.done():
+            return  # калибровки редкие; свежий снимок допишет flush() или следующая калибровка
+        self._saving = asyncio.create_task(asyncio.to_thread(self._save, self._dump()))
+
+    async def flush(self) -> None:
+        """Дождаться фоновой записи и сохранить текущие замеры (при остановке бота)."""
+        if self._saving is not None:
+            await asyncio.gather(self._saving, return_exceptions=True)
+        if self.path:
+            await asyncio.to_thread(self._save, self._dump())
+
+    def _save(self, data: Dict[str, Any]) -> None:
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[profiles] не сохранил {self.path}: {e!r}")
+
+    def profile_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: p.snapshot() for name, p in self.profiles.items()}
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_BOOK: Optional[ProfileBook] = None
+
+def get_profile_book() -> ProfileBook:
+    global _BOOK
+    if _BOOK is None:
+        _BOOK = ProfileBook()
+    return _BOOK
@@ -0,0 +1,239 @@
+# services/interp_cache.py
+from __future__ import annotations
+
+"""
+Кэш толкований одиночных карт перед gpt_make_prediction.
+
+Ключ: базовое имя карты × положение (прямая/перевёрнутая) × тема × расклад ×
+вопрос/пункт × сценарий. На ключ копим до INTERP_CACHE_VARIANTS вариантов текста:
+пока вариантов меньше — идём в LLM и добавляем новый, потом только ротируем
+(чтобы тексты у разных пользователей не совпадали дословно).
+
+Два уровня: LRU в памяти процесса + таблица interpretation_cache в БД с TTL.
+Храним «сырой» ответ модели — форматирование дешёвое и делается при выдаче.
+
+Одновременные промахи по одному ключу склеиваются здесь же (single-flight по
+ключу кэша): генерирует и сохраняет вариант только первый, остальные получают
+его текст, не записывая дубли — иначе один ответ занял бы все слоты ротации.
+"""
+
+import os
+import re
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete
+
+from db import SessionLocal
+from db.models import InterpretationCache as CacheRow
+from services.single_flight import SingleFlight
+
+
+# ===================== КОНФИГ =====================
+INTERP_CACHE_ENABLED  = os.getenv("INTERP_CACHE_ENABLED", "1").strip() not in {"0", "false", "False", ""}
+INTERP_CACHE_VARIANTS = int(os.getenv("INTERP_CACHE_VARIANTS", "3"))        # вариантов на ключ
+INTERP_CACHE_MEMORY   = int(os.getenv("INTERP_CACHE_MEMORY", "2000"))       # ключей в LRU
+INTERP_CACHE_TTL_H    = float(os.getenv("INTERP_CACHE_TTL_HOURS", "336"))   # 14 суток
+
+_REVERSED_RE = re.compile(r"\s*\((?:перев[ёе]рнут\w*|reversed)[^)]*\)\s*$", re.IGNORECASE)
+
+
+def split_orientation(card_name: str) -> Tuple[str, bool]:
+    """'Туз Жезлы (перевёрнутая)' -> ('Туз Жезлы', True)."""
+    name = (card_name or "").strip()
+    base = _REVERSED_RE.sub("", name)
+    return base.strip(), base != name
+
+
+def make_key(
+    card_name: str,
+    *,
+    theme: str,
+    spread: str,
+    question: str,
+    scenario_ctx: Optional[str] = None,
+) -> str:
+    base, is_rev = split_orientation(card_name)
+    parts = [
+        base.lower().replace("ё", "е"),
+        "R" if is_rev else "U",
+        (theme or "").strip().lower(),
+        (spread or "").strip().lower(),
+        " ".join((question or "").split()).lower(),
+        " ".join((scenario_ctx or "").split()).lower(),
+    ]
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    db_loads: int = 0
+    db_errors: int = 0
+    evictions: int = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = asdict(self)
+        total = self.hits + self.misses
+        data["hit_rate"] = round(self.hits / total, 3) if total else 0.0
+        return data
+
+
+class _Entry:
+    __slots__ = ("texts", "created", "cursor")
+
+    def __init__(self, texts: List[str], created: List[datetime]):
+        self.texts = texts
+        self.created = created
+        self.cursor = 0
+
+
+class InterpretationCache:
+    def __init__(
+        self,
+        *,
+        variants: int = INTERP_CACHE_VARIANTS,
+        capacity: int = INTERP_CACHE_MEMORY,
+        ttl_hours: float = INTERP_CACHE_TTL_H,
+        persist: bool = True,
+    ):
+        self.variants = max(1, int(variants))
+        self.capacity = max(1, int(capacity))
+        self.ttl = timedelta(hours=float(ttl_hours))
+        self.persist = persist
+        self.stats = CacheStats()
+        self._mem: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._flight = SingleFlight()
+
+    # ---------- память ----------
+    def _fresh(self, entry: _Entry) -> _Entry:
+        border = datetime.utcnow() - self.ttl
+        keep = [(t, c) for t, c in zip(entry.texts, entry.created) if c >= border]
+        if len(keep) != len(entry.texts):
+            entry.texts = [t for t, _ in keep]
+            entry.created = [c for _, c in keep]
+        return entry
+
+    def _remember(self, key: str, entry: _Entry) -> None:
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.capacity:
+            self._mem.popitem(last=False)
+            self.stats.evictions += 1
+
+    # ---------- БД ----------
+    async def _load(self, key: str) -> _Entry:
+        if not self.persist:
+            return _Entry([], [])
+        border = datetime.utcnow() - self.ttl
+        try:
+            async with SessionLocal() as s:
+                await s.execute(
+                    delete(CacheRow)
+                    .where(CacheRow.key == key, CacheRow.created_at < border)
+                )
+                res = await s.execute(
+                    select(CacheRow.text, CacheRow.created_at)
+                    .where(CacheRow.key == key)
+                    .order_by(CacheRow.created_at)
+                    .limit(self.variants)
+                )
+                rows = res.all()
+                await s.commit()
+            self.stats.db_loads += 1
+            return _Entry([r[0] for r in rows], [r[1] for r in rows])
+        except Exception as e:
+            self.stats.db_errors += 1
+            print(f"[interp_cache] load failed: {e}")
+            return _Entry([], [])
+
+    async def _save(self, key: str, variant: int, text: str) -> None:
+        if not self.persist:
+            return
+        try:
+            async with SessionLocal() as s:
+                s.add(CacheRow(key=key, variant=variant, text=text))
+                await s.commit()
+        except Exception as e:
+            self.stats.db_errors += 1
+            print(f"[interp_cache] save failed: {e}")
+
+    # ---------- API ----------
+    async def _entry(self, key: str) -> _Entry:
+        entry = self._mem.get(key)
+        if entry is None:
+            entry = await self._load(key)
+        entry = self._fresh(entry)
+        self._remember(key, entry)
+        return entry
+
+    async def variant_count(self, key: str) -> int:
+        return len((await self._entry(key)).texts)
+
+    async def get_variant(self, key: str, *, min_variants: Optional[int] = None) -> Optional[str]:
+        """
+        Готовый вариант, если их накоплено не меньше min_variants (по умолчанию — полный
+        набор); иначе None (нужно генерировать).
+        """
+        entry = await self._entry(key)
+        need = self.variants if min_variants is None else max(1, int(min_variants))
+        if len(entry.texts) < need:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        text = entry.texts[entry.cursor % len(entry.texts)]
+        entry.cursor += 1
+        return text
+
+    async def put_variant(self, key: str, text: str) -> None:
+        # запись могла вытесниться из LRU — берём её с вариантами из БД, чтобы не нумеровать заново
+        entry = await self._entry(key)
+        if len(entry.texts) >= self.variants or text in entry.texts:
+            return
+        variant = len(entry.texts)
+        entry.texts.append(text)
+        entry.created.append(datetime.utcnow())
+        self.stats.stores += 1
+        await self._save(key, variant, text)
+
+    async def get_or_create(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[str]],
+        *,
+        should_store: Callable[[str], bool] = lambda t: bool(t and t.strip()),
+    ) -> str:
+        cached = await self.get_variant(key)
+        if cached is not None:
+            return cached
+
+        async def create() -> str:
+            text = await factory()
+            if should_store(text):
+                await self.put_variant(key, text)
+            return text
+
+        # сохраняет только тот, кто запустил генерацию; подцепившиеся лишь получают текст
+        return await self._flight.do(key, create)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        data = self.stats.snapshot()
+        data["keys_in_memory"] = len(self._mem)
+        data["variants_per_key"] = self.variants
+        data["coalesced"] = self._flight.stats.coalesced
+        return data
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_CACHE: Optional[InterpretationCache] = None
+
+def get_interp_cache() -> InterpretationCache:
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = InterpretationCache()
+    return _CACHE
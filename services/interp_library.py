@@ -0,0 +1,184 @@
+# services/interp_library.py
+from __future__ import annotations
+
+"""
+Библиотека заранее сгенерированных толкований одиночных карт (mmap-файл).
+
+Собирается офлайн скриптом scripts/build_interp_library.py: все карты ×
+ориентация × направление × пункт сценария clarify_flow, по несколько
+вариантов. В рантайме запрос одиночной карты отвечается из файла:
+поиск O(1) по хэш-таблице, текст читается прямо из отображённых страниц
+(общих для всех процессов через page cache), в памяти процесса — только
+выбранный вариант. LLM для таких запросов не вызывается вовсе.
+
+Ключ — тот же, что у кэша толкований (interp_cache.make_key, sha1).
+
+Формат файла (little-endian):
+    заголовок  : magic "TLIB" | u32 версия | u32 записей | u32 слотов | u64 смещение данных
+    слоты      : слотов × (20 байт sha1 | u32 вариантов | u64 смещение списка вариантов)
+                 открытая адресация, линейное пробирование, пустой слот — вариантов = 0
+    данные     : для каждой записи — вариантов × (u64 смещение | u32 длина), затем тексты UTF-8
+"""
+
+import os
+import mmap
+import random
+import struct
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+# ===================== КОНФИГ =====================
+INTERP_LIBRARY_PATH = os.getenv(
+    "INTERP_LIBRARY_PATH", str(Path(__file__).resolve().parent.parent / "data" / "interp_library.bin")
+)
+INTERP_LIBRARY = os.getenv("INTERP_LIBRARY", "1").strip() not in {"0", "false", "False", ""}
+
+_MAGIC = b"TLIB"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIIIQ")
+_SLOT = struct.Struct("<20sIQ")
+_VARIANT = struct.Struct("<QI")
+
+
+def _slot_index(digest: bytes, mask: int) -> int:
+    return int.from_bytes(digest[:8], "little") & mask
+
+
+# ===================== ЗАПИСЬ =====================
+def write_library(path: str, entries: Dict[str, List[str]]) -> int:
+    """
+    entries: ключ (sha1 hex из make_key) → варианты текста. Пишет атомарно
+    (временный файл + rename). Возвращает число записей.
+    """
+    items = [(bytes.fromhex(k), [t.encode("utf-8") for t in v if t]) for k, v in entries.items()]
+    items = [(d, v) for d, v in items if v]
+    n_slots = 1
+    while n_slots < max(2, len(items) * 2):  # заполнение ≤ 50% — короткие цепочки пробирования
+        n_slots <<= 1
+    mask = n_slots - 1
+
+    data_offset = _HEADER.size + n_slots * _SLOT.size
+    slots: List[Optional[Tuple[bytes, int, int]]] = [None] * n_slots
+    chunks: List[bytes] = []
+    pos = data_offset
+    for digest, texts in items:
+        table_at = pos
+        pos += len(texts) * _VARIANT.size
+        table = []
+        for raw in texts:
+            table.append(_VARIANT.pack(pos, len(raw)))
+            pos += len(raw)
+        chunks.append(b"".join(table))
+        chunks.extend(texts)
+
+        i = _slot_index(digest, mask)
+        while slots[i] is not None:
+            i = (i + 1) & mask
+        slots[i] = (digest, len(texts), table_at)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(items), n_slots, data_offset))
+        empty = _SLOT.pack(b"\0" * 20, 0, 0)
+        f.write(b"".join(_SLOT.pack(*s) if s else empty for s in slots))
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp, path)
+    return len(items)
+
+
+# ===================== ЧТЕНИЕ =====================
+@dataclass
+class LibraryStats:
+    hits: int = 0
+    misses: int = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = asdict(self)
+        total = self.hits + self.misses
+        data["hit_rate"] = round(self.hits / total, 3) if total else 0.0
+        return data
+
+
+class InterpretationLibrary:
+    def __init__(self, path: str):
+        self.path = path
+        self.stats = LibraryStats()
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.entries, self.slots, self._data_offset = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError(f"{path}: не библиотека толкований (magic={magic!r}, версия {version})")
+        self._mask = self.slots - 1
+
+    def _find(self, key: str) -> Optional[Tuple[int, int]]:
+        digest = bytes.fromhex(key)
+        i = _slot_index(digest, self._mask)
+        while True:
+            d, count, table_at = _SLOT.unpack_from(self._mm, _HEADER.size + i * _SLOT.size)
+            if count == 0:
+                return None
+            if d == digest:
+                return count, table_at
+            i = (i + 1) & self._mask
+
+    def variants(self, key: str) -> int:
+        found = self._find(key)
+        return found[0] if found else 0
+
+    def text(self, key: str, variant: int) -> str:
+        count, table_at = self._find(key) or (0, 0)
+        if not 0 <= variant < count:
+            raise KeyError(key)
+        off, length = _VARIANT.unpack_from(self._mm, table_at + variant * _VARIANT.size)
+        return self._mm[off:off + length].decode("utf-8")
+
+    def get(self, key: str) -> Optional[str]:
+        """Случайный вариант текста по ключу или None."""
+        found = self._find(key)
+        if found is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        count, table_at = found
+        off, length = _VARIANT.unpack_from(self._mm, table_at + random.randrange(count) * _VARIANT.size)
+        return self._mm[off:off + length].decode("utf-8")
+
+    def items(self) -> Iterator[Tuple[str, List[str]]]:
+        """Все записи (для дозаписи библиотеки скриптом)."""
+        for i in range(self.slots):
+            d, count, table_at = _SLOT.unpack_from(self._mm, _HEADER.size + i * _SLOT.size)
+            if count:
+                key = d.hex()
+                yield key, [self.text(key, v) for v in range(count)]
+
+    def library_stats(self) -> Dict[str, Any]:
+        data = self.stats.snapshot()
+        data["entries"] = self.entries
+        data["size_mb"] = round(len(self._mm) / 1_048_576, 2)
+        return data
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_LIBRARY: Optional[InterpretationLibrary] = None
+_LIBRARY_TRIED = False
+
+def get_interp_library() -> Optional[InterpretationLibrary]:
+    """Библиотека из INTERP_LIBRARY_PATH; None — выключена или файла нет."""
+    global _LIBRARY, _LIBRARY_TRIED
+    if not _LIBRARY_TRIED:
+        _LIBRARY_TRIED = True
+        if INTERP_LIBRARY and os.path.exists(INTERP_LIBRARY_PATH):
+            try:
+                _LIBRARY = InterpretationLibrary(INTERP_LIBRARY_PATH)
+                print(f"[library] {INTERP_LIBRARY_PATH}: {_LIBRARY.entries} записей")
+            except (OSError, ValueError) as e:
+                print(f"[library] не открыл {INTERP_LIBRARY_PATH}: {e!r}")
+    return _LIBRARY
@@ -0,0 +1,307 @@
+# services/llm_batch.py
+from __future__ import annotations
+
+"""
+Пакетный (отложенный) путь для фоновой LLM-работы.
+
+Предгенерация карт дня и прогрев кэша не требуют
+интерактивной латентности, но раньше шли в тот же синхронный completion,
+что и живые пользователи. Здесь они идут через отложенный API Яндекса:
+  POST  .../foundationModels/v1/completionAsync  → {"id": ..., "done": false}
+  GET   https://operation.api.cloud.yandex.net/operations/<id>  → опрос до done.
+
+У пакетного пути всё своё:
+  - очередь (LLM_BATCH_QUEUE_MAX заданий; переполнение — LLMOverloaded);
+  - бюджет конкурентности (LLM_BATCH_CONCURRENCY операций в работе);
+  - хранилище результатов по id задания (LLM_BATCH_RESULT_TTL сек);
+  - свой ResilientCaller (повторы отправки/опроса, свой breaker) —
+    сбои пакетного API не открывают breaker интерактивных моделей.
+Отправка операции берёт место в общем лимитере классом batch — позади живых
+запросов, со старением и вытеснением, как у всех; опросы места не занимают.
+Пока в лимитере кто-то ждёт (или ждут места в HTTP-пуле), новые операции
+не отправляются: фон уступает живым пользователям, но не дольше
+LLM_BATCH_YIELD_MAX сек на задание — под постоянной нагрузкой очередь фона
+иначе не сдвинулась бы вовсе.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.llm_client import get_llm_client
+from services.llm_errors import LLMBadResponse, LLMError, LLMOverloaded, LLMTimeoutError
+from services.llm_providers import YANDEX_API_KEY, YANDEX_MODEL_URI, YANDEX_TEMPERATURE, YandexProvider
+from services.llm_resilience import ResilientCaller
+from services.rate_limiter import get_rate_limiter, llm_priority
+
+
+# ===================== КОНФИГ =====================
+LLM_BATCH                = os.getenv("LLM_BATCH", "1").strip() not in {"0", "false", "False", ""}
+LLM_BATCH_URL            = os.getenv("LLM_BATCH_URL", "https://llm.api.cloud.yandex.net/foundationModels/v1/completionAsync")
+LLM_BATCH_OPERATIONS_URL = os.getenv("LLM_BATCH_OPERATIONS_URL", "https://operation.api.cloud.yandex.net/operations")
+LLM_BATCH_CONCURRENCY    = int(os.getenv("LLM_BATCH_CONCURRENCY", "4"))       # операций в работе
+LLM_BATCH_QUEUE_MAX      = int(os.getenv("LLM_BATCH_QUEUE_MAX", "1000"))      # заданий в очереди
+LLM_BATCH_POLL           = float(os.getenv("LLM_BATCH_POLL", "1.0"))          # сек до первого опроса
+LLM_BATCH_POLL_MAX       = float(os.getenv("LLM_BATCH_POLL_MAX", "10"))       # потолок паузы между опросами
+LLM_BATCH_TIMEOUT        = float(os.getenv("LLM_BATCH_TIMEOUT", "600"))       # сек на операцию
+LLM_BATCH_RESULT_TTL     = float(os.getenv("LLM_BATCH_RESULT_TTL", "3600"))   # сек хранения результата
+LLM_BATCH_YIELD          = float(os.getenv("LLM_BATCH_YIELD", "0.5"))         # сек паузы, пока ждут интерактивные
+LLM_BATCH_YIELD_MAX      = float(os.getenv("LLM_BATCH_YIELD_MAX", "30"))      # дольше задание не уступает
+
+
+@dataclass
+class BatchStats:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    cancelled: int = 0
+    polls: int = 0
+    yielded: int = 0          # сколько раз уступили интерактивным запросам
+    yield_expired: int = 0    # заданий, отправленных без очереди после LLM_BATCH_YIELD_MAX
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    latency_sum: float = 0.0  # от постановки в очередь до результата
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["latency_avg"] = round(self.latency_sum / self.completed, 3) if self.completed else 0.0
+        data.pop("latency_sum")
+        return data
+
+
+class _Abandoned(Exception):
+    """Результат задания больше никому не нужен (заказчик отменил ожидание)."""
+
+
+class _Job:
+    __slots__ = ("id", "payload", "future", "created")
+
+    def __init__(self, payload: Dict[str, Any], future: "asyncio.Future[str]"):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.future = future
+        self.created = time.monotonic()
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        *,
+        url: str = LLM_BATCH_URL,
+        operations_url: str = LLM_BATCH_OPERATIONS_URL,
+        model_uri: str = YANDEX_MODEL_URI,
+        api_key: str = YANDEX_API_KEY,
+        concurrency: int = LLM_BATCH_CONCURRENCY,
+        queue_max: int = LLM_BATCH_QUEUE_MAX,
+        poll: float = LLM_BATCH_POLL,
+        poll_max: float = LLM_BATCH_POLL_MAX,
+        timeout: float = LLM_BATCH_TIMEOUT,
+        result_ttl: float = LLM_BATCH_RESULT_TTL,
+        yield_max: float = LLM_BATCH_YIELD_MAX,
+        caller: Optional[ResilientCaller] = None,
+    ):
+        self.url = url
+        self.operations_url = operations_url.rstrip("/")
+        self.model_uri = model_uri
+        self.api_key = api_key
+        self.concurrency = max(1, int(concurrency))
+        self.queue_max = max(1, int(queue_max))
+        self.poll = float(poll)
+        self.poll_max = max(self.poll, float(poll_max))
+        self.timeout = float(timeout)
+        self.result_ttl = float(result_ttl)
+        self.yield_max = float(yield_max)
+        self.caller = caller or ResilientCaller(hedge=False)
+        self.stats = BatchStats()
+        # id задания -> (момент готовности, текст или None, ошибка или None)
+        self._results: Dict[str, Tuple[float, Optional[str], Optional[LLMError]]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ---------- очередь и воркеры ----------
+    def _ensure_workers(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue(maxsize=self.queue_max)
+            self._loop = loop
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        return self._queue
+
+    async def _worker(self) -> None:
+        queue = self._queue
+        while True:
+            job: _Job = await queue.get()
+            try:
+                if job.future.done():  # ждать результат уже некому
+                    self.stats.cancelled += 1
+                    continue
+                await self._yield_to_interactive()
+                await self._execute(job)
+            finally:
+                queue.task_done()
+
+    async def _yield_to_interactive(self) -> None:
+        """Не отправляем новую операцию, пока интерактивные запросы ждут места (но не дольше yield_max)."""
+        deadline = time.monotonic() + self.yield_max
+        while get_rate_limiter().limiter_stats()["queue_depth"] or get_llm_client().stats.waiting:
+            if time.monotonic() >= deadline:
+                self.stats.yield_expired += 1
+                return
+            self.stats.yielded += 1
+            await asyncio.sleep(LLM_BATCH_YIELD)
+
+    async def _execute(self, job: _Job) -> None:
+        st = self.stats
+        st.in_flight += 1
+        st.peak_in_flight = max(st.peak_in_flight, st.in_flight)
+        try:
+            text = await asyncio.wait_for(self._submit_and_poll(job), timeout=self.timeout)
+        except _Abandoned:
+            st.cancelled += 1
+        except asyncio.TimeoutError:
+            st.timed_out += 1
+            self._finish(job, None, LLMTimeoutError(f"пакетная операция дольше {self.timeout:.0f} с"))
+        except LLMError as e:
+            st.failed += 1
+            self._finish(job, None, e)
+        else:
+            st.completed += 1
+            st.latency_sum += time.monotonic() - job.created
+            self._finish(job, text, None)
+        finally:
+            st.in_flight -= 1
+
+    def _finish(self, job: _Job, text: Optional[str], error: Optional[LLMError]) -> None:
+        self._prune()
+        self._results[job.id] = (time.monotonic(), text, error)
+        if job.future.done():
+            return
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(text)
+
+    def _prune(self) -> None:
+        border = time.monotonic() - self.result_ttl
+        for job_id in [k for k, (ts, _, _) in self._results.items() if ts < border]:
+            del self._results[job_id]
+
+    # ---------- отложенный API ----------
+    def _headers(self) -> Dict[str, str]:
+        return {"Content-Type": "application/json", "Authorization": f"Api-Key {self.api_key}"}
+
+    async def _submit_and_poll(self, job: _Job) -> str:
+        client = get_llm_client()
+
+        async def submit() -> Dict[str, Any]:
+            with llm_priority("batch"):
+                async with get_rate_limiter().slot():
+                    return await client.post_json(self.url, job.payload, self._headers())
+
+        op = await self.caller.call(submit)
+        op_id = op.get("id")
+        if not op_id:
+            raise LLMBadResponse(f"отложенный API не вернул id операции: {str(op)[:300]}")
+
+        delay = self.poll
+        while not op.get("done"):
+            await asyncio.sleep(delay)
+            if job.future.done():  # заказчик ушёл — дальше не опрашиваем
+                raise _Abandoned()
+            delay = min(self.poll_max, delay * 1.5)
+            self.stats.polls += 1
+            op = await self.caller.call(
+                lambda: client.get_json(f"{self.operations_url}/{op_id}", self._headers())
+            )
+
+        if op.get("error"):
+            raise LLMError(f"пакетная операция {op_id}: {op['error']}")
+        return YandexProvider.extract_text({"result": op.get("response") or {}})
+
+    # ---------- API ----------
+    def build_payload(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        options: Dict[str, Any] = {
+            "stream": False,
+            "temperature": YANDEX_TEMPERATURE if temperature is None else float(temperature),
+        }
+        if max_tokens is not None:
+            options["maxTokens"] = int(max_tokens)
+        return {"modelUri": self.model_uri, "completionOptions": options, "messages": messages}
+
+    def submit(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> Tuple[str, "asyncio.Future[str]"]:
+        """Ставит задание в очередь; (id задания, future с текстом ответа)."""
+        queue = self._ensure_workers()
+        job = _Job(
+            self.build_payload(messages, temperature=temperature, max_tokens=max_tokens),
+            asyncio.get_running_loop().create_future(),
+        )
+        try:
+            queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise LLMOverloaded("очередь пакетных заданий переполнена") from None
+        self.stats.submitted += 1
+        return job.id, job.future
+
+    async def run(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
+        """Отправить и дождаться текста ответа. Ошибки — LLMError."""
+        _, future = self.submit(messages, temperature=temperature, max_tokens=max_tokens)
+        return await future
+
+    def result(self, job_id: str) -> Optional[str]:
+        """Готовый текст задания из хранилища (None — ещё не готово/упало/истекло)."""
+        self._prune()
+        item = self._results.get(job_id)
+        return item[1] if item else None
+
+    def batch_stats(self) -> Dict[str, Any]:
+        data = self.stats.snapshot()
+        data["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        data["stored_results"] = len(self._results)
+        data.update({f"caller_{k}": v for k, v in self.caller.resilience_stats().items()})
+        return data
+
+    async def close(self) -> None:
+        for t in self._workers:
+            t.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._loop = None
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_RUNNER: Optional[BatchRunner] = None
+
+def get_batch_runner() -> BatchRunner:
+    global _RUNNER
+    if _RUNNER is None:
+        _RUNNER = BatchRunner()
+    return _RUNNER
+
+def set_batch_runner(runner: Optional[BatchRunner]) -> None:
+    """Подмена (тесты, локальный стенд)."""
+    global _RUNNER
+    _RUNNER = runner
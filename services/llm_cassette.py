@@ -0,0 +1,172 @@
+# services/llm_cassette.py
+from __future__ import annotations
+
+"""
+Кассета LLM-трафика: запись и воспроизведение пар «промпт → ответ».
+
+Чтобы сравнивать постобработку, кэши и конкурентность на равных, реальные
+ответы модели записываются из tarot_ai._post_messages / _stream_messages
+в сжатый файл (gzip, JSON по строке) вместе с задержкой вызова. В режиме
+воспроизведения те же промпты получают те же ответы без сети — прогон
+gpt_make_prediction целиком повторяем офлайн и сравним между коммитами.
+
+    LLM_CASSETTE=record  — ответы идут из LLM и дописываются в LLM_CASSETTE_PATH;
+    LLM_CASSETTE=replay  — ответы только из кассеты; промпта нет — LLMCassetteMiss;
+    LLM_CASSETTE_LATENCY — множитель записанной задержки при воспроизведении
+                           (0 — мгновенно, 1 — как в записи).
+
+Ключ — тип вызова + сообщения (без maxTokens/temperature: профили
+подстраиваются между прогонами, а промпт — нет). На один ключ может быть
+несколько записей — воспроизводятся по кругу в порядке записи.
+"""
+
+import os
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from services.llm_errors import LLMCassetteMiss
+
+
+# ===================== КОНФИГ =====================
+LLM_CASSETTE         = os.getenv("LLM_CASSETTE", "").strip().lower()   # "" | record | replay
+LLM_CASSETTE_PATH    = os.getenv(
+    "LLM_CASSETTE_PATH", str(Path(__file__).resolve().parent.parent / "data" / "llm_cassette.jsonl.gz")
+)
+LLM_CASSETTE_LATENCY = float(os.getenv("LLM_CASSETTE_LATENCY", "0"))
+
+
+@dataclass
+class CassetteStats:
+    loaded: int = 0      # записей прочитано с диска
+    recorded: int = 0    # дописано за этот запуск
+    hits: int = 0
+    misses: int = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def cassette_key(kind: str, messages: List[Dict[str, str]]) -> str:
+    raw = json.dumps([kind, messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str, *, latency_scale: float = LLM_CASSETTE_LATENCY):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"режим кассеты: record или replay, не {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = max(0.0, float(latency_scale))
+        self.stats = CassetteStats()
+        # ключ -> записи {"text", "latency", ...}; курсор — следующая для воспроизведения
+        self._tapes: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._out = None
+        if mode == "replay":
+            self._load()
+
+    # ---------- диск ----------
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    rec = json.loads(line)
+                    self._tapes.setdefault(rec["key"], []).append(rec)
+                    self.stats.loaded += 1
+        except (EOFError, json.JSONDecodeError):
+            # запись прервали посреди строки — всё прочитанное до неё годно
+            pass
+
+    def _append(self, rec: Dict[str, Any]) -> None:
+        if self._out is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._out = gzip.open(self.path, "at", encoding="utf-8")
+        self._out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._out.flush()  # Z_SYNC_FLUSH: после падения читается всё до последней записи
+        self.stats.recorded += 1
+
+    # ---------- запись/воспроизведение ----------
+    def _record(self, key: str, kind: str, messages: List[Dict[str, str]], text: str, latency: float, **extra: Any) -> None:
+        self._append({
+            "key": key, "kind": kind, "messages": messages, "text": text,
+            "latency": round(latency, 3), "ts": int(time.time()), **extra,
+        })
+
+    async def _replay(self, key: str) -> str:
+        tape = self._tapes.get(key)
+        if not tape:
+            self.stats.misses += 1
+            raise LLMCassetteMiss(f"нет записи в кассете {self.path} (ключ {key[:12]})")
+        self.stats.hits += 1
+        i = self._cursor.get(key, 0)
+        self._cursor[key] = i + 1
+        rec = tape[i % len(tape)]
+        if self.latency_scale:
+            await asyncio.sleep(rec.get("latency", 0.0) * self.latency_scale)
+        return rec["text"]
+
+    async def through(
+        self,
+        kind: str,
+        messages: List[Dict[str, str]],
+        call: Callable[[], Awaitable[str]],
+        **extra: Any,
+    ) -> str:
+        """replay — ответ из кассеты; record — вызов call() с записью ответа и задержки."""
+        key = cassette_key(kind, messages)
+        if self.mode == "replay":
+            return await self._replay(key)
+        t0 = time.monotonic()
+        text = await call()
+        self._record(key, kind, messages, text, time.monotonic() - t0, **extra)
+        return text
+
+    def replay(self, kind: str, messages: List[Dict[str, str]]) -> Awaitable[str]:
+        """Ответ из кассеты в обход through() (стриминг — целиком, одним куском)."""
+        return self._replay(cassette_key(kind, messages))
+
+    def record(self, kind: str, messages: List[Dict[str, str]], text: str, latency: float, **extra: Any) -> None:
+        """Записать ответ, полученный в обход through() (стриминг)."""
+        self._record(cassette_key(kind, messages), kind, messages, text, latency, **extra)
+
+    def cassette_stats(self) -> Dict[str, Any]:
+        data = self.stats.snapshot()
+        data["mode"] = self.mode
+        data["keys"] = len(self._tapes)
+        return data
+
+    def close(self) -> None:
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_CASSETTE: Optional[Cassette] = None
+_CASSETTE_TRIED = False
+
+def get_cassette() -> Optional[Cassette]:
+    """Кассета по LLM_CASSETTE; None — запись/воспроизведение выключены."""
+    global _CASSETTE, _CASSETTE_TRIED
+    if not _CASSETTE_TRIED:
+        _CASSETTE_TRIED = True
+        if LLM_CASSETTE in ("record", "replay"):
+            _CASSETTE = Cassette(LLM_CASSETTE_PATH, LLM_CASSETTE)
+            print(f"[cassette] {LLM_CASSETTE}: {LLM_CASSETTE_PATH} ({_CASSETTE.stats.loaded} записей)")
+        elif LLM_CASSETTE:
+            print(f"[cassette] неизвестный режим LLM_CASSETTE={LLM_CASSETTE!r} — выключено")
+    return _CASSETTE
+
+def set_cassette(cassette: Optional[Cassette]) -> None:
+    """Подмена (тесты, бенчмарки)."""
+    global _CASSETTE, _CASSETTE_TRIED
+    _CASSETTE, _CASSETTE_TRIED = cassette, True
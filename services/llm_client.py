@@ -0,0 +1,212 @@
+# services/llm_client.py
+from __future__ import annotations
+
+"""
+Асинхронный HTTP-клиент для LLM-эндпоинтов (Яндекс и совместимые).
+
+Вместо синхронного requests.post в asyncio.to_thread:
+  - один aiohttp.ClientSession с keep-alive пулом соединений;
+  - потолок одновременных запросов (семафор), остальные ждут в очереди;
+  - отмена корутины (asyncio.wait_for в хендлерах) реально обрывает запрос
+    и освобождает соединение, а не оставляет висящий поток;
+  - счётчики пула для /llm_stats.
+"""
+
+import os
+import json
+import time
+import asyncio
+import contextlib
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aiohttp
+
+
+# ===================== КОНФИГ =====================
+LLM_HTTP_POOL_SIZE       = int(os.getenv("LLM_HTTP_POOL_SIZE", "32"))        # макс. открытых соединений
+LLM_HTTP_MAX_CONCURRENCY = int(os.getenv("LLM_HTTP_MAX_CONCURRENCY", "16"))  # макс. запросов одновременно
+LLM_HTTP_TIMEOUT         = float(os.getenv("LLM_HTTP_TIMEOUT", "60"))        # общий таймаут запроса, сек
+LLM_HTTP_KEEPALIVE       = float(os.getenv("LLM_HTTP_KEEPALIVE", "30"))      # keep-alive простаивающего соединения, сек
+
+
+@dataclass
+class PoolStats:
+    requests_total: int = 0
+    requests_ok: int = 0
+    requests_failed: int = 0
+    requests_cancelled: int = 0
+    in_flight: int = 0
+    waiting: int = 0
+    peak_in_flight: int = 0
+    latency_sum: float = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = asdict(self)
+        done = self.requests_ok + self.requests_failed
+        data["latency_avg"] = round(self.latency_sum / done, 3) if done else 0.0
+        data.pop("latency_sum")
+        return data
+
+
+class LLMHttpClient:
+    """
+    Пул соединений + ограничитель конкурентности поверх aiohttp.
+    Сессия создаётся лениво и привязана к текущему event loop
+    (если loop сменился — например, в тестах — пересоздаём).
+    """
+
+    def __init__(
+        self,
+        *,
+        pool_size: int = LLM_HTTP_POOL_SIZE,
+        max_concurrency: int = LLM_HTTP_MAX_CONCURRENCY,
+        timeout: float = LLM_HTTP_TIMEOUT,
+        keepalive: float = LLM_HTTP_KEEPALIVE,
+    ):
+        self.pool_size = max(1, int(pool_size))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout = float(timeout)
+        self.keepalive = float(keepalive)
+        self.stats = PoolStats()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=self.keepalive,
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._session
+
+    @contextlib.asynccontextmanager
+    async def _slot(self):
+        """Место в пуле: ждём семафор, считаем in-flight/латентность/исходы."""
+        session = self._ensure_session()
+        sem = self._sem
+        st = self.stats
+        st.waiting += 1
+        try:
+            await sem.acquire()
+        finally:
+            st.waiting -= 1
+
+        st.requests_total += 1
+        st.in_flight += 1
+        st.peak_in_flight = max(st.peak_in_flight, st.in_flight)
+        t0 = time.monotonic()
+        try:
+            yield session
+            st.requests_ok += 1
+            st.latency_sum += time.monotonic() - t0
+        except (asyncio.CancelledError, GeneratorExit):
+            st.requests_cancelled += 1
+            raise
+        except Exception:
+            st.requests_failed += 1
+            st.latency_sum += time.monotonic() - t0
+            raise
+        finally:
+            st.in_flight -= 1
+            sem.release()
+
+    async def post_json(
+        self,
+        url: str,
+        payload: Dict[str, Any],
+        headers: Dict[str, str],
+        *,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        POST с JSON-телом, возвращает разобранный JSON.
+        Ошибки HTTP — aiohttp.ClientResponseError, сеть — aiohttp.ClientError,
+        таймаут — asyncio.TimeoutError. При отмене соединение закрывается.
+        """
+        req_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        async with self._slot() as session:
+            async with session.post(url, json=payload, headers=headers, timeout=req_timeout) as resp:
+                resp.raise_for_status()
+                return await resp.json(content_type=None)
+
+    async def get_json(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        *,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """GET → разобранный JSON (опрос отложенных операций). Ошибки — как у post_json."""
+        req_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        async with self._slot() as session:
+            async with session.get(url, headers=headers, timeout=req_timeout) as resp:
+                resp.raise_for_status()
+                return await resp.json(content_type=None)
+
+    async def stream_json_lines(
+        self,
+        url: str,
+        payload: Dict[str, Any],
+        headers: Dict[str, str],
+        *,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        POST со стриминговым ответом: тело — JSON-объекты, по одному на строку
+        (так отвечает Яндекс при completionOptions.stream=true).
+        Слот пула занят, пока генератор не дочитан или не закрыт.
+        """
+        req_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        async with self._slot() as session:
+            async with session.post(url, json=payload, headers=headers, timeout=req_timeout) as resp:
+                resp.raise_for_status()
+                async for raw in resp.content:
+                    line = raw.strip()
+                    if not line:
+                        continue
+                    yield json.loads(line)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        data = self.stats.snapshot()
+        data["max_concurrency"] = self.max_concurrency
+        data["pool_size"] = self.pool_size
+        conn = self._session.connector if self._session and not self._session.closed else None
+        if conn is not None:
+            # приватные поля aiohttp: занятые и простаивающие keep-alive соединения
+            data["connections_acquired"] = len(getattr(conn, "_acquired", ()))
+            data["connections_idle"] = sum(len(v) for v in getattr(conn, "_conns", {}).values())
+        else:
+            data["connections_acquired"] = 0
+            data["connections_idle"] = 0
+        return data
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._sem = None
+        self._loop = None
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_CLIENT: Optional[LLMHttpClient] = None
+
+def get_llm_client() -> LLMHttpClient:
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = LLMHttpClient()
+    return _CLIENT
+
+async def close_llm_client() -> None:
+    if _CLIENT is not None:
+        await _CLIENT.close()
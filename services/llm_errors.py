@@ -0,0 +1,122 @@
+# services/llm_errors.py
+from __future__ import annotations
+
+"""
+Типизированные ошибки LLM-слоя.
+
+Раньше _post_messages возвращал строку «Сетевая ошибка: …» вместо ответа, и она
+уходила пользователю как толкование. Теперь вызов либо возвращает текст модели,
+либо бросает LLMError; хендлеры сами выбирают фолбэк.
+
+Флаги на экземпляре:
+  - retryable      — имеет смысл повторить запрос (сеть, таймаут, 5xx, 429);
+  - breaker_failure — признак «провайдер лежит» для circuit breaker
+                      (429 и наша очередь — это перегрузка, а не отказ);
+  - retry_after    — пауза из заголовка Retry-After, сек (если была).
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+import aiohttp
+
+
+class LLMError(Exception):
+    retryable: bool = False
+    breaker_failure: bool = False
+
+    def __init__(self, message: str = "", *, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMConfigError(LLMError):
+    """Не настроен ключ/модель — повторять бессмысленно."""
+
+
+class LLMBadResponse(LLMError):
+    """Ответ пришёл, но текста в нём нет."""
+
+
+class LLMCassetteMiss(LLMError):
+    """Воспроизведение кассеты: для промпта нет записи (services/llm_cassette.py)."""
+
+
+class LLMNetworkError(LLMError):
+    retryable = True
+    breaker_failure = True
+
+
+class LLMTimeoutError(LLMError):
+    retryable = True
+    breaker_failure = True
+
+
+class LLMHTTPError(LLMError):
+    def __init__(self, status: int, message: str = "", *, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status} {message}".strip(), retry_after=retry_after)
+        self.status = status
+        self.retryable = status >= 500 or status == 408
+        self.breaker_failure = status >= 500
+
+
+class LLMOverloaded(LLMError):
+    """Провайдер перегружен (429/503) или наша очередь к нему переполнена."""
+
+    def __init__(
+        self,
+        message: str = "",
+        *,
+        retry_after: Optional[float] = None,
+        retryable: bool = False,
+        status: Optional[int] = None,
+    ):
+        super().__init__(message, retry_after=retry_after)
+        self.retryable = retryable
+        self.breaker_failure = status == 503
+        self.status = status
+
+
+class LLMCircuitOpen(LLMOverloaded):
+    """Провайдер недавно падал подряд — запрос не отправляем (fail fast)."""
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Retry-After: секунды или HTTP-дата → пауза в секундах."""
+    if not headers:
+        return None
+    value = (headers.get("Retry-After") or "").strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def as_llm_error(e: BaseException) -> LLMError:
+    """Исключение транспорта (aiohttp/asyncio) → типизированная LLMError."""
+    if isinstance(e, LLMError):
+        return e
+    if isinstance(e, aiohttp.ClientResponseError):
+        retry_after = parse_retry_after(e.headers)
+        if e.status in (429, 503):
+            return LLMOverloaded(
+                f"HTTP {e.status} {e.message}".strip(),
+                retry_after=retry_after, retryable=True, status=e.status,
+            )
+        return LLMHTTPError(e.status, e.message or "", retry_after=retry_after)
+    if isinstance(e, asyncio.TimeoutError):
+        return LLMTimeoutError(f"таймаут запроса: {e!r}")
+    if isinstance(e, aiohttp.ClientError):
+        return LLMNetworkError(f"сетевая ошибка: {e!r}")
+    return LLMError(f"неожиданная ошибка: {e!r}")
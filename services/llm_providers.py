@@ -0,0 +1,485 @@
+# services/llm_providers.py
+from __future__ import annotations
+
+"""
+Провайдеры LLM и маршрутизатор между ними.
+
+Провайдер — объект с методами complete()/stream() над списком сообщений
+[{"role": ..., "text": ...}]. Бэкенды:
+  - yandex-lite / yandex-pro — completion API Яндекса (лимитер, повторы,
+    хеджирование и свой circuit breaker у каждой модели);
+  - qwen-local — локальная Qwen2.5-0.5B в отдельном процессе-воркере с батчингом
+    (services/qwen_worker.py), включается LLM_QWEN_LOCAL=1;
+  - template — мгновенный ответ по значениям карт (services/template_engine.py, без сети).
+
+Маршрут задаётся по типу вызова (prediction/point/daily/summary/advice/scenario):
+LLM_ROUTE_<ТИП>="yandex-lite,yandex-pro,qwen-local". Порядок — предпочтение,
+но «деградировавшие» провайдеры (breaker не закрыт, частые ошибки, медленные
+ответы по EWMA) уходят в конец списка; раз в LLM_ROUTER_RECHECK сек такой
+провайдер снова получает шанс. Здоровье считается по паре (провайдер, тип вызова):
+длинное предсказание не должно делать провайдера «медленным» для коротких советов.
+Для стрима отдельно копится время до первого куска (порог LLM_ROUTER_SLOW_TTFT_SEC),
+для обычных вызовов — полное время ответа.
+
+Ошибка провайдера — переход к следующему. Кроме отказа нашей же очереди
+(лимитер, очередь воркера, открытый breaker — LLMOverloaded без HTTP-статуса):
+следующий провайдер встал бы в ту же очередь, поэтому ошибка уходит вызывающему.
+"""
+
+import os
+import time
+import json
+import contextlib
+import importlib.util
+from dataclasses import dataclass, asdict, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from services.llm_client import get_llm_client
+from services.llm_errors import LLMBadResponse, LLMConfigError, LLMError, LLMOverloaded
+from services.llm_resilience import ResilientCaller
+from services.rate_limiter import get_rate_limiter
+from services.template_engine import render_reading
+
+
+# ===================== КОНФИГ ЯНДЕКС LLM =====================
+YANDEX_API_KEY       = os.getenv("YANDEX_API_KEY", "AQVN08pz8w3rwgGBwMpoZfsIwYH4CsIU2OzCOHzN").strip()
+YANDEX_MODEL_URI     = os.getenv("YANDEX_MODEL_URI", "gpt://b1gvsrda7nthhjboi2hm/yandexgpt-lite").strip()
+YANDEX_MODEL_URI_PRO = os.getenv("YANDEX_MODEL_URI_PRO", YANDEX_MODEL_URI.replace("yandexgpt-lite", "yandexgpt")).strip()
+YANDEX_URL           = os.getenv("YANDEX_URL", "https://llm.api.cloud.yandex.net/foundationModels/v1/completion").strip()
+YANDEX_TEMPERATURE   = float(os.getenv("YANDEX_TEMPERATURE", "0.7"))
+YANDEX_MAX_TOKENS    = int(os.getenv("YANDEX_MAX_TOKENS", "2000"))
+
+# ===================== КОНФИГ МАРШРУТИЗАЦИИ =====================
+LLM_QWEN_LOCAL        = os.getenv("LLM_QWEN_LOCAL", "0").strip() not in {"0", "false", "False", ""}
+LLM_QWEN_MODEL        = os.getenv("LLM_QWEN_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
+LLM_ROUTE_DEFAULT     = os.getenv("LLM_ROUTE_DEFAULT", "yandex-lite,yandex-pro,qwen-local")
+LLM_ROUTER_SLOW_SEC   = float(os.getenv("LLM_ROUTER_SLOW_SEC", "20"))    # EWMA латентности выше — «медленный»
+LLM_ROUTER_SLOW_TTFT_SEC = float(os.getenv("LLM_ROUTER_SLOW_TTFT_SEC", "6"))  # то же для первого куска стрима
+LLM_ROUTER_ERROR_RATE = float(os.getenv("LLM_ROUTER_ERROR_RATE", "0.5")) # EWMA доли ошибок выше — «сбоит»
+LLM_ROUTER_RECHECK    = float(os.getenv("LLM_ROUTER_RECHECK", "60"))     # сек до повторной проверки
+_EWMA_ALPHA = 0.2        # латентность
+_EWMA_ALPHA_ERRORS = 0.5 # доля ошибок: два отказа подряд — уже «сбоит»
+
+CALL_KINDS = ("prediction", "point", "daily", "summary", "advice", "scenario")
+
+
+def _ewma(current: Optional[float], sample: float, alpha: float) -> float:
+    return sample if current is None else current + alpha * (sample - current)
+
+
+@dataclass
+class KindHealth:
+    """Здоровье провайдера на одном типе вызова."""
+    ewma_latency: Optional[float] = None  # полное время ответа complete()
+    ewma_ttft: Optional[float] = None     # время до первого куска stream()
+    ewma_errors: float = 0.0
+    last_call: float = 0.0
+
+    def observe(self, ok: bool, latency: Optional[float] = None, ttft: Optional[float] = None) -> None:
+        self.last_call = time.monotonic()
+        self.ewma_errors += _EWMA_ALPHA_ERRORS * ((0.0 if ok else 1.0) - self.ewma_errors)
+        if latency is not None:
+            self.ewma_latency = _ewma(self.ewma_latency, latency, _EWMA_ALPHA)
+        if ttft is not None:
+            self.ewma_ttft = _ewma(self.ewma_ttft, ttft, _EWMA_ALPHA)
+
+
+@dataclass
+class ProviderStats:
+    calls: int = 0
+    ok: int = 0
+    failed: int = 0
+    failovers_from: int = 0
+    kinds: Dict[str, KindHealth] = field(default_factory=dict)
+
+    def health(self, kind: str) -> KindHealth:
+        h = self.kinds.get(kind)
+        if h is None:
+            h = self.kinds[kind] = KindHealth()
+        return h
+
+    def observe(self, kind: str, ok: bool, latency: Optional[float] = None, ttft: Optional[float] = None) -> None:
+        self.calls += 1
+        if ok:
+            self.ok += 1
+        else:
+            self.failed += 1
+        self.health(kind).observe(ok, latency, ttft)
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("kinds")
+        for kind, h in self.kinds.items():
+            if h.ewma_latency is not None:
+                data[f"latency_{kind}"] = round(h.ewma_latency, 3)
+            if h.ewma_ttft is not None:
+                data[f"ttft_{kind}"] = round(h.ewma_ttft, 3)
+            data[f"errors_{kind}"] = round(h.ewma_errors, 3)
+        return data
+
+
+# ===================== ПРОВАЙДЕРЫ =====================
+class LLMProvider:
+    """Базовый провайдер. Ошибки — только LLMError."""
+
+    supports_stream = False
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stats = ProviderStats()
+
+    def available(self) -> bool:
+        return True
+
+    def breaker_open(self) -> bool:
+        return False
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        hints: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        raise NotImplementedError
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        hints: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """По умолчанию — один кусок с полным ответом."""
+        yield await self.complete(messages, temperature=temperature, max_tokens=max_tokens, hints=hints)
+
+    def provider_stats(self) -> Dict[str, Any]:
+        return self.stats.snapshot()
+
+    def close(self) -> None:
+        """Освободить ресурсы провайдера (процессы, модели) при остановке бота."""
+
+
+class YandexProvider(LLMProvider):
+    supports_stream = True
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        model_uri: str,
+        url: str = YANDEX_URL,
+        api_key: str = YANDEX_API_KEY,
+        caller: Optional[ResilientCaller] = None,
+    ):
+        super().__init__(name)
+        self.model_uri = model_uri
+        self.url = url
+        self.api_key = api_key
+        self.caller = caller or ResilientCaller()
+
+    def available(self) -> bool:
+        return bool(self.model_uri and self.url)
+
+    def breaker_open(self) -> bool:
+        return self.caller.breaker.state != self.caller.breaker.CLOSED
+
+    def _headers(self) -> Dict[str, str]:
+        if not self.api_key:
+            raise LLMConfigError("Не задан YANDEX_API_KEY (переменная окружения).")
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Api-Key {self.api_key}",
+        }
+
+    def build_payload(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stream: bool = False,
+    ) -> Dict[str, Any]:
+        return {
+            "modelUri": self.model_uri,
+            "completionOptions": {
+                "stream": bool(stream),
+                "temperature": YANDEX_TEMPERATURE if temperature is None else float(temperature),
+                "maxTokens": YANDEX_MAX_TOKENS if max_tokens is None else int(max_tokens),
+            },
+            "messages": messages,
+        }
+
+    @staticmethod
+    def extract_text(data: Dict[str, Any]) -> str:
+        try:
+            alts = data["result"]["alternatives"]
+            if alts:
+                msg = alts[0].get("message", {})
+                txt = msg.get("text")
+                if isinstance(txt, str) and txt.strip():
+                    return txt.strip()
+                txt2 = alts[0].get("text")
+                if isinstance(txt2, str) and txt2.strip():
+                    return txt2.strip()
+        except Exception:
+            pass
+        raise LLMBadResponse(f"в ответе нет текста: {json.dumps(data, ensure_ascii=False)[:300]}")
+
+    async def _post_once(self, payload: Dict[str, Any]) -> str:
+        """Одна попытка: место в лимитере + HTTP-запрос."""
+        headers = self._headers()
+        async with get_rate_limiter().slot():
+            data = await get_llm_client().post_json(self.url, payload, headers)
+        return self.extract_text(data)
+
+    async def complete(self, messages, *, temperature=None, max_tokens=None, hints=None) -> str:
+        payload = self.build_payload(messages, temperature=temperature, max_tokens=max_tokens)
+        return await self.caller.call(lambda: self._post_once(payload))
+
+    async def stream(self, messages, *, temperature=None, max_tokens=None, hints=None) -> AsyncIterator[str]:
+        """НАКОПЛЕННЫЙ текст по мере генерации (Яндекс шлёт весь текст с начала)."""
+        payload = self.build_payload(messages, temperature=temperature, max_tokens=max_tokens, stream=True)
+
+        async def _once() -> AsyncIterator[str]:
+            headers = self._headers()
+            last = ""
+            async with get_rate_limiter().slot(track_latency=False), contextlib.aclosing(
+                get_llm_client().stream_json_lines(self.url, payload, headers)
+            ) as chunks:
+                async for data in chunks:
+                    try:
+                        txt = data["result"]["alternatives"][0]["message"]["text"]
+                    except (KeyError, IndexError, TypeError):
+                        continue
+                    if isinstance(txt, str) and txt != last:
+                        last = txt
+                        yield txt
+
+        async with contextlib.aclosing(self.caller.stream(_once)) as texts:
+            async for txt in texts:
+                yield txt
+
+    def provider_stats(self) -> Dict[str, Any]:
+        data = super().provider_stats()
+        data.update(self.caller.resilience_stats())
+        return data
+
+
+class QwenLocalProvider(LLMProvider):
+    """
+    Локальная Qwen в отдельном процессе с динамическим батчингом
+    (services/qwen_worker.py). Процесс поднимается при первом вызове.
+    """
+
+    def __init__(self, name: str = "qwen-local", *, model_name: str = LLM_QWEN_MODEL, enabled: bool = LLM_QWEN_LOCAL):
+        super().__init__(name)
+        self.model_name = model_name
+        self.enabled = enabled
+        self._worker = None
+
+    def available(self) -> bool:
+        return self.enabled and importlib.util.find_spec("transformers") is not None
+
+    def _client(self):
+        if self._worker is None:
+            from services.qwen_worker import QwenWorkerClient
+            self._worker = QwenWorkerClient(self.model_name)
+        return self._worker
+
+    async def complete(self, messages, *, temperature=None, max_tokens=None, hints=None) -> str:
+        if not self.available():
+            raise LLMConfigError("локальная Qwen выключена (LLM_QWEN_LOCAL) или нет transformers")
+        return await self._client().generate(
+            messages,
+            max_tokens=min(512, max_tokens or 512),
+            temperature=YANDEX_TEMPERATURE if temperature is None else float(temperature),
+        )
+
+    def provider_stats(self) -> Dict[str, Any]:
+        data = super().provider_stats()
+        if self._worker is not None:
+            data.update({f"worker_{k}": v for k, v in self._worker.worker_stats().items()})
+        return data
+
+    def close(self) -> None:
+        if self._worker is not None:
+            self._worker.close()
+
+
+class TemplateProvider(LLMProvider):
+    """
+    Ответ без модели — по значениям карт (hints["cards"], тема — hints["theme"]),
+    см. services/template_engine.py. Годится как последний рубеж, поэтому
+    в маршруты по умолчанию не входит: его тексты не должны попадать в кэш
+    толкований наравне с ответами модели.
+    """
+
+    def __init__(self, name: str = "template"):
+        super().__init__(name)
+
+    async def complete(self, messages, *, temperature=None, max_tokens=None, hints=None) -> str:
+        cards = (hints or {}).get("cards") or []
+        if not cards:
+            raise LLMBadResponse("шаблонному провайдеру не переданы карты")
+        return render_reading(cards, theme=(hints or {}).get("theme"))
+
+
+# ===================== МАРШРУТИЗАТОР =====================
+class ProviderRouter:
+    def __init__(
+        self,
+        providers: List[LLMProvider],
+        *,
+        routes: Optional[Dict[str, List[str]]] = None,
+        default_route: Optional[List[str]] = None,
+        slow_sec: float = LLM_ROUTER_SLOW_SEC,
+        slow_ttft_sec: float = LLM_ROUTER_SLOW_TTFT_SEC,
+        error_rate: float = LLM_ROUTER_ERROR_RATE,
+        recheck: float = LLM_ROUTER_RECHECK,
+    ):
+        self.providers: Dict[str, LLMProvider] = {p.name: p for p in providers}
+        self.routes = routes or {}
+        self.default_route = default_route or list(self.providers)
+        self.slow_sec = float(slow_sec)
+        self.slow_ttft_sec = float(slow_ttft_sec)
+        self.error_rate = float(error_rate)
+        self.recheck = float(recheck)
+        self.failovers = 0
+        self.local_rejects = 0
+
+    def _degraded(self, p: LLMProvider, kind: str) -> bool:
+        if p.breaker_open():
+            return True
+        h = p.stats.kinds.get(kind)
+        if h is None or time.monotonic() - h.last_call > self.recheck:
+            return False  # давно не спрашивали — даём шанс
+        return (
+            h.ewma_errors > self.error_rate
+            or (h.ewma_latency or 0.0) > self.slow_sec
+            or (h.ewma_ttft or 0.0) > self.slow_ttft_sec
+        )
+
+    @staticmethod
+    def _local_reject(e: LLMError) -> bool:
+        """Отказ нашей очереди/breaker'а (без HTTP-статуса) — другой провайдер тут не поможет."""
+        return isinstance(e, LLMOverloaded) and e.status is None
+
+    def candidates(self, kind: str) -> List[LLMProvider]:
+        names = self.routes.get(kind) or self.default_route
+        chain = [self.providers[n] for n in names if n in self.providers and self.providers[n].available()]
+        healthy = [p for p in chain if not self._degraded(p, kind)]
+        return healthy + [p for p in chain if p not in healthy]
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        kind: str = "default",
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        hints: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        chain = self.candidates(kind)
+        if not chain:
+            raise LLMConfigError(f"нет доступных провайдеров для «{kind}»")
+        for i, p in enumerate(chain):
+            t0 = time.monotonic()
+            try:
+                text = await p.complete(messages, temperature=temperature, max_tokens=max_tokens, hints=hints)
+            except LLMError as e:
+                if self._local_reject(e):
+                    self.local_rejects += 1
+                    raise
+                p.stats.observe(kind, False)
+                if i == len(chain) - 1:
+                    raise
+                p.stats.failovers_from += 1
+                self.failovers += 1
+                continue
+            p.stats.observe(kind, True, latency=time.monotonic() - t0)
+            return text
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        kind: str = "default",
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        hints: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """Стрим с переходом к следующему провайдеру, пока ничего не отдано."""
+        chain = self.candidates(kind)
+        if not chain:
+            raise LLMConfigError(f"нет доступных провайдеров для «{kind}»")
+        for i, p in enumerate(chain):
+            t0 = time.monotonic()
+            first_at: Optional[float] = None
+            try:
+                async with contextlib.aclosing(p.stream(messages, temperature=temperature, max_tokens=max_tokens, hints=hints)) as texts:
+                    async for txt in texts:
+                        if first_at is None:
+                            first_at = time.monotonic() - t0
+                        yield txt
+            except LLMError as e:
+                if self._local_reject(e):
+                    self.local_rejects += 1
+                    raise
+                p.stats.observe(kind, False)
+                if first_at is not None or i == len(chain) - 1:
+                    raise
+                p.stats.failovers_from += 1
+                self.failovers += 1
+                continue
+            # полное время стрима зависит от того, как быстро читает вызывающий, — копим только TTFT
+            p.stats.observe(kind, True, ttft=first_at)
+            return
+
+    def close(self) -> None:
+        for p in self.providers.values():
+            p.close()
+
+    def router_stats(self) -> Dict[str, Dict[str, Any]]:
+        data: Dict[str, Dict[str, Any]] = {
+            "router": {
+                "failovers": self.failovers,
+                "local_rejects": self.local_rejects,
+                **{f"route_{k}": ",".join(p.name for p in self.candidates(k)) for k in CALL_KINDS},
+            }
+        }
+        for name, p in self.providers.items():
+            if p.stats.calls or p.available():
+                data[f"provider:{name}"] = p.provider_stats()
+        return data
+
+
+def _route_from_env(kind: str) -> List[str]:
+    raw = os.getenv(f"LLM_ROUTE_{kind.upper()}", LLM_ROUTE_DEFAULT)
+    return [x.strip() for x in raw.split(",") if x.strip()]
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_ROUTER: Optional[ProviderRouter] = None
+
+def get_router() -> ProviderRouter:
+    global _ROUTER
+    if _ROUTER is None:
+        _ROUTER = ProviderRouter(
+            [
+                YandexProvider("yandex-lite", model_uri=YANDEX_MODEL_URI),
+                YandexProvider("yandex-pro", model_uri=YANDEX_MODEL_URI_PRO),
+                QwenLocalProvider(),
+                TemplateProvider(),
+            ],
+            routes={k: _route_from_env(k) for k in CALL_KINDS},
+            default_route=_route_from_env("default"),
+        )
+    return _ROUTER
+
+def set_router(router: Optional[ProviderRouter]) -> None:
+    """Подмена маршрутизатора (тесты, локальный стенд)."""
+    global _ROUTER
+    _ROUTER = router
@@ -0,0 +1,269 @@
+# services/llm_resilience.py
+from __future__ import annotations
+
+"""
+Устойчивость LLM-вызовов: повторы, хеджирование, circuit breaker.
+
+  - Повторы: только для retryable-ошибок (сеть, таймаут, 5xx, 429); пауза —
+    Retry-After провайдера, иначе экспонента с полным джиттером. Если провайдер
+    просит ждать дольше LLM_RETRY_AFTER_MAX — не ждём, отдаём ошибку сразу.
+  - Хеджирование: если запрос не ответил за p95 последних успешных запросов,
+    параллельно отправляем второй такой же и берём первый пришедший ответ
+    (второй отменяется). Включается, когда накоплено LLM_HEDGE_MIN_SAMPLES замеров.
+  - Circuit breaker: после LLM_BREAKER_FAILURES отказов подряд (сеть/таймаут/5xx)
+    запросы LLM_BREAKER_COOLDOWN сек не отправляются вовсе — LLMCircuitOpen
+    сразу, без ожидания таймаутов в хендлерах. Затем один пробный запрос:
+    успех закрывает breaker, отказ — снова открывает.
+"""
+
+import os
+import time
+import random
+import asyncio
+import contextlib
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from services.llm_errors import LLMCircuitOpen, LLMError, as_llm_error
+
+T = TypeVar("T")
+
+
+# ===================== КОНФИГ =====================
+LLM_RETRY_ATTEMPTS     = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))          # всего попыток
+LLM_RETRY_BASE         = float(os.getenv("LLM_RETRY_BASE", "0.5"))          # сек, база экспоненты
+LLM_RETRY_CAP          = float(os.getenv("LLM_RETRY_CAP", "4"))             # сек, потолок паузы
+LLM_RETRY_AFTER_MAX    = float(os.getenv("LLM_RETRY_AFTER_MAX", "10"))      # дольше — не ждём
+LLM_HEDGE              = os.getenv("LLM_HEDGE", "1").strip() not in {"0", "false", "False", ""}
+LLM_HEDGE_MIN_SAMPLES  = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_WINDOW       = int(os.getenv("LLM_HEDGE_WINDOW", "200"))          # замеров для p95
+LLM_BREAKER_FAILURES   = int(os.getenv("LLM_BREAKER_FAILURES", "5"))        # отказов подряд
+LLM_BREAKER_COOLDOWN   = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))     # сек в открытом состоянии
+
+
+class LatencyTracker:
+    """Скользящее окно латентностей успешных запросов."""
+
+    def __init__(self, window: int = LLM_HEDGE_WINDOW, min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self._samples: Deque[float] = deque(maxlen=max(1, int(window)))
+        self.min_samples = max(1, int(min_samples))
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(float(seconds))
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[idx]
+
+    def p95(self) -> Optional[float]:
+        return self.percentile(0.95)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.threshold = max(1, int(failures))
+        self.cooldown = float(cooldown)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.fast_failures = 0
+        self._probe = False
+
+    def before_call(self) -> None:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                self.fast_failures += 1
+                raise LLMCircuitOpen("LLM временно недоступна (circuit open)")
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe:
+                self.fast_failures += 1
+                raise LLMCircuitOpen("LLM временно недоступна (идёт пробный запрос)")
+            self._probe = True
+
+    def on_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe = False
+
+    def on_failure(self, e: LLMError) -> None:
+        was_probe, self._probe = self._probe, False
+        if not e.breaker_failure:
+            return
+        self.failures += 1
+        if was_probe or self.failures >= self.threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.opens += 1
+
+    def on_cancel(self) -> None:
+        # пробный запрос отменили снаружи — следующий вызов сможет пробовать снова
+        self._probe = False
+
+
+@dataclass
+class ResilienceStats:
+    calls: int = 0
+    attempts: int = 0
+    retries: int = 0
+    retry_after_honored: int = 0
+    gave_up: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ResilientCaller:
+    def __init__(
+        self,
+        *,
+        attempts: int = LLM_RETRY_ATTEMPTS,
+        base: float = LLM_RETRY_BASE,
+        cap: float = LLM_RETRY_CAP,
+        retry_after_max: float = LLM_RETRY_AFTER_MAX,
+        hedge: bool = LLM_HEDGE,
+        tracker: Optional[LatencyTracker] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.attempts = max(1, int(attempts))
+        self.base = float(base)
+        self.cap = float(cap)
+        self.retry_after_max = float(retry_after_max)
+        self.hedge = bool(hedge)
+        self.tracker = tracker or LatencyTracker()
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = ResilienceStats()
+
+    # ---------- повторы ----------
+    def _retry_delay(self, e: LLMError, attempt: int) -> Optional[float]:
+        """Пауза перед следующей попыткой; None — больше не пробуем."""
+        if not e.retryable or attempt + 1 >= self.attempts:
+            return None
+        if e.retry_after is not None:
+            if e.retry_after > self.retry_after_max:
+                return None
+            self.stats.retry_after_honored += 1
+            return e.retry_after
+        return random.uniform(0, min(self.cap, self.base * (2 ** attempt)))
+
+    async def call(self, attempt_fn: Callable[[], Awaitable[T]]) -> T:
+        """Вызов с повторами/хеджированием под circuit breaker; ошибки — только LLMError."""
+        self.stats.calls += 1
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await self._hedged(attempt_fn)
+            except asyncio.CancelledError:
+                self.breaker.on_cancel()
+                raise
+            except Exception as exc:
+                e = as_llm_error(exc)
+                self.breaker.on_failure(e)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    if e.retryable:
+                        self.stats.gave_up += 1
+                    if e is exc:
+                        raise
+                    raise e from exc
+            else:
+                self.breaker.on_success()
+                return result
+            attempt += 1
+            self.stats.retries += 1
+            await asyncio.sleep(delay)
+
+    # ---------- хеджирование ----------
+    async def _timed(self, attempt_fn: Callable[[], Awaitable[T]]) -> T:
+        self.stats.attempts += 1
+        t0 = time.monotonic()
+        result = await attempt_fn()
+        self.tracker.observe(time.monotonic() - t0)
+        return result
+
+    async def _hedged(self, attempt_fn: Callable[[], Awaitable[T]]) -> T:
+        p95 = self.tracker.p95() if self.hedge else None
+        if p95 is None:
+            return await self._timed(attempt_fn)
+
+        primary = asyncio.ensure_future(self._timed(attempt_fn))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=p95)
+            if not done:
+                self.stats.hedges += 1
+                tasks.add(asyncio.ensure_future(self._timed(attempt_fn)))
+
+            first_error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is not primary:
+                            self.stats.hedge_wins += 1
+                        return t.result()
+                    first_error = first_error or t.exception()
+            raise first_error  # обе попытки упали
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    # ---------- стриминг ----------
+    async def stream(self, open_stream: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        Стрим под breaker'ом. Повтор — только пока ничего не отдано потребителю
+        (иначе текст задвоится); хеджирования у стрима нет.
+        """
+        self.stats.calls += 1
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            self.stats.attempts += 1
+            yielded = False
+            try:
+                async with contextlib.aclosing(open_stream()) as items:
+                    async for item in items:
+                        yielded = True
+                        yield item
+            except (asyncio.CancelledError, GeneratorExit):
+                self.breaker.on_cancel()
+                raise
+            except Exception as exc:
+                e = as_llm_error(exc)
+                self.breaker.on_failure(e)
+                delay = None if yielded else self._retry_delay(e, attempt)
+                if delay is None:
+                    if e.retryable:
+                        self.stats.gave_up += 1
+                    if e is exc:
+                        raise
+                    raise e from exc
+            else:
+                self.breaker.on_success()
+                return
+            attempt += 1
+            self.stats.retries += 1
+            await asyncio.sleep(delay)
+
+    def resilience_stats(self) -> Dict[str, Any]:
+        data = self.stats.snapshot()
+        p95 = self.tracker.p95()
+        data["latency_p95"] = round(p95, 3) if p95 is not None else None
+        data["breaker_state"] = self.breaker.state
+        data["breaker_failures"] = self.breaker.failures
+        data["breaker_opens"] = self.breaker.opens
+        data["breaker_fast_failures"] = self.breaker.fast_failures
+        return data
+
@@ -0,0 +1,379 @@
+# services/llm_standin.py
+from __future__ import annotations
+
+"""
+Локальный Яндекс-совместимый мок completion API — для тестов и нагрузочных прогонов.
+
+Отвечает в том же формате (result.alternatives[0].message.text), умеет
+completionOptions.stream=true (JSON по строке, в каждом — накопленный текст),
+учитывает completionOptions.maxTokens (обрезка + ALTERNATIVE_STATUS_TRUNCATED_FINAL).
+Есть и отложенный режим (completionAsync + опрос /operations/<id>):
+операция считается готовой после async_polls опросов.
+
+Поведение настраивается и меняется на лету:
+  - latency      — распределение задержки ответа (см. Latency.parse);
+  - error_rate   — доля ответов 500, rate_429 — доля 429 c Retry-After;
+  - status       — принудительный код ответа для всех запросов;
+  - reply        — строка, функция от payload или (по умолчанию) tarot_reply:
+                   правдоподобное толкование по картам/теме из промпта.
+
+    async with StandInServer(reply="⭐️ …") as srv:
+        provider = YandexProvider("stand-in", model_uri="stand-in", url=srv.url, api_key="test")
+
+Отдельным процессом — для бенчмарков бота целиком:
+
+    python -m services.llm_standin --port 8787 --latency lognorm:1.5:0.4 --rate-429 0.05
+    YANDEX_URL=http://127.0.0.1:8787/foundationModels/v1/completion python main.py
+"""
+
+import re
+import json
+import random
+import asyncio
+import argparse
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from aiohttp import web
+
+from services.context_digest import CONTEXT_CHARS_PER_TOKEN
+from services.card_registry import get_card_registry
+from services.template_engine import render_reading
+
+
+Reply = Union[str, Callable[[Dict[str, Any]], str]]
+
+
+# ===================== ЗАДЕРЖКИ =====================
+class Latency:
+    """
+    Распределение задержки, задаётся строкой:
+        const:0.2            — всегда 0.2 с
+        uniform:0.5:2        — равномерно от 0.5 до 2 с
+        normal:1.2:0.3       — нормальное (среднее, σ), отрицательные → 0
+        lognorm:1.5:0.4      — логнормальное (медиана, σ логарифма) — «длинный хвост», как у живого API
+        exp:1.0              — экспоненциальное со средним 1.0 с
+    """
+
+    _KINDS = {"const": 1, "uniform": 2, "normal": 2, "lognorm": 2, "exp": 1}
+
+    def __init__(self, kind: str = "const", *params: float, rng: Optional[random.Random] = None):
+        if kind not in self._KINDS or len(params) != self._KINDS[kind]:
+            raise ValueError(f"задержка {kind}:{':'.join(map(str, params))} — ожидается одна из {sorted(self._KINDS)}")
+        self.kind = kind
+        self.params = tuple(float(p) for p in params)
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def parse(cls, spec: Union[str, float, "Latency"], rng: Optional[random.Random] = None) -> "Latency":
+        if isinstance(spec, Latency):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls("const", float(spec), rng=rng)
+        kind, *params = str(spec).strip().split(":")
+        if not params:  # просто число
+            return cls("const", float(kind), rng=rng)
+        return cls(kind, *(float(p) for p in params), rng=rng)
+
+    def sample(self) -> float:
+        p, r = self.params, self.rng
+        if self.kind == "const":
+            return p[0]
+        if self.kind == "uniform":
+            return r.uniform(p[0], p[1])
+        if self.kind == "normal":
+            return max(0.0, r.gauss(p[0], p[1]))
+        if self.kind == "lognorm":
+            return r.lognormvariate(0.0, p[1]) * p[0] if p[0] > 0 else 0.0
+        return r.expovariate(1.0 / p[0]) if p[0] > 0 else 0.0
+
+    def __str__(self) -> str:
+        return ":".join([self.kind, *(f"{v:g}" for v in self.params)])
+
+
+# ===================== ТЕКСТ ОТВЕТА =====================
+_FILLER = (
+    "Символика карты подчёркивает, что происходящее имеет глубокие причины.",
+    "Её образ напоминает о связи внутреннего состояния и внешних событий.",
+    "Влияние карты распространяется на ближайшие недели и постепенно усиливается.",
+    "Контекст вопроса делает это значение особенно заметным.",
+    "Карта отражает процесс, который уже начался, хотя его плоды видны не сразу.",
+    "В ней соединяются опыт прошлого и возможности, которые открываются сейчас.",
+    "Это влияние мягкое, но устойчивое, и оно задаёт общий тон ситуации.",
+    "Соседство с другими картами расклада уточняет и усиливает этот смысл.",
+)
+
+
+def _prompt_field(text: str, label: str) -> str:
+    m = re.search(rf"^{label}:\s*(.+)$", text, flags=re.MULTILINE)
+    return m.group(1).strip() if m else ""
+
+
+def tarot_reply(payload: Dict[str, Any], rng: Optional[random.Random] = None) -> str:
+    """
+    Правдоподобное толкование «как от модели»: карты, тема и вопрос берутся
+    из промпта предсказания (если есть), иначе — случайные 1–3 карты.
+    Каждый абзац карты — 5–6 предложений, итог — 3, как требует промпт.
+    """
+    rng = rng or random
+    text = "\n".join(m.get("text", "") for m in payload.get("messages", []))
+    cards = [c.strip() for c in _prompt_field(text, r"Карты \(в порядке\)").split(",") if c.strip() and c.strip() != "—"]
+    if not cards:
+        cards = [
+            name + (" (перевёрнутая)" if rng.random() < 0.3 else "")
+            for name in rng.sample(get_card_registry().names, rng.randint(1, 3))
+        ]
+    reading = render_reading(cards, theme=_prompt_field(text, "Тема"), question=_prompt_field(text, "Вопрос пользователя"))
+    paragraphs = reading.split("\n\n")
+    for i in range(len(paragraphs) - 1):  # последний — итог, его не трогаем
+        paragraphs[i] += " " + " ".join(rng.sample(_FILLER, rng.randint(3, 4)))
+    return "\n\n".join(paragraphs)
+
+
+def _completion(text: str, status: str = "ALTERNATIVE_STATUS_FINAL", prompt_chars: int = 0) -> Dict[str, Any]:
+    input_tokens = int(prompt_chars / CONTEXT_CHARS_PER_TOKEN)
+    output_tokens = int(len(text) / CONTEXT_CHARS_PER_TOKEN)
+    return {
+        "result": {
+            "alternatives": [{"message": {"role": "assistant", "text": text}, "status": status}],
+            "usage": {
+                "inputTextTokens": str(input_tokens),
+                "completionTokens": str(output_tokens),
+                "totalTokens": str(input_tokens + output_tokens),
+            },
+            "modelVersion": "stand-in",
+        }
+    }
+
+
+# ===================== СЕРВЕР =====================
+class StandInServer:
+    def __init__(
+        self,
+        *,
+        reply: Optional[Reply] = None,
+        delay: float = 0.0,
+        latency: Union[str, float, Latency, None] = None,
+        status: int = 200,
+        error_rate: float = 0.0,
+        rate_429: float = 0.0,
+        retry_after: float = 1.0,
+        stream_chunks: int = 3,
+        stream_interval: float = 0.0,
+        async_polls: int = 1,
+        seed: Optional[int] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.rng = random.Random(seed)
+        self.reply = reply
+        self.latency = Latency.parse(latency if latency is not None else delay, rng=self.rng)
+        self.status = int(status)
+        self.error_rate = float(error_rate)
+        self.rate_429 = float(rate_429)
+        self.retry_after = float(retry_after)
+        self.stream_chunks = max(1, int(stream_chunks))
+        self.stream_interval = float(stream_interval)
+        self.async_polls = max(0, int(async_polls))
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.async_requests = 0
+        self.polls = 0
+        self.served_429 = 0
+        self.served_errors = 0
+        self.truncated = 0
+        self._operations: Dict[str, Dict[str, Any]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def delay(self) -> float:
+        """Совместимость: постоянная задержка (для других распределений — медиана/среднее)."""
+        return self.latency.params[0]
+
+    @delay.setter
+    def delay(self, value: float) -> None:
+        self.latency = Latency("const", float(value), rng=self.rng)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/foundationModels/v1/completion"
+
+    @property
+    def async_url(self) -> str:
+        return f"http://{self.host}:{self.port}/foundationModels/v1/completionAsync"
+
+    @property
+    def operations_url(self) -> str:
+        return f"http://{self.host}:{self.port}/operations"
+
+    def _text(self, payload: Dict[str, Any]) -> str:
+        if self.reply is None:
+            return tarot_reply(payload, self.rng)
+        return self.reply(payload) if callable(self.reply) else str(self.reply)
+
+    def _answer(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Текст с учётом maxTokens → тело completion."""
+        text = self._text(payload)
+        status = "ALTERNATIVE_STATUS_FINAL"
+        max_tokens = payload.get("completionOptions", {}).get("maxTokens")
+        if max_tokens:
+            limit = int(int(max_tokens) * CONTEXT_CHARS_PER_TOKEN)
+            if len(text) > limit:
+                text = text[:limit]
+                status = "ALTERNATIVE_STATUS_TRUNCATED_FINAL"
+                self.truncated += 1
+        prompt_chars = sum(len(m.get("text", "")) for m in payload.get("messages", []))
+        return _completion(text, status, prompt_chars)
+
+    def _failure(self) -> Optional[web.Response]:
+        """Ответ-ошибка по настройкам (status / rate_429 / error_rate) или None."""
+        if self.status == 429 or (self.status == 200 and self.rng.random() < self.rate_429):
+            self.served_429 += 1
+            return web.json_response(
+                {"error": {"message": "ai.textGeneration.completion.requestCount rate quota limit exceed"}},
+                status=429, headers={"Retry-After": f"{self.retry_after:g}"},
+            )
+        if self.status != 200 or self.rng.random() < self.error_rate:
+            self.served_errors += 1
+            return web.json_response({"error": {"message": "stand-in error"}}, status=self.status if self.status != 200 else 500)
+        return None
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        payload = await request.json()
+        failure = self._failure()
+        if failure is not None:
+            return failure
+        wait = self.latency.sample()
+        if not payload.get("completionOptions", {}).get("stream"):
+            if wait:
+                await asyncio.sleep(wait)
+            return web.json_response(self._answer(payload))
+
+        # стрим: задержка — до первого куска (time-to-first-token), дальше — stream_interval
+        body = self._answer(payload)
+        alt = body["result"]["alternatives"][0]
+        text = alt["message"]["text"]
+        if wait:
+            await asyncio.sleep(wait)
+        resp = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await resp.prepare(request)
+        step = max(1, len(text) // self.stream_chunks)
+        ends = list(range(step, len(text), step)) + [len(text)]
+        for end in ends:
+            chunk = _completion(text[:end], alt["status"] if end == len(text) else "ALTERNATIVE_STATUS_PARTIAL")
+            await resp.write((json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8"))
+            await asyncio.sleep(self.stream_interval)
+        await resp.write_eof()
+        return resp
+
+    async def _handle_async(self, request: web.Request) -> web.Response:
+        self.async_requests += 1
+        payload = await request.json()
+        failure = self._failure()
+        if failure is not None:
+            return failure
+        op_id = f"op{self.async_requests}"
+        self._operations[op_id] = {"payload": payload, "polls": 0}
+        return web.json_response({"id": op_id, "done": False})
+
+    async def _handle_operation(self, request: web.Request) -> web.Response:
+        self.polls += 1
+        op_id = request.match_info["op_id"]
+        op = self._operations.get(op_id)
+        if op is None:
+            return web.json_response({"error": {"message": "operation not found"}}, status=404)
+        op["polls"] += 1
+        if op["polls"] < self.async_polls:
+            return web.json_response({"id": op_id, "done": False})
+        wait = self.latency.sample()
+        if wait:
+            await asyncio.sleep(wait)
+        self._operations.pop(op_id, None)
+        return web.json_response({"id": op_id, "done": True, "response": self._answer(op["payload"])["result"]})
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.standin_stats())
+
+    def standin_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "async_requests": self.async_requests,
+            "polls": self.polls,
+            "served_429": self.served_429,
+            "served_errors": self.served_errors,
+            "truncated": self.truncated,
+            "latency": str(self.latency),
+        }
+
+    async def start(self) -> "StandInServer":
+        app = web.Application()
+        app.router.add_post("/foundationModels/v1/completion", self._handle)
+        app.router.add_post("/foundationModels/v1/completionAsync", self._handle_async)
+        app.router.add_get("/operations/{op_id}", self._handle_operation)
+        app.router.add_get("/stats", self._handle_stats)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "StandInServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+
+# ===================== ЗАПУСК ОТДЕЛЬНЫМ ПРОЦЕССОМ =====================
+async def _serve(args: argparse.Namespace) -> None:
+    srv = StandInServer(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_429=args.rate_429,
+        retry_after=args.retry_after,
+        stream_chunks=args.stream_chunks,
+        stream_interval=args.stream_interval,
+        async_polls=args.async_polls,
+        seed=args.seed,
+        host=args.host,
+        port=args.port,
+    )
+    await srv.start()
+    print(f"[standin] задержка {srv.latency}, 500: {srv.error_rate:.1%}, 429: {srv.rate_429:.1%}")
+    print(f"  YANDEX_URL={srv.url}")
+    print(f"  LLM_BATCH_URL={srv.async_url}")
+    print(f"  LLM_BATCH_OPERATIONS_URL={srv.operations_url}")
+    print(f"  статистика: http://{srv.host}:{srv.port}/stats")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await srv.stop()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Локальный мок completion API Яндекса")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8787)
+    ap.add_argument("--latency", default="lognorm:1.5:0.4", help="распределение задержки, напр. uniform:0.5:2")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429")
+    ap.add_argument("--retry-after", type=float, default=1.0, help="Retry-After для 429, сек")
+    ap.add_argument("--stream-chunks", type=int, default=20, help="кусков в стриминговом ответе")
+    ap.add_argument("--stream-interval", type=float, default=0.05, help="пауза между кусками стрима, сек")
+    ap.add_argument("--async-polls", type=int, default=2, help="опросов до готовности отложенной операции")
+    ap.add_argument("--seed", type=int, default=None)
+    try:
+        asyncio.run(_serve(ap.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+# services/qwen_worker.py
+from __future__ import annotations
+
+"""
+Отдельный процесс для локального инференса Qwen с динамическим батчингом.
+
+Раньше (tarot_ai_orig.py, затем QwenLocalProvider) model.generate вызывался
+по одному промпту из run_in_executor прямо в процессе бота: генерация
+держала GIL и тормозила event loop, а CPU тратился на batch=1.
+
+Теперь:
+  - процесс-воркер запускается по требованию (первый запрос), модель
+    грузится в нём один раз;
+  - воркер берёт первый запрос из очереди и LLM_QWEN_BATCH_WAIT сек добирает
+    остальные (до LLM_QWEN_BATCH_MAX), группирует по temperature и делает
+    один generate с левым паддингом на всю группу;
+  - ответы и статистика батча возвращаются через multiprocessing-очередь,
+    её в боте читает фоновый поток и будит ожидающие future;
+  - упал процесс — ожидающие получают LLMError, следующий запрос поднимет его заново;
+  - модель не загрузилась (fatal) — процесс заново не поднимаем: запросы сразу
+    получают LLMConfigError, повторная попытка — не раньше чем через
+    LLM_QWEN_FATAL_RETRY сек (загрузка модели дорогая, а ошибка обычно в конфиге).
+
+Модель "tiny-random" — крошечная случайно инициализированная Qwen2 со своим
+словарём: для тестов без сети и весов.
+"""
+
+import os
+import time
+import queue
+import asyncio
+import itertools
+import threading
+import multiprocessing as mp
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.llm_errors import LLMBadResponse, LLMConfigError, LLMError, LLMOverloaded, LLMTimeoutError
+
+
+# ===================== КОНФИГ =====================
+LLM_QWEN_BATCH_MAX   = int(os.getenv("LLM_QWEN_BATCH_MAX", "8"))          # промптов в одном generate
+LLM_QWEN_BATCH_WAIT  = float(os.getenv("LLM_QWEN_BATCH_WAIT", "0.05"))    # сек добора батча
+LLM_QWEN_THREADS     = int(os.getenv("LLM_QWEN_THREADS", "0"))            # torch threads (0 — по умолчанию)
+LLM_QWEN_MAX_PENDING = int(os.getenv("LLM_QWEN_MAX_PENDING", "64"))       # запросов в очереди воркера
+LLM_QWEN_TIMEOUT     = float(os.getenv("LLM_QWEN_TIMEOUT", "300"))        # сек на запрос
+LLM_QWEN_FATAL_RETRY = float(os.getenv("LLM_QWEN_FATAL_RETRY", "1800"))   # сек до новой попытки после fatal
+
+TINY_MODEL = "tiny-random"
+_TINY_WORDS = (
+    "карта путь итог совет начало перемены время сила любовь работа судьба "
+    "шут маг башня звезда луна солнце мир да нет . , ! ?"
+).split()
+
+
+# ===================== ВНУТРИ ПРОЦЕССА-ВОРКЕРА =====================
+def _load_tiny():
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import AutoModelForCausalLM, PreTrainedTokenizerFast, Qwen2Config
+
+    vocab = {"<pad>": 0, "<eos>": 1, "<unk>": 2}
+    for w in _TINY_WORDS:
+        vocab.setdefault(w, len(vocab))
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tok, pad_token="<pad>", eos_token="<eos>", unk_token="<unk>")
+    tokenizer.chat_template = "{% for m in messages %}{{ m['content'] }} {% endfor %}"
+
+    torch.manual_seed(0)
+    config = Qwen2Config(
+        vocab_size=len(vocab), hidden_size=16, intermediate_size=32, num_hidden_layers=1,
+        num_attention_heads=2, num_key_value_heads=1, max_position_embeddings=256,
+        pad_token_id=0, bos_token_id=1, eos_token_id=1,
+    )
+    model = AutoModelForCausalLM.from_config(config)
+    # служебные токены не генерируем: ответ всегда ровно max_new_tokens слов, не пустой
+    model.generation_config.suppress_tokens = [0, 1, 2]
+    return model, tokenizer
+
+
+def _load_model(model_name: str):
+    if model_name == TINY_MODEL:
+        return _load_tiny()
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    print(f"🔄 [qwen-worker] загрузка модели {model_name}...")
+    model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype="auto")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    print("✅ [qwen-worker] модель загружена")
+    return model, tokenizer
+
+
+def _generate_batch(model, tokenizer, batch: List[Tuple[int, List[Dict[str, str]], int, float]]):
+    """Один padded generate на группу запросов с одинаковой temperature."""
+    import torch
+
+    texts = [
+        tokenizer.apply_chat_template(
+            [{"role": m.get("role", "user"), "content": m.get("text", "")} for m in messages],
+            tokenize=False, add_generation_prompt=True,
+        )
+        for _, messages, _, _ in batch
+    ]
+    inputs = tokenizer(texts, return_tensors="pt", padding=True)
+    temperature = batch[0][3]
+    gen_kwargs: Dict[str, Any] = {"max_new_tokens": max(b[2] for b in batch), "pad_token_id": tokenizer.pad_token_id}
+    if temperature > 0:
+        gen_kwargs.update(do_sample=True, temperature=temperature)
+    else:
+        gen_kwargs["do_sample"] = False
+    with torch.inference_mode():
+        out = model.generate(**inputs, **gen_kwargs)
+
+    prompt_len = inputs["input_ids"].shape[1]  # левый паддинг: ответ начинается сразу за промптом
+    results, new_tokens = [], 0
+    for (req_id, _, max_tokens, _), seq in zip(batch, out):
+        gen = seq[prompt_len:][:max_tokens]
+        new_tokens += int((gen != tokenizer.pad_token_id).sum())
+        results.append((req_id, tokenizer.decode(gen, skip_special_tokens=True)))
+    return results, new_tokens
+
+
+def _worker_main(requests: "mp.Queue", responses: "mp.Queue", model_name: str, batch_max: int, batch_wait: float) -> None:
+    if LLM_QWEN_THREADS:
+        import torch
+        torch.set_num_threads(LLM_QWEN_THREADS)
+    try:
+        model, tokenizer = _load_model(model_name)
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        model.eval()
+    except Exception as e:
+        responses.put(("fatal", None, f"загрузка модели: {e!r}"))
+        return
+    responses.put(("ready", None, None))
+
+    while True:
+        item = requests.get()
+        if item is None:
+            return
+        pending = [item]
+        deadline = time.monotonic() + batch_wait
+        while len(pending) < batch_max:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                nxt = requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if nxt is None:
+                requests.put(None)  # доделаем текущий батч и выйдем на следующем круге
+                break
+            pending.append(nxt)
+
+        groups: Dict[float, list] = {}
+        for req in pending:
+            groups.setdefault(round(req[3], 2), []).append(req)
+        for group in groups.values():
+            t0 = time.monotonic()
+            try:
+                results, new_tokens = _generate_batch(model, tokenizer, group)
+            except Exception as e:
+                for req in group:
+                    responses.put(("error", req[0], repr(e)))
+                continue
+            for req_id, text in results:
+                responses.put(("ok", req_id, text))
+            responses.put(("batch", None, (len(group), new_tokens, time.monotonic() - t0)))
+
+
+# ===================== В ПРОЦЕССЕ БОТА =====================
+@dataclass
+class WorkerStats:
+    starts: int = 0
+    crashes: int = 0
+    requests: int = 0
+    completed: int = 0
+    failed: int = 0
+    timeouts: int = 0
+    batches: int = 0
+    tokens: int = 0
+    gen_seconds: float = 0.0
+    max_batch: int = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["tokens_per_sec"] = round(self.tokens / self.gen_seconds, 1) if self.gen_seconds else 0.0
+        data["avg_batch"] = round(self.completed / self.batches, 2) if self.batches else 0.0
+        data["gen_seconds"] = round(self.gen_seconds, 2)
+        return data
+
+
+class QwenWorkerClient:
+    """Запуск воркера по требованию, отправка запросов, сбор ответов в future."""
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        batch_max: int = LLM_QWEN_BATCH_MAX,
+        batch_wait: float = LLM_QWEN_BATCH_WAIT,
+        max_pending: int = LLM_QWEN_MAX_PENDING,
+        timeout: float = LLM_QWEN_TIMEOUT,
+        fatal_retry: float = LLM_QWEN_FATAL_RETRY,
+    ):
+        self.model_name = model_name
+        self.batch_max = max(1, int(batch_max))
+        self.batch_wait = max(0.0, float(batch_wait))
+        self.max_pending = max(1, int(max_pending))
+        self.timeout = float(timeout)
+        self.fatal_retry = float(fatal_retry)
+        self.stats = WorkerStats()
+        self.batch_sizes: Counter = Counter()
+        self._ctx = mp.get_context("spawn")  # fork после старта потоков/event loop небезопасен
+        self._proc: Optional[mp.Process] = None
+        self._requests: Optional[mp.Queue] = None
+        self._responses: Optional[mp.Queue] = None
+        self._reader: Optional[threading.Thread] = None
+        self._ready: Optional[threading.Event] = None
+        self._fatal: Optional[str] = None
+        self._fatal_at = 0.0
+        self._pending: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._closing = False
+
+    # ---------- жизненный цикл ----------
+    def _alive(self) -> bool:
+        return self._proc is not None and self._proc.is_alive()
+
+    def _start(self) -> None:
+        self._closing = False
+        self._requests, self._responses = self._ctx.Queue(), self._ctx.Queue()
+        self._ready = threading.Event()
+        self._proc = self._ctx.Process(
+            target=_worker_main,
+            args=(self._requests, self._responses, self.model_name, self.batch_max, self.batch_wait),
+            name="qwen-worker",
+            daemon=True,
+        )
+        self._proc.start()
+        self.stats.starts += 1
+        self._reader = threading.Thread(
+            target=self._read_loop, args=(self._proc, self._responses, self._ready),
+            name="qwen-worker-reader", daemon=True,
+        )
+        self._reader.start()
+
+    def _read_loop(self, proc: mp.Process, responses: "mp.Queue", ready: threading.Event) -> None:
+        while True:
+            try:
+                kind, req_id, value = responses.get(timeout=1.0)
+            except queue.Empty:
+                if proc.is_alive():
+                    continue
+                self._fail_all(LLMError("процесс локальной Qwen завершился"), crashed=True)
+                ready.set()
+                return
+            except (EOFError, OSError):
+                self._fail_all(LLMError("канал локальной Qwen закрыт"), crashed=True)
+                ready.set()
+                return
+            if kind == "ready":
+                ready.set()
+            elif kind == "fatal":
+                self._fatal, self._fatal_at = value, time.monotonic()
+                self._fail_all(LLMError(f"локальная Qwen: {value}"))
+                ready.set()
+                return
+            elif kind == "batch":
+                size, tokens, seconds = value
+                with self._lock:
+                    self.stats.batches += 1
+                    self.stats.tokens += tokens
+                    self.stats.gen_seconds += seconds
+                    self.stats.max_batch = max(self.stats.max_batch, size)
+                    self.batch_sizes[size] += 1
+            else:
+                self._resolve(req_id, value if kind == "ok" else LLMError(f"локальная Qwen: {value}"))
+
+    def _resolve(self, req_id: int, value: Any) -> None:
+        with self._lock:
+            item = self._pending.pop(req_id, None)
+        if item is None:
+            return
+        loop, fut = item
+
+        def _set() -> None:
+            if fut.done():
+                return
+            if isinstance(value, BaseException):
+                self.stats.failed += 1
+                fut.set_exception(value)
+            else:
+                self.stats.completed += 1
+                fut.set_result(value)
+
+        loop.call_soon_threadsafe(_set)
+
+    def _fail_all(self, error: LLMError, *, crashed: bool = False) -> None:
+        with self._lock:
+            ids = list(self._pending)
+            if crashed and not self._closing:
+                self.stats.crashes += 1
+        for req_id in ids:
+            self._resolve(req_id, error)
+
+    # ---------- API ----------
+    async def generate(self, messages: List[Dict[str, str]], *, max_tokens: int = 512, temperature: float = 0.7) -> str:
+        if len(self._pending) >= self.max_pending:
+            raise LLMOverloaded("очередь локальной Qwen переполнена")
+        if self._fatal and time.monotonic() - self._fatal_at < self.fatal_retry:
+            raise LLMConfigError(f"локальная Qwen: {self._fatal}")
+        if not self._alive():
+            self._fatal = None  # первый запуск или пауза после fatal вышла — пробуем снова
+            self._start()
+            # загрузка модели — в потоке, чтобы не держать event loop
+            await asyncio.get_running_loop().run_in_executor(None, self._ready.wait)
+        if self._fatal:
+            raise LLMConfigError(f"локальная Qwen: {self._fatal}")
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        req_id = next(self._ids)
+        with self._lock:
+            self._pending[req_id] = (loop, fut)
+        self.stats.requests += 1
+        self._requests.put((req_id, messages, int(max_tokens), float(temperature)))
+        try:
+            text = await asyncio.wait_for(fut, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            raise LLMTimeoutError(f"локальная Qwen не ответила за {self.timeout:.0f} с") from None
+        finally:
+            with self._lock:
+                self._pending.pop(req_id, None)
+        if not text.strip():
+            raise LLMBadResponse("локальная Qwen вернула пустой ответ")
+        return text.strip()
+
+    def worker_stats(self) -> Dict[str, Any]:
+        data = self.stats.snapshot()
+        data["alive"] = self._alive()
+        data["pending"] = len(self._pending)
+        data["batch_sizes"] = dict(sorted(self.batch_sizes.items()))
+        return data
+
+    def close(self) -> None:
+        if self._proc is None:
+            return
+        self._closing = True
+        if self._proc.is_alive():
+            self._requests.put(None)
+            self._proc.join(timeout=5)
+            if self._proc.is_alive():
+                self._proc.terminate()
+        self._proc = None
@@ -0,0 +1,326 @@
+# services/rate_limiter.py
+from __future__ import annotations
+
+"""
+Адаптивный ограничитель запросов к LLM (перед _post_messages / стримингом).
+
+Два условия допуска запроса:
+  - token bucket: не больше rate запросов в секунду (с запасом burst);
+  - окно конкурентности: не больше limit запросов одновременно.
+
+rate и limit подстраиваются по AIMD:
+  - успешный быстрый ответ — аддитивный рост (limit += 1/limit, rate += шаг);
+  - 429/503 от провайдера — мультипликативный спад (×0.5);
+  - ответ дольше LLM_LATENCY_TARGET — мягкий спад (×0.8).
+Спад не чаще раза в LLM_AIMD_COOLDOWN сек, чтобы пачка одновременных 429
+не схлопнула окно до минимума.
+
+Ожидающие стоят в очереди с ограниченной глубиной и временем ожидания;
+не дождавшиеся получают LLMOverloaded — хендлеры показывают понятный фолбэк
+вместо строки «Ошибка HTTP».
+
+Очередь приоритетная. Класс вызова берётся из контекста (llm_priority()):
+  interactive — живой расклад, follow_up — итог/совет по нажатию,
+  speculative — заготовки (совет заранее), batch — фоновая предгенерация.
+Свободное место получает ожидающий с лучшим приоритетом; старение
+(LLM_PRIORITY_AGING сек ожидания = +1 класс) не даёт фону ждать вечно.
+При переполненной очереди новый запрос вытесняет самый низкоприоритетный
+из ожидающих (тот получает LLMOverloaded), если сам важнее него.
+Метрики ожидания и исходов — по каждому классу (priority_stats()).
+"""
+
+import os
+import time
+import asyncio
+import contextlib
+import contextvars
+from collections import deque
+from dataclasses import dataclass, asdict, field
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from services.llm_errors import LLMOverloaded
+
+
+# ===================== КОНФИГ =====================
+LLM_RATE_RPS        = float(os.getenv("LLM_RATE_RPS", "8"))          # потолок запросов в секунду
+LLM_RATE_BURST      = float(os.getenv("LLM_RATE_BURST", "16"))       # ёмкость «ведра»
+LLM_LIMIT_MAX       = int(os.getenv("LLM_LIMIT_MAX", os.getenv("LLM_HTTP_MAX_CONCURRENCY", "16")))
+LLM_LIMIT_MIN       = int(os.getenv("LLM_LIMIT_MIN", "1"))
+LLM_LATENCY_TARGET  = float(os.getenv("LLM_LATENCY_TARGET", "25"))   # сек; дольше — сигнал перегрузки
+LLM_AIMD_COOLDOWN   = float(os.getenv("LLM_AIMD_COOLDOWN", "2"))     # сек между спадами
+LLM_QUEUE_MAX       = int(os.getenv("LLM_QUEUE_MAX", "200"))         # макс. ожидающих
+LLM_QUEUE_MAX_WAIT  = float(os.getenv("LLM_QUEUE_MAX_WAIT", "20"))   # макс. ожидание в очереди, сек
+
+LLM_PRIORITY_AGING  = float(os.getenv("LLM_PRIORITY_AGING", "10"))  # сек ожидания = +1 класс приоритета
+
+_OVERLOAD_STATUSES = {429, 503}
+
+# Классы приоритета: индекс — ранг (меньше — важнее)
+PRIORITY_CLASSES = ("interactive", "follow_up", "speculative", "batch")
+_PRIORITY: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default="interactive")
+
+# Что видит пользователь вместо толкования, когда провайдер перегружен
+OVERLOAD_TEXT = "⏳ Сейчас очень много обращений к картам. Попробуйте, пожалуйста, через минуту."
+
+
+@contextlib.contextmanager
+def llm_priority(cls: str) -> Iterator[None]:
+    """Класс приоритета для LLM-вызовов внутри блока (наследуется дочерними задачами)."""
+    if cls not in PRIORITY_CLASSES:
+        raise ValueError(f"неизвестный класс приоритета: {cls!r}")
+    token = _PRIORITY.set(cls)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+def current_priority() -> str:
+    return _PRIORITY.get()
+
+
+def is_overload_error(e: BaseException) -> bool:
+    return isinstance(e, LLMOverloaded) or getattr(e, "status", None) in _OVERLOAD_STATUSES
+
+
+@dataclass
+class LimiterStats:
+    admitted: int = 0
+    rejected_queue_full: int = 0
+    rejected_wait_timeout: int = 0
+    overload_signals: int = 0
+    slow_signals: int = 0
+    decreases: int = 0
+    wait_sum: float = 0.0
+    wait_max: float = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["wait_avg"] = round(self.wait_sum / self.admitted, 3) if self.admitted else 0.0
+        data["wait_max"] = round(self.wait_max, 3)
+        data.pop("wait_sum")
+        return data
+
+
+@dataclass
+class ClassStats:
+    admitted: int = 0
+    rejected: int = 0         # очередь полна/истекло ожидание
+    preempted: int = 0        # вытеснен из очереди более важным запросом
+    waiting: int = 0
+    wait_sum: float = 0.0
+    wait_max: float = 0.0
+    waits: Deque[float] = field(default_factory=lambda: deque(maxlen=200))
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("waits")
+        data.pop("wait_sum")
+        data["wait_avg"] = round(self.wait_sum / self.admitted, 3) if self.admitted else 0.0
+        data["wait_max"] = round(self.wait_max, 3)
+        if self.waits:
+            ordered = sorted(self.waits)
+            data["wait_p95"] = round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))], 3)
+        return data
+
+
+class _Waiter:
+    __slots__ = ("cls", "rank", "since", "preempted")
+
+    def __init__(self, cls: str):
+        self.cls = cls
+        self.rank = PRIORITY_CLASSES.index(cls)
+        self.since = time.monotonic()
+        self.preempted = False
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        *,
+        rate: float = LLM_RATE_RPS,
+        burst: float = LLM_RATE_BURST,
+        limit_max: int = LLM_LIMIT_MAX,
+        limit_min: int = LLM_LIMIT_MIN,
+        latency_target: float = LLM_LATENCY_TARGET,
+        cooldown: float = LLM_AIMD_COOLDOWN,
+        queue_max: int = LLM_QUEUE_MAX,
+        max_wait: float = LLM_QUEUE_MAX_WAIT,
+        aging: float = LLM_PRIORITY_AGING,
+    ):
+        self.rate_max = max(0.1, float(rate))
+        self.rate_min = min(self.rate_max, 0.2)
+        self.burst = max(1.0, float(burst))
+        self.limit_max = max(1, int(limit_max))
+        self.limit_min = max(1, min(int(limit_min), self.limit_max))
+        self.latency_target = float(latency_target)
+        self.cooldown = float(cooldown)
+        self.queue_max = max(0, int(queue_max))
+        self.max_wait = float(max_wait)
+        self.aging = max(0.001, float(aging))
+        self.stats = LimiterStats()
+        self.class_stats: Dict[str, ClassStats] = {c: ClassStats() for c in PRIORITY_CLASSES}
+
+        self.rate = self.rate_max
+        self.limit = float(self.limit_max)
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._last_decrease = 0.0
+        self._in_flight = 0
+        self._waiting = 0
+        self._waiters: List[_Waiter] = []
+        self._changed = asyncio.Event()
+
+    # ---------- token bucket ----------
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _notify(self) -> None:
+        # будим всех ожидающих; каждый перепроверит условия допуска
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    # ---------- приоритеты ----------
+    def _effective(self, w: _Waiter, now: float) -> float:
+        """Ранг с учётом старения: каждые aging сек ожидания — на класс выше."""
+        return w.rank - (now - w.since) / self.aging
+
+    def _is_head(self, w: _Waiter) -> bool:
+        now = time.monotonic()
+        best = min(self._waiters, key=lambda x: (self._effective(x, now), x.since))
+        return best is w
+
+    def _preempt_for(self, rank: int) -> bool:
+        """Очередь полна: вытесняем самого неважного ожидающего, если он хуже нового."""
+        now = time.monotonic()
+        candidates = [w for w in self._waiters if not w.preempted]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda x: (self._effective(x, now), -x.since))
+        if self._effective(victim, now) <= rank:
+            return False
+        victim.preempted = True
+        self._notify()
+        return True
+
+    # ---------- допуск ----------
+    async def _acquire(self) -> None:
+        me = _Waiter(current_priority())
+        cst = self.class_stats[me.cls]
+        if self._waiting >= self.queue_max and not self._preempt_for(me.rank):
+            self.stats.rejected_queue_full += 1
+            cst.rejected += 1
+            raise LLMOverloaded("очередь запросов к LLM переполнена")
+
+        t0 = me.since
+        deadline = t0 + self.max_wait
+        self._waiting += 1
+        cst.waiting += 1
+        self._waiters.append(me)
+        try:
+            while True:
+                if me.preempted:
+                    cst.preempted += 1
+                    raise LLMOverloaded("запрос к LLM вытеснен из очереди более приоритетным")
+                self._refill()
+                has_slot = self._in_flight < int(self.limit)
+                head = self._is_head(me)
+                if has_slot and head and self._tokens >= 1.0:
+                    break
+                now = time.monotonic()
+                timeout = deadline - now
+                if timeout <= 0:
+                    self.stats.rejected_wait_timeout += 1
+                    cst.rejected += 1
+                    raise LLMOverloaded("LLM перегружена: превышено время ожидания в очереди")
+                if has_slot and head:
+                    # ждём только токен — он появится через (1 - tokens) / rate
+                    timeout = min(timeout, (1.0 - self._tokens) / self.rate)
+                elif has_slot:
+                    # место есть, но мы не первые: порядок меняется со старением
+                    timeout = min(timeout, self.aging)
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+        finally:
+            self._waiting -= 1
+            cst.waiting -= 1
+            self._waiters.remove(me)
+            # следующий по приоритету перепроверит условия (место могло остаться)
+            self._notify()
+
+        self._tokens -= 1.0
+        self._in_flight += 1
+        waited = time.monotonic() - t0
+        self.stats.admitted += 1
+        self.stats.wait_sum += waited
+        self.stats.wait_max = max(self.stats.wait_max, waited)
+        cst.admitted += 1
+        cst.wait_sum += waited
+        cst.wait_max = max(cst.wait_max, waited)
+        cst.waits.append(waited)
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._notify()
+
+    # ---------- AIMD ----------
+    def _increase(self) -> None:
+        self.limit = min(float(self.limit_max), self.limit + 1.0 / max(self.limit, 1.0))
+        self.rate = min(self.rate_max, self.rate + self.rate_max * 0.05)
+
+    def _decrease(self, factor: float) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.limit_min), self.limit * factor)
+        self.rate = max(self.rate_min, self.rate * factor)
+        self.stats.decreases += 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, *, track_latency: bool = True):
+        """
+        Место для одного запроса. track_latency=False — для стриминга, где
+        длительность определяется длиной ответа, а не нагрузкой на провайдера.
+        """
+        await self._acquire()
+        t0 = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            if is_overload_error(e):
+                self.stats.overload_signals += 1
+                self._decrease(0.5)
+            raise
+        else:
+            if track_latency and time.monotonic() - t0 > self.latency_target:
+                self.stats.slow_signals += 1
+                self._decrease(0.8)
+            else:
+                self._increase()
+        finally:
+            self._release()
+
+    def limiter_stats(self) -> Dict[str, Any]:
+        self._refill()
+        data = self.stats.snapshot()
+        data["queue_depth"] = self._waiting
+        data["in_flight"] = self._in_flight
+        data["limit"] = round(self.limit, 2)
+        data["rate_rps"] = round(self.rate, 2)
+        data["tokens"] = round(self._tokens, 2)
+        return data
+
+    def priority_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {f"priority:{c}": st.snapshot() for c, st in self.class_stats.items()}
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_LIMITER: Optional[AdaptiveLimiter] = None
+
+def get_rate_limiter() -> AdaptiveLimiter:
+    global _LIMITER
+    if _LIMITER is None:
+        _LIMITER = AdaptiveLimiter()
+    return _LIMITER
@@ -0,0 +1,104 @@
+# services/single_flight.py
+from __future__ import annotations
+
+"""
+Склейка одинаковых одновременных LLM-запросов (single-flight).
+
+Если несколько пользователей одновременно запрашивают одно и то же (карта дня,
+один и тот же пункт сценария с той же картой), в апстрим уходит ОДИН запрос,
+а все ожидающие получают его результат.
+
+Отмена: каждый ожидающий ждёт через asyncio.shield, поэтому уход одного
+(таймаут в хендлере) не обрывает общий запрос. Запрос отменяется только
+когда ушли ВСЕ ожидающие — тогда ключ сразу освобождается, и следующий
+вызов начнёт новый запрос, а не подцепится к отменяемому.
+"""
+
+import json
+import asyncio
+import hashlib
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def payload_key(payload: Dict[str, Any]) -> str:
+    """Ключ по нормализованному телу запроса (пробелы в текстах сообщений схлопнуты)."""
+    norm = dict(payload)
+    msgs = norm.get("messages")
+    if isinstance(msgs, list):
+        norm["messages"] = [
+            {**m, "text": " ".join(str(m.get("text", "")).split())} if isinstance(m, dict) else m
+            for m in msgs
+        ]
+    raw = json.dumps(norm, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SingleFlightStats:
+    calls: int = 0        # всего обращений
+    upstream: int = 0     # реально запущено запросов
+    coalesced: int = 0    # обращений, подцепившихся к уже идущему запросу
+    abandoned: int = 0    # запросов, отменённых после ухода всех ожидающих
+
+    def snapshot(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self.stats = SingleFlightStats()
+        self._calls: Dict[str, _Call] = {}
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        self.stats.calls += 1
+        call = self._calls.get(key)
+        if call is None or call.task.done():
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t, k=key, c=call: self._forget(k, c))
+            self.stats.upstream += 1
+        else:
+            self.stats.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            # ушли именно мы (общий запрос продолжает жить, пока есть другие ожидающие)
+            if call.waiters == 1 and not call.task.done():
+                self._forget(key, call)
+                call.task.cancel()
+                self.stats.abandoned += 1
+            raise
+        finally:
+            call.waiters -= 1
+
+    def single_flight_stats(self) -> Dict[str, Any]:
+        data = self.stats.snapshot()
+        data["in_flight"] = len(self._calls)
+        return data
+
+
+# ===================== ОБЩИЙ ЭКЗЕМПЛЯР =====================
+_FLIGHT: Optional[SingleFlight] = None
+
+def get_single_flight() -> SingleFlight:
+    global _FLIGHT
+    if _FLIGHT is None:
+        _FLIGHT = SingleFlight()
+    return _FLIGHT
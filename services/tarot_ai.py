@@ -2,22 +2,41 @@
 from __future__ import annotations
 
 import os
-import json
+import time
 import random
-import asyncio
+import contextlib
 import re
-from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
-
-import requests  # синхронный HTTP — оборачиваем в asyncio.to_thread
-
-
-# ===================== КОНФИГ ЯНДЕКС LLM =====================
-YANDEX_API_KEY     = os.getenv("YANDEX_API_KEY", "AQVN08pz8w3rwgGBwMpoZfsIwYH4CsIU2OzCOHzN").strip()
-YANDEX_MODEL_URI   = os.getenv("YANDEX_MODEL_URI", "gpt://b1gvsrda7nthhjboi2hm/yandexgpt-lite").strip()
-YANDEX_URL         = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
-YANDEX_TEMPERATURE = float(os.getenv("YANDEX_TEMPERATURE", "0.7"))
-YANDEX_MAX_TOKENS  = int(os.getenv("YANDEX_MAX_TOKENS", "2000"))
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from services.llm_client import get_llm_client
+from services.single_flight import get_single_flight, payload_key
+from services.rate_limiter import get_rate_limiter, llm_priority
+from services.llm_errors import LLMError
+from services.llm_providers import get_router
+from services.context_digest import compact_context, digest_stats
+from services.gen_profiles import advice_profile, get_profile_book
+from services.llm_batch import LLM_BATCH, get_batch_runner
+from services.llm_cassette import get_cassette
+from services.template_engine import render_itog, render_reading
+from services.text_normalizer import normalize
+from services.advice_lexicon import get_advice_lexicon
+from services.card_registry import DrawnCard, get_card_registry
+from services.interp_library import get_interp_library
+from services.interp_cache import INTERP_CACHE_ENABLED, get_interp_cache, make_key as interp_cache_key
+
+
+# ===================== КОНФИГ LLM =====================
+# Ключи/модели Яндекса и маршрутизация между провайдерами — в services/llm_providers.py
+# Стриминг ответа (частичный текст по мере генерации) для интерактивных раскладов
+TAROT_STREAMING    = os.getenv("TAROT_STREAMING", "1").strip() not in {"0", "false", "False", ""}
+# Одинаковые одновременные запросы — один вызов в апстрим (services/single_flight.py)
+LLM_SINGLE_FLIGHT  = os.getenv("LLM_SINGLE_FLIGHT", "1").strip() not in {"0", "false", "False", ""}
+# «Быстрый режим»: очередь к LLM почти полна — толкование по шаблонам (services/template_engine.py)
+TAROT_FAST_MODE       = os.getenv("TAROT_FAST_MODE", "1").strip() not in {"0", "false", "False", ""}
+TAROT_FAST_MODE_QUEUE = float(os.getenv("TAROT_FAST_MODE_QUEUE", "0.8"))  # доля заполнения очереди лимитера
+# Класс приоритета по типу вызова (services/rate_limiter.py); фон — batch/speculative явно
+_KIND_PRIORITY = {"summary": "follow_up", "advice": "follow_up"}
 
 
 # ===================== КОНФИГ ПЕРЕВЁРНУТЫХ КАРТ =====================
@@ -31,373 +50,195 @@ except ValueError:
 
 
 # ===================== КАРТЫ =====================
-CARDS_PATH = Path(__file__).resolve().parent.parent / "data" / "tarot_cards.json"
-
 def load_cards() -> List[Dict[str, Any]]:
-    with open(CARDS_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-_CARDS_CACHE: Optional[List[Dict[str, Any]]] = None
-
-def _cards() -> List[Dict[str, Any]]:
-    global _CARDS_CACHE
-    if _CARDS_CACHE is None:
-        _CARDS_CACHE = load_cards()
-    return _CARDS_CACHE
+    """Колода как список записей JSON (копии) — из общего реестра services/card_registry.py."""
+    return [c.as_dict() for c in get_card_registry()]
 
 def draw_cards(
     num: int,
     *,
     allow_reversed: Optional[bool] = None,
     reversed_prob: Optional[float] = None
-) -> List[Dict[str, Any]]:
+) -> List[DrawnCard]:
     """
-    Вытягивает num карт из JSON-колоды.
-    НИЧЕГО не меняем в других файлах: при перевороте подменяем поле `name`
-    на "<Имя> (перевёрнутая)", оригинальное имя сохраняем в `base_name`.
-    В словарь карты также кладём флаг `reversed: bool`.
+    Вытягивает num карт из колоды → [DrawnCard(card_id, reversed), …].
+    Никаких копий словарей: имя «<Имя> (перевёрнутая)» собирается по запросу
+    (card.name), в БД/FSM уходят имена карт и флаги (pack_cards).
 
     Управление:
       - allow_reversed: None -> берётся из TAROT_ALLOW_REVERSED
       - reversed_prob: None -> берётся из TAROT_REVERSED_PROB
     """
-    cards = _cards()
-    if num > len(cards):
-        raise ValueError(f"Запрошено {num} карт, но в колоде только {len(cards)}")
+    total = len(get_card_registry())
+    if num > total:
+        raise ValueError(f"Запрошено {num} карт, но в колоде только {total}")
 
     use_reversed = TAROT_ALLOW_REVERSED if allow_reversed is None else bool(allow_reversed)
     prob = TAROT_REVERSED_PROB if reversed_prob is None else max(0.0, min(1.0, float(reversed_prob)))
 
-    picked = random.sample(cards, num)
-    result: List[Dict[str, Any]] = []
-    for c in picked:
-        c = dict(c)  # не пачкаем общий кэш
-        base_name = c.get("name") or c.get("title") or str(c)
-        c["base_name"] = base_name
-        is_rev = use_reversed and (random.random() < prob)
-        c["reversed"] = bool(is_rev)
-        c["name"] = f"{base_name} (перевёрнутая)" if is_rev else base_name
-        result.append(c)
-    return result
-
-
-# ===================== ХЕЛПЕРЫ ФОРМАТИРОВАНИЯ =====================
-
-def _force_itog_three_sentences_no_advice(text: str) -> str:
-    """
-    Находит блок '🌙 Итог:' и принудительно:
-    - убирает советные формулировки,
-    - оставляет ровно 3 предложения,
-    - удаляет пустые строки и лишние отступы.
-    """
-    if not isinstance(text, str) or not text.strip():
-        return text
-
-    text = _ensure_moon_on_itog(text)
-    lines = text.splitlines()
+    picked = random.sample(range(total), num)
+    return [DrawnCard(card_id, use_reversed and random.random() < prob) for card_id in picked]
 
-    # ищем строку с "🌙 Итог:"
-    itog_idx = None
-    for i, ln in enumerate(lines):
-        if re.match(r"^\s*🌙\s*Итог\s*:\s*", ln, flags=re.IGNORECASE):
-            itog_idx = i
-            break
-    if itog_idx is None:
-        return text
-
-    head = lines[:itog_idx]
-    itog_header = lines[itog_idx]
-    after_colon = re.split(r"🌙\s*Итог\s*:\s*", itog_header, flags=re.IGNORECASE)
-    itog_inline = after_colon[1].strip() if len(after_colon) > 1 else ""
-    tail = " ".join(s.strip() for s in lines[itog_idx + 1:] if s.strip())
-    full_itog = f"{itog_inline} {tail}".strip()
-
-    # убираем лишние переводы строк
-    full_itog = re.sub(r"\s{2,}", " ", full_itog)
-
-    # фильтр советных фраз
-    banned = [
-        "совет", "советую", "рекоменд", "стоит", "следует", "лучше",
-        "нужно", "необходимо", "постарайтесь", "попробуйте", "сделайте",
-        "возьмите", "должны", "вам стоит", "вам следует", "рекомендую"
-    ]
-    sentences = re.split(r"(?<=[.!?])\s+", full_itog)
-    clean_sentences = [s.strip() for s in sentences if s.strip() and not any(b in s.lower() for b in banned)]
-
-    # если больше трёх — берём первые три, если меньше — дополняем
-    clean_sentences = clean_sentences[:3]
-    while len(clean_sentences) < 3:
-        filler = "Ситуация развивается последовательно."
-        clean_sentences.append(filler)
-
-    # собираем итог в одну строку без переносов
-        # собираем итог в одну строку без переносов
-    joined = " ".join(s if s.endswith(('.', '!', '?')) else s + '.' for s in clean_sentences)
-    joined = joined.strip()
-
-    # убираем все лишние пробелы, табы и переводы строк
-    joined = re.sub(r"\s*\n\s*", " ", joined)
-    joined = re.sub(r"\s{2,}", " ", joined)
-
-    # финальная сборка
-    new_text = "\n".join(head + [f"🌙 Итог: {joined}"])
-    return new_text.strip()
 
+# ===================== УТИЛИТА ДЛЯ СЦЕНАРИЯ =====================
+def merge_with_scenario(base_prompt: str, scenario_ctx: Optional[str]) -> str:
+    """Просто склеивает текст с уточняющим сценарием при наличии."""
+    return f"{base_prompt}\n\n{scenario_ctx}" if scenario_ctx else base_prompt
 
 
-def _sanitize_plain_text(text: str) -> str:
+# ===================== ВЫЗОВ LLM =====================
+async def _post_messages(
+    messages: List[Dict[str, str]],
+    *,
+    temperature: Optional[float] = None,
+    kind: str = "default",
+    profile: Optional[str] = None,
+    hints: Optional[Dict[str, Any]] = None,
+    background: bool = False,
+    priority: Optional[str] = None,
+) -> str:
     """
-    Убирает маркдаун и маркеры списков (*, -, • и т.п.), оставляя обычный текст.
-    Сохраняет нумерацию вида '1) ...', '2) ...' — потом мы её заменим на ⭐️.
+    Текст ответа модели через маршрутизатор провайдеров; при неудаче — LLMError
+    (см. services/llm_errors.py). kind — тип вызова для выбора маршрута,
+    profile — профиль генерации (maxTokens/temperature, см. services/gen_profiles.py);
+    по умолчанию выводится из kind. Явная temperature важнее профильной.
+    background=True — фоновая работа: отложенный API со своей очередью
+    (services/llm_batch.py; при LLM_BATCH=0 — синхронный путь). Отправку
+    операции BatchRunner сам ставит в лимитер классом batch.
+    priority — класс в очереди лимитера (interactive/follow_up/speculative/batch);
+    по умолчанию: фон — batch, итог/совет — follow_up, остальное — interactive.
     """
-    if not isinstance(text, str):
+    book = get_profile_book()
+    prof = book.resolve(kind, profile)
+    max_tokens = prof.max_tokens
+    temp = prof.temperature if temperature is None else temperature
+    priority = priority or ("batch" if background else _KIND_PRIORITY.get(kind, "interactive"))
+
+    async def call() -> str:
+        with llm_priority(priority):
+            text = await get_router().complete(
+                messages, kind=kind, temperature=temp, max_tokens=max_tokens, hints=hints,
+            )
+        book.observe(prof, text, max_tokens)
         return text
 
-    # уберём жирный/курсив (**...**, *...*, __...__)
-    text = text.replace("**", "").replace("__", "")
-
-    # построчная очистка маркеров
-    cleaned_lines = []
-    for line in text.splitlines():
-        raw = line.lstrip()
-        # уберём markdown-маркеры
-        for marker in ("* ", "- ", "• ", "— ", "・ ", "∙ ", "→ ", "> "):
-            if raw.startswith(marker):
-                raw = raw[len(marker):]
-                break
-        if raw.startswith(("*— ", "*- ", "*• ", "-• ", "•- ")):
-            raw = raw[2:].lstrip()
-        cleaned_lines.append(raw)
-
-    cleaned = "\n".join(cleaned_lines)
-    cleaned = re.sub(r"\n{3,}", "\n\n", cleaned).strip()
-    return cleaned
-
-
-def _enforce_summary_no_advice(text: str) -> str:
+    async def dispatch() -> str:
+        if background and LLM_BATCH:
+            text = await get_batch_runner().run(messages, temperature=temp, max_tokens=max_tokens)
+            book.observe(prof, text, max_tokens)
+            return text
+        if not LLM_SINGLE_FLIGHT:
+            return await call()
+        # класс в ключе: интерактивный запрос не должен ждать чужой фоновый в хвосте очереди
+        key = payload_key({
+            "kind": kind, "temperature": temp, "max_tokens": max_tokens, "priority": priority, "messages": messages,
+        })
+        return await get_single_flight().do(key, call)
+
+    cassette = get_cassette()
+    if cassette is None:
+        return await dispatch()
+    return await cassette.through(kind, messages, dispatch, temperature=temp, max_tokens=max_tokens)
+
+async def _stream_messages(
+    messages: List[Dict[str, str]],
+    *,
+    temperature: Optional[float] = None,
+    kind: str = "default",
+    profile: Optional[str] = None,
+    hints: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
     """
-    Делает 'Итог' фактическим резюме без советов/инструкций.
-    Убирает фразы с типовыми 'советными' маркерами только в блоке 'Итог'.
+    Стриминговый вызов: отдаёт НАКОПЛЕННЫЙ текст ответа по мере генерации.
+    Ошибки — LLMError; вызывающий решает, чем заменить недополученное.
     """
-    if not isinstance(text, str):
-        return text
-
-    lines = text.splitlines()
-    itog_idx = None
-    for i, ln in enumerate(lines):
-        low = ln.strip().lower()
-        if low.startswith("итог:") or low == "итог" or low.startswith("🌙 итог"):
-            itog_idx = i
-            break
-    if itog_idx is None:
-        return text
-
-    head = lines[:itog_idx+1]
-    tail = lines[itog_idx+1:]
-    tail_text = " ".join(s.strip() for s in tail if s.strip())
-    if not tail_text:
-        return text
-
-    ADVICE_HINTS = [
-        "совет", "советую", "рекоменд", "стоит", "следует", "лучше",
-        "нужно", "необходимо", "постарайтесь", "попробуйте", "попробуй",
-        "сделайте", "сделай", "возьмите", "берите", "договоритесь",
-        "оформите", "попросите", "перестаньте", "начните", "уделите",
-        "сосредоточьтесь", "подумайте", "избегайте", "продолжайте",
-        "не забывайте", "держитесь", "планируйте", "добейтесь"
+    book = get_profile_book()
+    prof = book.resolve(kind, profile)
+    max_tokens = prof.max_tokens
+    temp = prof.temperature if temperature is None else temperature
+    cassette = get_cassette()
+    if cassette is not None and cassette.mode == "replay":
+        yield await cassette.replay(kind, messages)
+        return
+    txt = ""
+    t0 = time.monotonic()
+    # стримятся только живые расклады — класс interactive (значение по умолчанию)
+    async with contextlib.aclosing(
+        get_router().stream(messages, kind=kind, temperature=temp, max_tokens=max_tokens, hints=hints)
+    ) as texts:
+        async for txt in texts:
+            yield txt
+    book.observe(prof, txt, max_tokens)
+    if cassette is not None:
+        cassette.record(kind, messages, txt, time.monotonic() - t0, temperature=temp, max_tokens=max_tokens)
+
+def _tarot_messages(prompt: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "text": "Ты опытный таролог и психолог с 20-летним стажем. Отвечай точно по инструкции."},
+        {"role": "user", "text": prompt}
     ]
 
-    sentences = re.split(r"(?<=[\.\!\?])\s+", tail_text)
-    cleaned = []
-    for s in sentences:
-        low = s.strip().lower()
-        if low and not any(h in low for h in ADVICE_HINTS):
-            cleaned.append(s.strip())
-
-    if not cleaned:
-        cleaned = ["Краткое резюме карт: события и тенденции, вытекающие из расклада."]
-
-    new_tail_text = " ".join(cleaned).strip()
-    new_text = "\n".join(head + [new_tail_text])
-    new_text = re.sub(r"\n{3,}", "\n\n", new_text).strip()
-    return new_text
-
-
-def _to_star_bullets(text: str) -> str:
-    """
-    Заменяет ведущую нумерацию вида '1) ', '2. ', '3)  ' на '⭐️ ' для строк карт.
-    Также заменяет возможный символ '★ ' на '⭐️ '.
-    """
-    if not isinstance(text, str):
-        return text
-    lines = text.splitlines()
-    out = []
-    for ln in lines:
-        s = ln.lstrip()
-        if re.match(r"^\d+[\)\.]?\s+", s):
-            ln = re.sub(r"^\s*\d+[\)\.]?\s+", "⭐️ ", ln)
-        ln = re.sub(r"^\s*★\s+", "⭐️ ", ln)
-        out.append(ln)
-    return "\n".join(out)
-
-
-def _ensure_moon_on_itog(text: str) -> str:
-    """
-    Нормализует строку заголовка Итога в вид '🌙 Итог:'.
-    Удаляет возможную ведущую ⭐️ перед Итогом.
-    """
-    if not isinstance(text, str):
-        return text
-
-    lines = text.splitlines()
-    for i, ln in enumerate(lines):
-        base = ln.strip()
-        if not base:
-            continue
-        # любые варианты начала строки Итога
-        if re.match(r"^(?:⭐️\s*)?Итог\b", base, flags=re.IGNORECASE) or base.lower().startswith("🌙 итог"):
-            m = re.match(r"^(?:\s*⭐️\s*)?(?:🌙\s*)?Итог:?\s*(.*)$", ln, flags=re.IGNORECASE)
-            rest = (m.group(1) if m else "").strip()
-            lines[i] = ("🌙 Итог:" + (f" {rest}" if rest else "")).rstrip()
-            break
-    return "\n".join(lines).strip()
-
-
-def _prefix_paragraphs_with_stars_except_itog(text: str) -> str:
-    """
-    Добавляет '⭐️ ' в начало первой непустой строки каждого абзаца,
-    КРОМЕ строки заголовка Итога ('🌙 Итог:' / 'Итог:').
-    Абзацы разделены пустой строкой.
-    """
-    if not isinstance(text, str):
-        return text
-
-    paragraphs = re.split(r"\n\s*\n", text.strip(), flags=re.DOTALL)
-    result: List[str] = []
-
-    for p in paragraphs:
-        lines = p.splitlines()
-        for i, ln in enumerate(lines):
-            if not ln.strip():
-                continue
-            # если это Итог — не ставим звезду и нормализуем на луну
-            if re.match(r"^\s*(?:🌙\s*)?Итог\b", ln, flags=re.IGNORECASE):
-                m = re.match(r"^\s*(?:🌙\s*)?Итог:?\s*(.*)$", ln, flags=re.IGNORECASE)
-                rest = (m.group(1) if m else "").strip()
-                lines[i] = ("🌙 Итог:" + (f" {rest}" if rest else "")).rstrip()
-                break
-            # иначе — обеспечиваем ведущую звезду
-            if not re.match(r"^\s*⭐️\s+", ln):
-                lines[i] = f"⭐️ {ln.lstrip()}"
-            break
-        result.append("\n".join(lines))
-
-    return "\n\n".join(result).strip()
-
-
-def _strip_star_prefixes(text: str) -> str:
-    """
-    Убирает любые ведущие '⭐️ ' в начале строк и перед 'Карты:'.
-    Используется только для советов (там звёзд быть не должно).
-    """
-    if not isinstance(text, str):
-        return text
-    lines = text.splitlines()
-    cleaned = []
-    for ln in lines:
-        ln = re.sub(r"^\s*⭐️\s+", "", ln)
-        ln = re.sub(r"^\s*⭐️\s*(Карты:)", r"\1", ln, flags=re.IGNORECASE)
-        cleaned.append(ln)
-    return "\n".join(cleaned).strip()
-
-
-# ===================== УТИЛИТА ДЛЯ СЦЕНАРИЯ =====================
-def merge_with_scenario(base_prompt: str, scenario_ctx: Optional[str]) -> str:
-    """Просто склеивает текст с уточняющим сценарием при наличии."""
-    return f"{base_prompt}\n\n{scenario_ctx}" if scenario_ctx else base_prompt
+async def qwen_chat_completion(
+    prompt: str,
+    *,
+    kind: str = "default",
+    profile: Optional[str] = None,
+    hints: Optional[Dict[str, Any]] = None,
+    background: bool = False,
+    priority: Optional[str] = None,
+) -> str:
+    return await _post_messages(
+        _tarot_messages(prompt), kind=kind, profile=profile, hints=hints, background=background, priority=priority,
+    )
 
+async def qwen_chat_completion_stream(
+    prompt: str,
+    *,
+    kind: str = "default",
+    profile: Optional[str] = None,
+    hints: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    async for txt in _stream_messages(_tarot_messages(prompt), kind=kind, profile=profile, hints=hints):
+        yield txt
+
+async def qwen_chat_completion_messages(
+    messages: List[Dict[str, str]],
+    *,
+    temperature: Optional[float] = None,
+    kind: str = "default",
+    profile: Optional[str] = None,
+    hints: Optional[Dict[str, Any]] = None,
+) -> str:
+    return await _post_messages(messages, temperature=temperature, kind=kind, profile=profile, hints=hints)
 
-# ===================== ВЫЗОВ ЯНДЕКС LLM =====================
-def _headers() -> Dict[str, str]:
-    if not YANDEX_API_KEY:
-        raise RuntimeError("Не задан YANDEX_API_KEY (переменная окружения).")
-    return {
-        "Content-Type": "application/json",
-        "Authorization": f"Api-Key {YANDEX_API_KEY}",
-    }
 
-def _build_prompt_payload(messages: List[Dict[str, str]], *, temperature: Optional[float] = None) -> Dict[str, Any]:
+def llm_stats() -> Dict[str, Dict[str, Any]]:
+    """Сводка по слою LLM-вызовов (для /llm_stats)."""
     return {
-        "modelUri": YANDEX_MODEL_URI,
-        "completionOptions": {
-            "stream": False,
-            "temperature": YANDEX_TEMPERATURE if temperature is None else float(temperature),
-            "maxTokens": YANDEX_MAX_TOKENS,
-        },
-        "messages": messages,
+        "http": get_llm_client().pool_stats(),
+        "cache": get_interp_cache().cache_stats(),
+        "single_flight": get_single_flight().single_flight_stats(),
+        "limiter": get_rate_limiter().limiter_stats(),
+        **get_rate_limiter().priority_stats(),
+        "digest": digest_stats(),
+        "scenario": scenario_stats(),
+        "advice_lexicon": get_advice_lexicon().lexicon_stats(),
+        "profiles": get_profile_book().profile_stats(),
+        "batch": get_batch_runner().batch_stats(),
+        **({"library": get_interp_library().library_stats()} if get_interp_library() else {}),
+        **({"cassette": get_cassette().cassette_stats()} if get_cassette() else {}),
+        **get_router().router_stats(),
     }
 
-def _extract_text_from_response(data: Dict[str, Any]) -> str:
-    try:
-        alts = data["result"]["alternatives"]
-        if alts:
-            msg = alts[0].get("message", {})
-            txt = msg.get("text")
-            if isinstance(txt, str) and txt.strip():
-                return txt.strip()
-            txt2 = alts[0].get("text")
-            if isinstance(txt2, str) and txt2.strip():
-                return txt2.strip()
-    except Exception:
-        pass
-    return json.dumps(data, ensure_ascii=False)
-
-async def _post_messages(messages: List[Dict[str, str]], *, temperature: Optional[float] = None) -> str:
-    payload = _build_prompt_payload(messages, temperature=temperature)
-
-    def _do_request(headers):
-        resp = requests.post(YANDEX_URL, headers=headers, json=payload, timeout=60)
-        resp.raise_for_status()
-        return resp.json()
-
-    try:
-        headers = _headers()
-        data = await asyncio.to_thread(_do_request, headers)
-        return _extract_text_from_response(data)
-    except RuntimeError as e:
-        return f"Ошибка конфигурации: {e}"
-    except requests.HTTPError as e:
-        return f"Ошибка HTTP: {e}"
-    except requests.RequestException as e:
-        return f"Сетевая ошибка: {e}"
-    except Exception as e:
-        return f"Неожиданная ошибка: {e}"
-
-async def qwen_chat_completion(prompt: str) -> str:
-    messages = [
-        {"role": "system", "text": "Ты опытный таролог и психолог с 20-летним стажем. Отвечай точно по инструкции."},
-        {"role": "user", "text": prompt}
-    ]
-    return await _post_messages(messages)
-
-async def qwen_chat_completion_messages(messages: List[Dict[str, str]], *, temperature: Optional[float] = None) -> str:
-    return await _post_messages(messages, temperature=temperature)
-
 
 # ===================== ПРЕДСКАЗАНИЕ =====================
-async def gpt_make_prediction(
+def _prediction_prompt(
     question: str,
     theme: str,
     spread: str,
     cards_list: str,
-    scenario_ctx: Optional[str] = None
+    scenario_ctx: Optional[str] = None,
 ) -> str:
-    """
-    Жёстко держим тему и (если есть) уточнение.
-    Без маркдауна. Расшифровка карт — со '⭐️ ' вместо нумерации.
-    Абзацы начинаются со '⭐️ ', а заголовок Итога — строго '🌙 Итог:' (без звезды).
-    Итог — РОВНО 3 предложения резюме без советов.
-    """
     scenario_line = f"\nУточняющий сценарий: {scenario_ctx}" if scenario_ctx else ""
 
     if theme.lower().startswith("любов"):
@@ -417,7 +258,7 @@ async def gpt_make_prediction(
         must = "долгосрочные тренды жизни, личные уроки, трансформации"
         tone = "взвешенный, спокойный"
 
-    prompt = f"""
+    return f"""
 Ты — опытный таролог. Русский язык, чётко и по делу. Один связный ответ без вступлений.
 
 Тема: {theme}{scenario_line}
@@ -439,20 +280,310 @@ async def gpt_make_prediction(
 - 🌙 Итог — РОВНО 3 предложения резюме общего послания карт, без советов, инструкций и императивов («нужно», «следует», «совет», «попробуйте» и т.п.).
 """.strip()
 
-    raw = await qwen_chat_completion(prompt)
 
-    # Форматирование и нормализация, как было
-    txt = _sanitize_plain_text(raw)
-    txt = _enforce_summary_no_advice(txt)              # мягкая чистка от советов
-    txt = _to_star_bullets(txt)
-    txt = _ensure_moon_on_itog(txt)
-    txt = _prefix_paragraphs_with_stars_except_itog(txt)
+def _prediction_cache_key(
+    question: str,
+    theme: str,
+    spread: str,
+    cards_list: str,
+    scenario_ctx: Optional[str],
+) -> Optional[str]:
+    """Ключ кэша — только для одиночной карты (карта дня, пункт сценария); иначе None."""
+    card = (cards_list or "").strip()
+    if not INTERP_CACHE_ENABLED or not card or card == "—" or "," in card:
+        return None
+    return interp_cache_key(card, theme=theme, spread=spread, question=question, scenario_ctx=scenario_ctx)
+
+
+def _library_text(
+    question: str,
+    theme: str,
+    spread: str,
+    cards_list: str,
+    scenario_ctx: Optional[str],
+) -> Optional[str]:
+    """Готовый «сырой» текст из офлайн-библиотеки (services/interp_library.py) — только одиночная карта."""
+    library = get_interp_library()
+    card = (cards_list or "").strip()
+    if library is None or not card or card == "—" or "," in card:
+        return None
+    return library.get(interp_cache_key(card, theme=theme, spread=spread, question=question, scenario_ctx=scenario_ctx))
+
+
+def _prediction_route(theme: str, spread: str, cards_list: str) -> Tuple[str, Dict[str, Any]]:
+    """Тип вызова для маршрутизатора провайдеров + подсказки (карты) для офлайн-бэкендов."""
+    cards = [c.strip() for c in (cards_list or "").split(",") if c.strip() and c.strip() != "—"]
+    if spread == "summary":
+        kind = "summary"
+    elif theme == "Карта дня":
+        kind = "daily"
+    elif len(cards) == 1:
+        kind = "point"
+    else:
+        kind = "prediction"
+    return kind, {"cards": cards, "theme": theme}
+
 
-    # ЖЁСТКО: ровно 3 предложения и без советов в Итоге
-    txt = _force_itog_three_sentences_no_advice(txt)
-    return txt
+def fast_mode_active() -> bool:
+    """Очередь лимитера заполнена выше порога — живые расклады отдаём по шаблонам."""
+    if not TAROT_FAST_MODE:
+        return False
+    limiter = get_rate_limiter()
+    return limiter.limiter_stats()["queue_depth"] >= max(1, int(limiter.queue_max * TAROT_FAST_MODE_QUEUE))
 
 
+def _partial_output(output: str) -> str:
+    """Профиль нормализации промежуточных кусков стрима для итогового профиля output."""
+    return "point_partial" if output == "point" else "partial"
+
+
+def template_prediction(
+    theme: str, spread: str, cards_list: str, question: str = "", output: str = "prediction"
+) -> str:
+    """
+    Толкование без LLM в том же формате, что у gpt_make_prediction: для
+    таймаутов/перегрузки в хендлерах и быстрого режима. Для spread="summary" —
+    только текст Итога (3 предложения).
+    """
+    cards = [c.strip() for c in (cards_list or "").split(",") if c.strip() and c.strip() != "—"]
+    if spread == "summary":
+        return render_itog(cards, theme=theme)
+    return normalize(render_reading(cards, theme=theme, question=question), output)
+
+
+async def gpt_make_prediction(
+    question: str,
+    theme: str,
+    spread: str,
+    cards_list: str,
+    scenario_ctx: Optional[str] = None,
+    output: str = "prediction",
+) -> str:
+    """
+    Жёстко держим тему и (если есть) уточнение.
+    Без маркдауна. Расшифровка карт — со '⭐️ ' вместо нумерации.
+    Абзацы начинаются со '⭐️ ', а заголовок Итога — строго '🌙 Итог:' (без звезды).
+    Итог — РОВНО 3 предложения резюме без советов.
+    output — профиль services/text_normalizer.py под место вызова
+    ("point" — блок пункта сценария, "summary" — общий итог одной строкой).
+    """
+    prompt = _prediction_prompt(question, theme, spread, cards_list, scenario_ctx)
+    key = _prediction_cache_key(question, theme, spread, cards_list, scenario_ctx)
+    kind, hints = _prediction_route(theme, spread, cards_list)
+    library_raw = _library_text(question, theme, spread, cards_list, scenario_ctx)
+    if library_raw is not None:
+        return normalize(library_raw, output)
+    if fast_mode_active():
+        cached = await get_interp_cache().get_variant(key) if key is not None else None
+        if cached is not None:
+            return normalize(cached, output)
+        print(f"[tarot_ai] быстрый режим: шаблонное толкование ({kind})")
+        return template_prediction(theme, spread, cards_list, question, output)
+    if key is None:
+        raw = await qwen_chat_completion(prompt, kind=kind, hints=hints)
+    else:
+        raw = await get_interp_cache().get_or_create(key, lambda: qwen_chat_completion(prompt, kind=kind, hints=hints))
+    return normalize(raw, output)
+
+
+def format_prediction(raw: str) -> str:
+    """Форматирование «сырого» ответа модели так же, как в gpt_make_prediction."""
+    return normalize(raw)
+
+
+async def gpt_make_prediction_raw(
+    question: str,
+    theme: str,
+    spread: str,
+    cards_list: str,
+    scenario_ctx: Optional[str] = None,
+    *,
+    background: bool = True,
+) -> Optional[str]:
+    """
+    Один «сырой» ответ модели в обход кэша — для фоновой предгенерации
+    (по умолчанию через пакетный путь). None, если LLM вернула ошибку (такое не сохраняем).
+    """
+    try:
+        kind, hints = _prediction_route(theme, spread, cards_list)
+        return await qwen_chat_completion(
+            _prediction_prompt(question, theme, spread, cards_list, scenario_ctx),
+            kind=kind, hints=hints, background=background,
+        )
+    except LLMError as e:
+        print(f"[tarot_ai] предгенерация не удалась: {e!r}")
+        return None
+
+
+async def gpt_make_prediction_stream(
+    question: str,
+    theme: str,
+    spread: str,
+    cards_list: str,
+    scenario_ctx: Optional[str] = None,
+    output: str = "prediction",
+) -> AsyncIterator[str]:
+    """
+    То же, что gpt_make_prediction, но по мере генерации отдаёт накопленный
+    текст (слегка нормализованный). ПОСЛЕДНЕЕ значение — полностью
+    отформатированный ответ, идентичный gpt_make_prediction.
+    """
+    prompt = _prediction_prompt(question, theme, spread, cards_list, scenario_ctx)
+    key = _prediction_cache_key(question, theme, spread, cards_list, scenario_ctx)
+    library_raw = _library_text(question, theme, spread, cards_list, scenario_ctx)
+    if library_raw is not None:
+        yield normalize(library_raw, output)
+        return
+    cache = get_interp_cache()
+    if key is not None:
+        cached = await cache.get_variant(key)
+        if cached is not None:
+            yield normalize(cached, output)
+            return
+
+    raw = ""
+    kind, hints = _prediction_route(theme, spread, cards_list)
+    if fast_mode_active():
+        print(f"[tarot_ai] быстрый режим: шаблонное толкование ({kind})")
+        yield template_prediction(theme, spread, cards_list, question, output)
+        return
+    partial = _partial_output(output)
+    async for raw in qwen_chat_completion_stream(prompt, kind=kind, hints=hints):
+        yield normalize(raw, partial)
+    if key is not None and raw.strip():
+        await cache.put_variant(key, raw)
+    yield normalize(raw, output)
+
+
+
+
+# ===================== СЦЕНАРИЙ ОДНИМ ЗАПРОСОМ =====================
+# Вместо N+1 вызовов (по пункту + итог) — один ответ с разметкой
+# «=== ПУНКТ k ===» … «=== ИТОГ ===», который разбираем обратно по пунктам.
+# Модель иногда пишет «Пункт 1. текст» в одну строку — это тоже разделитель.
+_SCENARIO_MARK_RE = re.compile(
+    r"^[ \t>*#=\-]*(?:ПУНКТ\s*(?P<num>\d{1,2})|(?:🌙\s*)?(?P<itog>ИТОГ))"
+    r"[ \t*#]*(?:={2,}[ \t*#=]*|:[ \t]*|[.)]?[ \t*#=]*$|[.)][ \t]+(?=\S))",
+    re.M | re.I,
+)
+_SCENARIO_MIN_BLOCK = 40  # короче — считаем, что пункт не распарсился
+
+
+@dataclass
+class ScenarioStats:
+    calls: int = 0
+    points_parsed: int = 0
+    points_missed: int = 0    # догенерированы отдельными вызовами
+    itog_missed: int = 0
+    timeouts: int = 0
+    errors: int = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+_SCENARIO_STATS = ScenarioStats()
+
+
+def scenario_stats() -> Dict[str, Any]:
+    return _SCENARIO_STATS.snapshot()
+
+
+def note_scenario_failure(timeout: bool) -> None:
+    """Общий запрос сценария не удался (таймаут/ошибка LLM) — все пункты пойдут отдельными вызовами."""
+    if timeout:
+        _SCENARIO_STATS.timeouts += 1
+    else:
+        _SCENARIO_STATS.errors += 1
+
+
+def _scenario_prompt(theme: str, scenario_title: str, points: List[str], cards: List[str]) -> str:
+    pairs = "\n".join(
+        f"{i}. {p} — карта: {cards[i - 1] if i - 1 < len(cards) else '—'}"
+        for i, p in enumerate(points, start=1)
+    )
+    return f"""
+Ты — опытный таролог. Русский язык, чётко и по делу. Без вступлений.
+
+Тема: {theme}
+Сценарий: {scenario_title}
+Пункты расклада и выпавшие карты (по порядку):
+{pairs}
+
+Формат ответа — СТРОГО такие разделители, каждый на отдельной строке:
+=== ПУНКТ 1 ===
+<толкование карты пункта 1>
+=== ПУНКТ 2 ===
+<толкование карты пункта 2>
+… и так для всех {len(points)} пунктов, затем:
+=== ИТОГ ===
+<итог>
+
+Требования к толкованию пункта:
+- 5–8 предложений: символика карты и её смысл именно в контексте пункта, темы и сценария.
+- Если карта перевёрнутая — чётко укажи влияние перевёрнутости (ослабление, искажение, препятствие и т.п.).
+- Не повторяй название пункта и не добавляй заголовков.
+
+Требования к итогу:
+- РОВНО 3 предложения общего послания расклада, от второго лица («Вы»).
+- Не упоминай названия карт и не перечисляй пункты.
+- Без советов, инструкций и императивов («нужно», «следует», «совет», «попробуйте» и т.п.).
+
+НИКАКОГО маркдауна/буллетов/эмодзи.
+""".strip()
+
+
+def parse_scenario_reading(text: str, n_points: int) -> Tuple[List[Optional[str]], Optional[str]]:
+    """
+    Разбирает ответ с разметкой «=== ПУНКТ k ===» / «=== ИТОГ ===».
+    Возвращает (тексты пунктов по порядку, итог); None — пункт/итог не распознан
+    (нет разделителя, дубль, пустой или слишком короткий блок).
+    """
+    points: List[Optional[str]] = [None] * n_points
+    itog: Optional[str] = None
+    if not isinstance(text, str) or not text.strip():
+        return points, itog
+
+    marks = list(_SCENARIO_MARK_RE.finditer(text))
+    seen: set = set()
+    for i, m in enumerate(marks):
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(text)
+        body = text[m.end():end].strip().strip("=").strip()
+        if m.group("itog"):
+            if itog is None and body:
+                itog = body
+            continue
+        k = int(m.group("num")) - 1
+        if not (0 <= k < n_points) or k in seen:
+            if 0 <= k < n_points:
+                points[k] = None  # дубль — не доверяем ни одному варианту
+            continue
+        seen.add(k)
+        points[k] = body if len(body) >= _SCENARIO_MIN_BLOCK else None
+    return points, itog
+
+
+async def gpt_make_scenario_reading(
+    *,
+    theme: str,
+    scenario_title: str,
+    points: List[str],
+    cards: List[str],
+) -> Tuple[List[Optional[str]], Optional[str]]:
+    """
+    Один запрос на весь сценарий. Тексты пунктов — «сырые» (их чистит вызывающий
+    под свой формат блока), None — пункт нужно догенерировать отдельным вызовом.
+    """
+    raw = await qwen_chat_completion(
+        _scenario_prompt(theme, scenario_title, points, cards), kind="scenario", hints={"cards": list(cards)},
+    )
+    parsed, itog = parse_scenario_reading(normalize(raw, "plain"), len(points))
+    _SCENARIO_STATS.calls += 1
+    missed = parsed.count(None)
+    _SCENARIO_STATS.points_parsed += len(parsed) - missed
+    _SCENARIO_STATS.points_missed += missed
+    _SCENARIO_STATS.itog_missed += itog is None
+    return parsed, itog
 
 
 # ===================== СОВЕТЫ =====================
@@ -461,11 +592,14 @@ async def gpt_make_advice_from_yandex_answer(
     yandex_answer_text: str,
     advice_cards_list: List[str] | None,
     advice_count: int = 1,
+    speculative: bool = False,
 ) -> str:
     """
     Совет БЕЗ звёзд в начале строк и без других эмодзи внутри.
     Первая строка (если есть карты) — 'Карты: ...' (без ⭐️).
     В самом конце добавляется один '🔮'.
+    speculative=True — заготовка заранее (services/advice_prefetch.py): синхронный
+    путь, но в лимитере классом speculative, позади живых запросов.
     """
     have_cards = bool(advice_cards_list)
 
@@ -476,6 +610,8 @@ async def gpt_make_advice_from_yandex_answer(
     )
 
     cards_line_for_prompt = f"Карты: {', '.join(advice_cards_list)}\n" if have_cards else ""
+    # вместо полного толкования — дайджест: карты, ключевые фразы, Итог
+    yandex_answer_text = compact_context(yandex_answer_text, purpose=f"advice_{advice_count}")
 
     prompt = f"""
 Ты — таролог. Сформируй ПРАКТИЧНЫЙ совет на основе ответа от Яндекса ниже.
@@ -499,12 +635,12 @@ async def gpt_make_advice_from_yandex_answer(
 ---
 """.strip()
 
-    raw = await qwen_chat_completion(prompt)
-    text = _sanitize_plain_text(raw)
-    text = re.sub(r"^\s*Текст\s+совета\s*:\s*", "", text, flags=re.IGNORECASE)
-
-    # убираем любые случайно попавшие звёзды в начале строк
-    text = _strip_star_prefixes(text)
+    raw = await qwen_chat_completion(
+        prompt, kind="advice", profile=advice_profile(advice_count), hints={"cards": list(advice_cards_list or [])},
+        priority="speculative" if speculative else None,
+    )
+    # без маркдауна, шапки «Текст совета:» и случайно попавших звёзд в начале строк
+    text = normalize(raw, "advice")
 
     # если есть карты и их строка пропущена — добавим без звезды
     if have_cards and not text.lower().startswith("карты:"):
@@ -555,12 +691,10 @@ async def gpt_make_advice(
 Карты Совета: {", ".join(advice_cards_list)}
 """.strip()
 
-    raw = await qwen_chat_completion(prompt)
-    text = _sanitize_plain_text(raw)
-    text = re.sub(r"^\s*Текст\s+совета\s*:\s*", "", text, flags=re.IGNORECASE)
-
-    # убираем любые случайные звезды от модели
-    text = _strip_star_prefixes(text)
+    # 3–6 предложений — длинный совет
+    raw = await qwen_chat_completion(prompt, kind="advice", profile="advice_long", hints={"cards": list(advice_cards_list)})
+    # без маркдауна, шапки «Текст совета:» и случайных звёзд от модели
+    text = normalize(raw, "advice")
 
     # добавим строку «Карты: ...» при необходимости (без звезды)
     if advice_cards_list and not text.lower().startswith("карты:"):
@@ -1,17 +1,13 @@
-from pathlib import Path
-import json
 import random
 import asyncio
 from transformers import AutoModelForCausalLM, AutoTokenizer
 import torch
 import re
 
-# Путь к файлу с картами
-CARDS_PATH = Path(__file__).resolve().parent.parent / "data" / "tarot_cards.json"
+from services.card_registry import get_card_registry
 
 def load_cards():
-    with open(CARDS_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return [c.as_dict() for c in get_card_registry()]
 
 cards = load_cards()
 
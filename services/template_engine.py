@@ -0,0 +1,218 @@
+# services/template_engine.py
+from __future__ import annotations
+
+"""
+Мгновенное толкование без LLM — по значениям карт из data/tarot_cards.json.
+
+Собирает полноценный ответ в формате бота:
+    ⭐️ <Карта>: <2 предложения по значению карты под тему>
+    …
+    🌙 Итог: <ровно 3 предложения>
+Фразы подобраны под тему (любовь/работа/судьба/саморазвитие/карта дня/общая);
+вариант фразы выбирается детерминированно по карте и вопросу — одинаковый
+запрос даёт одинаковый текст. Значения разбираются один раз при загрузке,
+дальше — только подстановка строк (микросекунды).
+
+Где используется:
+  - фолбэк при таймауте/перегрузке/открытом breaker в хендлерах;
+  - «быстрый режим» в tarot_ai, когда очередь к LLM почти заполнена;
+  - TemplateProvider — последний рубеж маршрутизатора.
+"""
+
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from services.card_registry import REVERSED_SUFFIX, CardRegistry, get_card_registry
+
+
+_REVERSED_PREFIX = "Обратное значение или искажение:"
+
+
+# ===================== ФРАЗЫ ПО ТЕМАМ =====================
+# {kw} — ключевые слова карты, {sphere} — « в сфере …» для младших арканов (или пусто)
+_UPRIGHT: Dict[str, Tuple[str, ...]] = {
+    "love": (
+        "В отношениях на первый план выходят: {kw}{sphere}. Чувства здесь получают опору и раскрываются естественно.",
+        "Карта говорит о том, что между вами сейчас важны {kw}{sphere}. Эмоциональная связь развивается в благоприятном ключе.",
+        "Для сердца эта карта означает: {kw}{sphere}. Взаимность строится на открытости и честности.",
+    ),
+    "work": (
+        "В делах ключевыми становятся {kw}{sphere}. Рабочая ситуация складывается в вашу пользу.",
+        "Карта показывает, что в работе сейчас решают {kw}{sphere}. Усилия постепенно дают ощутимый результат.",
+        "Для карьеры и денег здесь важны {kw}{sphere}. Обстоятельства поддерживают движение вперёд.",
+    ),
+    "fate": (
+        "На жизненном пути проявляются {kw}{sphere}. Этот этап открывает новые возможности.",
+        "Судьба выводит на первый план такие темы: {kw}{sphere}. События складываются в понятную последовательность.",
+        "Карта указывает на влияние таких сил: {kw}{sphere}. Происходящее ведёт к важному повороту.",
+    ),
+    "self": (
+        "Во внутреннем росте сейчас важны {kw}{sphere}. Вы лучше понимаете свои опоры и ресурсы.",
+        "Карта отражает такие качества: {kw}{sphere}. Они помогают вам становиться увереннее.",
+        "Для саморазвития ключевыми становятся {kw}{sphere}. Внутренние изменения идут в верном направлении.",
+    ),
+    "daily": (
+        "Сегодняшний день окрашен такими темами: {kw}{sphere}. Их влияние будет заметно в обычных делах.",
+        "В течение дня проявятся {kw}{sphere}. Это задаёт ровный и понятный ритм.",
+        "Энергия дня — это {kw}{sphere}. Обстоятельства складываются спокойно и предсказуемо.",
+    ),
+    "general": (
+        "Карта выводит на первый план такие темы: {kw}{sphere}. Ситуация развивается в благоприятном направлении.",
+        "Здесь проявляются {kw}{sphere}. Эти влияния поддерживают ваш запрос.",
+        "Ключевые темы карты — {kw}{sphere}. Обстоятельства складываются последовательно.",
+    ),
+}
+
+_REVERSED: Dict[str, Tuple[str, ...]] = {
+    "love": (
+        "В отношениях искажаются такие темы: {kw}{sphere}. Чувствам может не хватать ясности и доверия.",
+        "Перевёрнутое положение показывает, что {kw}{sphere} проявляются с трудом. Между вами возможны недосказанность и дистанция.",
+        "Для сердца эта карта означает ослабление таких тем: {kw}{sphere}. Эмоции пока не находят свободного выхода.",
+    ),
+    "work": (
+        "В делах буксуют {kw}{sphere}. Рабочие процессы требуют больше времени, чем хотелось бы.",
+        "Перевёрнутая карта показывает, что в работе ослаблены {kw}{sphere}. Возможны задержки и пересмотр планов.",
+        "Для карьеры и денег здесь искажаются {kw}{sphere}. Ресурсы расходуются неравномерно.",
+    ),
+    "fate": (
+        "На жизненном пути {kw}{sphere} проявляются с сопротивлением. Этот этап проверяет устойчивость.",
+        "Перевёрнутое положение говорит о скрытом влиянии: {kw}{sphere}. События пока складываются неочевидно.",
+        "Судьба временно приглушает такие силы: {kw}{sphere}. Поворот откладывается, но не отменяется.",
+    ),
+    "self": (
+        "Во внутреннем мире ослаблены {kw}{sphere}. Вам может не хватать опоры на себя.",
+        "Перевёрнутая карта отражает внутренний конфликт: {kw}{sphere}. Старые установки тормозят рост.",
+        "Для саморазвития искажаются {kw}{sphere}. Изменения идут медленнее и требуют честного взгляда на себя.",
+    ),
+    "daily": (
+        "Сегодня {kw}{sphere} проявляются непросто. День может идти не по плану.",
+        "В течение дня ослаблены {kw}{sphere}. Возможны мелкие задержки и недоразумения.",
+        "Энергия дня искажена: {kw}{sphere}. Обстоятельства складываются неровно.",
+    ),
+    "general": (
+        "Перевёрнутое положение приглушает такие темы: {kw}{sphere}. Ситуация развивается с задержками.",
+        "Здесь {kw}{sphere} проявляются искажённо. Часть влияний пока скрыта.",
+        "Карта показывает, что ослаблены {kw}{sphere}. Обстоятельства требуют больше времени.",
+    ),
+}
+
+# Итог: (тон, главные темы, завершение) — каждое ровно одно предложение
+_ITOG_TONE = {
+    "up": "Расклад в целом складывается благоприятно, и основные влияния работают на вас.",
+    "mixed": "Расклад неоднозначен: поддерживающие влияния соседствуют со сдерживающими.",
+    "down": "Расклад показывает период сопротивления, когда многие процессы идут медленнее.",
+}
+_ITOG_THEMES = "Главные темы ситуации — {kw}."
+_ITOG_CLOSE = {
+    "love": "Отношения проходят важный этап, и его итог зависит от взаимной открытости.",
+    "work": "Рабочая ситуация постепенно проясняется, и её направление уже заметно.",
+    "fate": "Текущий этап пути складывается в цельную картину.",
+    "self": "Внутренние изменения уже начались и продолжают набирать силу.",
+    "daily": "День пройдёт под знаком этих влияний.",
+    "general": "Картина ситуации складывается последовательно.",
+}
+
+
+def theme_key(theme: Optional[str]) -> str:
+    t = (theme or "").lower()
+    if "карта дня" in t:
+        return "daily"
+    if "люб" in t or "отношен" in t:
+        return "love"
+    if "работ" in t or "карьер" in t or "финанс" in t or "деньг" in t:
+        return "work"
+    if "судьб" in t:
+        return "fate"
+    if "саморазв" in t or "развит" in t:
+        return "self"
+    return "general"
+
+
+# ===================== ЗНАЧЕНИЯ КАРТ =====================
+class _Meaning:
+    __slots__ = ("upright", "reversed", "sphere")
+
+    def __init__(self, upright: List[str], reversed_: List[str], sphere: str):
+        self.upright = upright
+        self.reversed = reversed_
+        self.sphere = sphere
+
+
+def _keywords(text: str) -> Tuple[List[str], str]:
+    """'Испытание, настойчивость (Действие, энергия)' → (['испытание', 'настойчивость'], 'действие, энергия')."""
+    text = (text or "").strip()
+    if text.startswith(_REVERSED_PREFIX):
+        text = text[len(_REVERSED_PREFIX):].strip()
+    sphere = ""
+    if text.endswith(")") and "(" in text:
+        text, _, sphere = text[:-1].partition("(")
+        sphere = sphere.strip().lower()
+    words = [w.strip().lower() for w in text.split(",") if w.strip()]
+    return words, sphere
+
+
+_MEANINGS: Optional[Tuple[CardRegistry, Dict[str, _Meaning]]] = None
+
+def _meanings() -> Dict[str, _Meaning]:
+    """Разобранные значения карт; пересобираются, только если реестр колоды перечитан."""
+    global _MEANINGS
+    registry = get_card_registry()
+    if _MEANINGS is None or _MEANINGS[0] is not registry:
+        table: Dict[str, _Meaning] = {}
+        for c in registry:
+            up, sphere = _keywords(c.meaning_upright)
+            rev, _ = _keywords(c.meaning_reversed)
+            table[c.name] = _Meaning(up, rev or up, sphere)
+        _MEANINGS = (registry, table)
+    return _MEANINGS[1]
+
+
+def _split_name(card: str) -> Tuple[str, bool]:
+    card = (card or "").strip()
+    if card.endswith(REVERSED_SUFFIX):
+        return card[: -len(REVERSED_SUFFIX)].strip(), True
+    return card, False
+
+
+def _pick(variants: Sequence[str], *salt: str) -> str:
+    return variants[zlib.crc32("|".join(salt).encode("utf-8")) % len(variants)]
+
+
+# ===================== СБОРКА ТЕКСТА =====================
+def card_sentence(card: str, *, theme: Optional[str] = None, question: str = "") -> str:
+    """Два предложения о карте под тему (без префикса ⭐️)."""
+    base, is_rev = _split_name(card)
+    meaning = _meanings().get(base)
+    key = theme_key(theme)
+    if meaning is None:
+        kw, sphere = "скрытые пока влияния", ""
+    else:
+        kw = ", ".join((meaning.reversed if is_rev else meaning.upright)[:3]) or "скрытые пока влияния"
+        sphere = f" в сфере «{meaning.sphere}»" if meaning.sphere else ""
+    template = _pick((_REVERSED if is_rev else _UPRIGHT)[key], base, question)
+    return template.format(kw=kw, sphere=sphere)
+
+
+def render_itog(cards: Sequence[str], *, theme: Optional[str] = None) -> str:
+    """Итог ровно из трёх предложений (без заголовка)."""
+    table = _meanings()
+    reversed_count = 0
+    counts: Counter = Counter()
+    for card in cards:
+        base, is_rev = _split_name(card)
+        reversed_count += is_rev
+        m = table.get(base)
+        if m is not None:
+            counts.update((m.reversed if is_rev else m.upright)[:2])
+    share = reversed_count / len(cards) if cards else 0.0
+    tone = "up" if share < 0.34 else ("down" if share > 0.66 else "mixed")
+    top = ", ".join(w for w, _ in counts.most_common(3)) or "перемены и выбор"
+    return " ".join((_ITOG_TONE[tone], _ITOG_THEMES.format(kw=top), _ITOG_CLOSE[theme_key(theme)]))
+
+
+def render_reading(cards: Sequence[str], *, theme: Optional[str] = None, question: str = "") -> str:
+    """Полное толкование: блоки «⭐️ Карта: …» и «🌙 Итог: …» из трёх предложений."""
+    paragraphs = [f"⭐️ {card}: {card_sentence(card, theme=theme, question=question)}" for card in cards]
+    paragraphs.append(f"🌙 Итог: {render_itog(cards, theme=theme)}")
+    return "\n\n".join(paragraphs)
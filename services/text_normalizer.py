@@ -0,0 +1,321 @@
+# services/text_normalizer.py
+from __future__ import annotations
+
+"""
+Нормализатор ответов модели: один движок с профилями под места вызова.
+
+Раньше каждый ответ проходил цепочку из шести функций tarot_ai
+(_sanitize_plain_text → _enforce_summary_no_advice → _to_star_bullets →
+_ensure_moon_on_itog → _prefix_paragraphs_with_stars_except_itog →
+_force_itog_three_sentences_no_advice), а clarify_flow сверху добавлял
+sanitize_answer/sanitize_summary. Каждый шаг заново резал текст на строки,
+склеивал обратно и гонял регэкспы без компиляции.
+
+Здесь те же шаги работают над ОДНИМ списком строк: текст режется один раз
+на входе и склеивается один раз на выходе, все шаблоны скомпилированы заранее.
+Шаги клариф-чистки (point/summary) по природе межстрочные (их регэкспы
+захватывают переводы строк) — они идут над текстом, тоже скомпилированными
+шаблонами, после единственной склейки.
+
+Результат побайтно совпадает со старой цепочкой — включая её причуды
+(см. tests/test_text_normalizer.py и tests/golden/normalizer.json).
+
+Профили:
+    prediction     — полный ответ расклада (⭐️-абзацы, «🌙 Итог:» из 3 предложений);
+    partial        — незаконченный текст при стриминге (без добивки Итога);
+    point          — пункт сценария clarify_flow: prediction + чистка блока пункта;
+    point_partial  — то же для стриминга;
+    summary        — общий итог сценария: prediction + чистка итога;
+    advice         — совет: без маркдауна, без звёзд и шапки «Текст совета:»;
+    plain          — только маркдаун и маркеры списков (разбор ответа сценария).
+
+Тексты, пришедшие не через normalize (блоки ответа сценария), дочищаются
+clean_point_text / clean_summary_text.
+"""
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.advice_lexicon import get_advice_lexicon
+from services.card_registry import get_card_registry
+
+
+# ===================== ШАБЛОНЫ =====================
+_MARKERS = ("* ", "- ", "• ", "— ", "・ ", "∙ ", "→ ", "> ")
+_MARKER_PAIRS = ("*— ", "*- ", "*• ", "-• ", "•- ")
+
+_SENT_SPLIT_RX   = re.compile(r"(?<=[.!?])\s+")
+_NUM_BULLET_RX   = re.compile(r"^\d+[\)\.]?\s+")
+_NUM_BULLET_SUB  = re.compile(r"^\s*\d+[\)\.]?\s+")
+_STAR_BULLET_SUB = re.compile(r"^\s*★\s+")
+_ITOG_BASE_RX    = re.compile(r"^(?:⭐️\s*)?Итог\b", re.IGNORECASE)
+_ITOG_LINE_RX    = re.compile(r"^(?:\s*⭐️\s*)?(?:🌙\s*)?Итог:?\s*(.*)$", re.IGNORECASE)
+_PARA_ITOG_RX    = re.compile(r"^\s*(?:🌙\s*)?Итог\b", re.IGNORECASE)
+_PARA_ITOG_LINE  = re.compile(r"^\s*(?:🌙\s*)?Итог:?\s*(.*)$", re.IGNORECASE)
+_STAR_PREFIX_RX  = re.compile(r"^\s*⭐️\s+")
+_MOON_ITOG_RX    = re.compile(r"^\s*🌙\s*Итог\s*:\s*", re.IGNORECASE)
+_MOON_SPLIT_RX   = re.compile(r"🌙\s*Итог\s*:\s*", re.IGNORECASE)
+_WS_RUN_RX       = re.compile(r"\s{2,}")
+_STAR_CARDS_RX   = re.compile(r"^\s*⭐️\s*(Карты:)", re.IGNORECASE)
+_ADVICE_HEAD_RX  = re.compile(r"^\s*Текст\s+совета\s*:\s*", re.IGNORECASE)
+
+# «советные» маркеры Итога — общий словарь services/advice_lexicon.py (области summary / itog)
+_SUMMARY_FALLBACK = "Краткое резюме карт: события и тенденции, вытекающие из расклада."
+_ITOG_FILLER = "Ситуация развивается последовательно."
+
+# клариф-чистка (над текстом)
+EMOJI_RX = re.compile(
+    r"[\U0001F300-\U0001FAFF\U00002500-\U00002BEF\U00002600-\U000026FF\U00002700-\U000027BF\U0001F1E6-\U0001F1FF\ufe0f\ufe0e]",
+    flags=re.UNICODE,
+)
+_LINE_DROP_RX   = re.compile(r"(?im)^\s*(итог|вывод|совет|рекомендац\w*)\s*:\s*.*$", re.UNICODE | re.MULTILINE)
+_INLINE_ITOG_RX = re.compile(r"(?im)\b(итог|вывод|совет)\s*:\s*[^.\n]*[^\n]*")
+_NL3_RX         = re.compile(r"\n{3,}")
+_BULLETS_RX     = re.compile(r"(?m)^\s*[•\-\*\u2022\u25CF>\u27A1\u279C\u25B6]+\s*")
+_CRLF_RX        = re.compile(r"\r\n?")
+_TRAIL_WS_RX    = re.compile(r"[ \t]+(\n)")
+_LEAD_WS_RX     = re.compile(r"(?m)^[ \t]+")
+_INNER_WS_RX    = re.compile(r"[ \t]{2,}")
+_NUMBERED_RX    = re.compile(r"(?m)^\s*(\d+[\).\:]|\-|\•)\s+.*$")
+_CARD_NAMED_RX  = re.compile(r'^[\-\*\•\u25CF\s]*[A-Za-zА-Яа-яЁё0-9 ]{1,30}\s*[—\-:]\s*(.+)$')
+_NEWLINES_RX    = re.compile(r"\s*\n\s*")
+_REVERSED_NOTE_RX = re.compile(r"\(\s*перев[ёе]рнут[аяы].*?\)")
+# буквы, которые re.IGNORECASE считает равными кириллическим (ᲀ ~ в, ᲄ ~ т …), а str.lower() — нет
+_CASE_VARIANTS_RX = re.compile("[\u1c80-\u1c88]")
+
+
+# ===================== СЛУЖЕБНОЕ: СПИСОК СТРОК =====================
+# Текст держится как список строк без символов перевода; "\n".join(lines) — текущий текст.
+
+def _is_blank(ln: str) -> bool:
+    return not ln or ln.isspace()
+
+
+def _squeeze(lines: List[str]) -> List[str]:
+    """re.sub(r"\\n{3,}", "\\n\\n", text).strip() над списком строк."""
+    out: List[str] = []
+    for ln in lines:
+        if ln == "" and out and out[-1] == "":
+            continue
+        out.append(ln)
+    return _strip(out)
+
+
+def _strip(lines: List[str]) -> List[str]:
+    """text.strip() над списком строк."""
+    start, end = 0, len(lines)
+    while start < end and _is_blank(lines[start]):
+        start += 1
+    while end > start and _is_blank(lines[end - 1]):
+        end -= 1
+    if start == end:
+        return []
+    out = lines[start:end]
+    out[0] = out[0].lstrip()
+    out[-1] = out[-1].rstrip()
+    return out
+
+
+# ===================== ШАГИ НАД СТРОКАМИ =====================
+def _sanitize(text: str) -> List[str]:
+    """Маркдаун (** и __) и маркеры списков в начале строк; вход — сырой текст."""
+    text = text.replace("**", "").replace("__", "")
+    lines = []
+    for line in text.splitlines():
+        raw = line.lstrip()
+        for marker in _MARKERS:
+            if raw.startswith(marker):
+                raw = raw[len(marker):]
+                break
+        if raw.startswith(_MARKER_PAIRS):
+            raw = raw[2:].lstrip()
+        lines.append(raw)
+    return _squeeze(lines)
+
+
+def _summary_no_advice(lines: List[str]) -> List[str]:
+    """Хвост после заголовка Итога — в одну строку, без «советных» предложений."""
+    idx = None
+    for i, ln in enumerate(lines):
+        low = ln.strip().lower()
+        if low.startswith("итог:") or low == "итог" or low.startswith("🌙 итог"):
+            idx = i
+            break
+    if idx is None:
+        return lines
+    tail_text = " ".join(s.strip() for s in lines[idx + 1:] if s.strip())
+    if not tail_text:
+        return lines
+    sentences = [s.strip() for s in _SENT_SPLIT_RX.split(tail_text) if s.strip()]
+    cleaned = get_advice_lexicon().drop_advice(sentences, "summary")
+    return _squeeze(lines[:idx + 1] + [" ".join(cleaned or [_SUMMARY_FALLBACK]).strip()])
+
+
+def _star_bullets(lines: List[str]) -> List[str]:
+    """Нумерация «1) », «2. » и «★ » в начале строки → «⭐️ »."""
+    out = []
+    for ln in lines:
+        if _NUM_BULLET_RX.match(ln.lstrip()):
+            ln = _NUM_BULLET_SUB.sub("⭐️ ", ln, count=1)
+        out.append(_STAR_BULLET_SUB.sub("⭐️ ", ln, count=1))
+    return out
+
+
+def _moon_on_itog(lines: List[str]) -> List[str]:
+    """Первая строка-заголовок Итога → «🌙 Итог: …»."""
+    for i, ln in enumerate(lines):
+        base = ln.strip()
+        if not base:
+            continue
+        if _ITOG_BASE_RX.match(base) or base.lower().startswith("🌙 итог"):
+            m = _ITOG_LINE_RX.match(ln)
+            rest = (m.group(1) if m else "").strip()
+            lines = lines[:]
+            lines[i] = ("🌙 Итог:" + (f" {rest}" if rest else "")).rstrip()
+            break
+    return _strip(lines)
+
+
+def _star_paragraphs(lines: List[str]) -> List[str]:
+    """«⭐️ » в начале каждого абзаца, кроме Итога (абзацы — через пустые строки)."""
+    out: List[str] = []
+    first = True  # следующая непустая строка открывает абзац
+    for ln in _strip(lines):
+        if _is_blank(ln):
+            if not first:
+                out.append("")
+            first = True
+            continue
+        if first:
+            first = False
+            if _PARA_ITOG_RX.match(ln):
+                m = _PARA_ITOG_LINE.match(ln)
+                rest = (m.group(1) if m else "").strip()
+                ln = ("🌙 Итог:" + (f" {rest}" if rest else "")).rstrip()
+            elif not _STAR_PREFIX_RX.match(ln):
+                ln = f"⭐️ {ln.lstrip()}"
+        out.append(ln)
+    return _strip(out)
+
+
+def _itog_three_sentences(lines: List[str]) -> List[str]:
+    """Итог — одна строка, ровно 3 предложения без советов; всё после заголовка сливается в Итог."""
+    if all(_is_blank(ln) for ln in lines):
+        return lines
+    lines = _moon_on_itog(lines)
+    idx = next((i for i, ln in enumerate(lines) if _MOON_ITOG_RX.match(ln)), None)
+    if idx is None:
+        return lines
+    parts = _MOON_SPLIT_RX.split(lines[idx])
+    inline = parts[1].strip() if len(parts) > 1 else ""
+    tail = " ".join(s.strip() for s in lines[idx + 1:] if s.strip())
+    full = _WS_RUN_RX.sub(" ", f"{inline} {tail}".strip())
+
+    sentences = [s.strip() for s in _SENT_SPLIT_RX.split(full) if s.strip()]
+    clean = get_advice_lexicon().drop_advice(sentences, "itog")[:3]
+    clean += [_ITOG_FILLER] * (3 - len(clean))
+    # строки без переводов, предложения без двойных пробелов — склейка уже «чистая»
+    joined = " ".join(s if s.endswith((".", "!", "?")) else s + "." for s in clean).strip()
+    return _strip(lines[:idx] + [f"🌙 Итог: {joined}"])
+
+
+def _drop_star_prefixes(lines: List[str]) -> List[str]:
+    """Советы: без ведущих «⭐️ » (в т.ч. перед «Карты:»)."""
+    return _strip([_STAR_CARDS_RX.sub(r"\1", _STAR_PREFIX_RX.sub("", ln, count=1), count=1) for ln in lines])
+
+
+def _drop_advice_header(lines: List[str]) -> List[str]:
+    """Шапка «Текст совета:» в начале ответа."""
+    if not lines or not lines[0][:5].lower() == "текст":
+        return lines
+    # шаблон может захватить переводы строк — редкий случай, считаем над текстом
+    return _ADVICE_HEAD_RX.sub("", "\n".join(lines), count=1).split("\n")
+
+
+# ===================== ШАГИ НАД ТЕКСТОМ (clarify_flow) =====================
+def _collapse_spaces(text: str) -> str:
+    text = _CRLF_RX.sub("\n", text)
+    text = _TRAIL_WS_RX.sub(r"\1", text)
+    text = _LEAD_WS_RX.sub("", text)
+    text = _NL3_RX.sub("\n\n", text)
+    text = _INNER_WS_RX.sub(" ", text)
+    return text.strip()
+
+
+def _clean_block(text: str) -> str:
+    """Без строк «Итог:/Вывод:/Совет:», эмодзи и буллетов."""
+    t = _LINE_DROP_RX.sub("", text)
+    t = _INLINE_ITOG_RX.sub("", t)
+    t = _NL3_RX.sub("\n\n", t).strip()
+    t = EMOJI_RX.sub("", t)
+    t = _BULLETS_RX.sub("", t)
+    return _NL3_RX.sub("\n\n", t).strip()
+
+
+def _collapse_card_named_lines(text: str) -> str:
+    lines = [l.strip() for l in text.splitlines() if l.strip()]
+    rhs_parts, other = [], []
+    for l in lines:
+        m = _CARD_NAMED_RX.match(l)
+        if m:
+            rhs_parts.append(m.group(1).strip())
+        else:
+            other.append(l)
+    if len(rhs_parts) >= 2:
+        paragraph = " ".join(rhs_parts)
+        text = ("\n\n".join(other + [paragraph])).strip() if other else paragraph
+    return text
+
+
+def _may_mention_suit(text: str, suit_stems: Tuple[str, ...]) -> bool:
+    """Без масти шаблон упоминания карты не сработает — а проверка в разы дешевле самого шаблона."""
+    low = text.lower()
+    return any(s in low for s in suit_stems) or bool(_CASE_VARIANTS_RX.search(text))
+
+
+def clean_point_text(text: str) -> str:
+    """Блок пункта сценария: без строк Итога/советов, эмодзи и буллетов (бывший sanitize_answer)."""
+    return _collapse_spaces(_clean_block(text))
+
+
+def clean_summary_text(text: str) -> str:
+    """Общий итог сценария одной строкой, без упоминаний карт (бывший sanitize_summary)."""
+    t = _NUMBERED_RX.sub("", _clean_block(text))
+    t = _collapse_card_named_lines(t)
+    t = _WS_RUN_RX.sub(" ", _NEWLINES_RX.sub(" ", t)).strip()
+    cards = get_card_registry()
+    if _may_mention_suit(t, cards.suit_stems):
+        t = cards.mention_rx.sub("", t)
+    return _REVERSED_NOTE_RX.sub("", t).strip()
+
+
+# ===================== ПРОФИЛИ =====================
+_LineStep = Callable[[List[str]], List[str]]
+_TextStep = Callable[[str], str]
+
+# (шаги над строками после _sanitize, шаги над текстом после склейки)
+_PROFILES: Dict[str, Tuple[Tuple[_LineStep, ...], Tuple[_TextStep, ...]]] = {
+    "prediction":    ((_summary_no_advice, _star_bullets, _moon_on_itog, _star_paragraphs, _itog_three_sentences), ()),
+    "partial":       ((_star_bullets, _moon_on_itog), ()),
+    "advice":        ((_drop_advice_header, _drop_star_prefixes), ()),
+    "plain":         ((), ()),
+}
+_PROFILES["point"] = (_PROFILES["prediction"][0], (clean_point_text,))
+_PROFILES["point_partial"] = (_PROFILES["partial"][0], (clean_point_text,))
+_PROFILES["summary"] = (_PROFILES["prediction"][0], (clean_summary_text,))
+
+PROFILES = tuple(_PROFILES)
+
+
+def normalize(text: Optional[str], profile: str = "prediction") -> str:
+    """Ответ модели → текст под место вызова (см. PROFILES)."""
+    if not isinstance(text, str):
+        return text
+    line_steps, text_steps = _PROFILES[profile]
+    lines = _sanitize(text)
+    for step in line_steps:
+        lines = step(lines)
+    out = "\n".join(lines)
+    for step in text_steps:
+        out = step(out)
+    return out
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from services.advice_lexicon import AdviceLexicon
+
+
+def test_scopes_and_nested_hints_in_one_scan():
+    lex = AdviceLexicon({"подума": ("scenario",), "подумайте": ("summary",), "вам стоит": ("itog",), "стоит": ("summary",)})
+    sentences = ["Подумайте о главном.", "Всё идёт своим чередом.", "Вам стоит отдохнуть."]
+
+    # короткий маркер внутри длинного не теряется, а сработавший маркер возвращается
+    assert lex.classify(sentences, "summary") == ["подумайте", None, "стоит"]
+    assert lex.classify(sentences, "scenario") == ["подума", None, None]
+    assert lex.drop_advice(sentences, "itog") == sentences[:2]
+    assert lex.lexicon_stats()["flagged"] == 4
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from services import card_draw
+from services.card_draw import draw_batch, draw_reading
+
+
+def test_batch_is_distinct_seeded_and_chunk_independent(monkeypatch):
+    batch = draw_batch(5000, 7, 0.5, seed=7)
+    assert batch.ids.shape == (5000, 7) and batch.reversed_mask.dtype == np.uint64
+    assert all(len(set(row)) == 7 for row in batch.ids.tolist())
+    assert 0.45 < batch.reversed_flags().mean() < 0.55
+
+    monkeypatch.setattr(card_draw, "CARD_DRAW_CHUNK", 333)
+    again = draw_batch(5000, 7, 0.5, seed=7)
+    assert (again.ids == batch.ids).all() and (again.reversed_mask == batch.reversed_mask).all()
+    assert not draw_batch(10, 30, 0.0, seed=1).reversed_mask.any()
+
+
+def test_reading_replays_exactly():
+    cards = draw_reading(42, "2026-10-17:love", 3, reversed_prob=0.5)
+    assert draw_reading(42, "2026-10-17:love", 3, reversed_prob=0.5) == cards
+    assert draw_reading(43, "2026-10-17:love", 3, reversed_prob=0.5) != cards
+    assert all(c.name for c in cards)
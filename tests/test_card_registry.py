@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+from services import card_registry
+from services.card_registry import CardRegistry
+
+DECK = [
+    {"arcana": "major", "name": "Шут", "meaning_upright": "Начало", "meaning_reversed": "Безрассудство"},
+    {"arcana": "minor", "suit": "Мечи", "rank": "Туз", "name": "Туз Мечи", "meaning_upright": "Ясность", "meaning_reversed": "Путаница"},
+]
+
+
+def test_lookup_and_declined_header(tmp_path, monkeypatch):
+    path = tmp_path / "cards.json"
+    path.write_text(json.dumps(DECK, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(card_registry, "CARD_REGISTRY_RECHECK_S", 0.0)
+    card_registry.set_card_registry(CardRegistry.load(path))
+    try:
+        reg = card_registry.get_card_registry()
+        assert reg.id_of("туз мечи (перевёрнутая)") == 1 and reg[1].suit == "Мечи"
+        line_rx, inline_rx = reg.header_rx("Туз Мечи (перевёрнутая)")
+        assert inline_rx.sub("", "Туз Мечей в перевёрнутом положении — ясность", count=1) == "ясность"
+        assert reg.mention_rx.search("Туз Мечей говорит") and not reg.mention_rx.search("Шут говорит")
+
+        # JSON на диске поменялся — реестр подменяется целиком
+        path.write_text(json.dumps(DECK[:1], ensure_ascii=False), encoding="utf-8")
+        os.utime(path, (reg.mtime + 10, reg.mtime + 10))
+        assert len(card_registry.get_card_registry()) == 1 and len(reg) == 2
+    finally:
+        card_registry.set_card_registry(None)
+
+
+def test_drawn_cards_pack_to_ids_and_back():
+    card_registry.set_card_registry(CardRegistry(DECK))
+    try:
+        cards = [card_registry.DrawnCard(1, True), card_registry.DrawnCard(0)]
+        assert [c.name for c in cards] == ["Туз Мечи (перевёрнутая)", "Шут"]
+        packed = card_registry.pack_cards(cards)
+        assert packed == {"keys": ["Туз Мечи", "Шут"], "rev": [1, 0]}
+        assert card_registry.unpack_cards(packed) == cards
+        # старые строки spread_log — имена карт и позиционные id (несуществующие отбрасываются)
+        assert card_registry.unpack_cards({"cards": ["Туз Мечи (перевёрнутая)", "Шут", "Нет такой"]}) == cards
+        assert card_registry.unpack_cards({"ids": [1, 0, 7, -1], "rev": [1, 0, 0, 0]}) == cards
+
+        # колоду перечитали в другом порядке — сохранённый расклад остаётся тем же
+        card_registry.set_card_registry(CardRegistry(DECK[::-1] + [{"name": "Маг"}]))
+        assert [c.name for c in card_registry.unpack_cards(packed)] == ["Туз Мечи (перевёрнутая)", "Шут"]
+    finally:
+        card_registry.set_card_registry(None)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from services.interp_cache import InterpretationCache
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_store_one_variant():
+    cache = InterpretationCache(variants=3, persist=False)
+    calls = 0
+
+    async def factory() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return f"толкование {calls}"
+
+    texts = await asyncio.gather(*(cache.get_or_create("k", factory) for _ in range(5)))
+    assert texts == ["толкование 1"] * 5 and calls == 1
+    assert await cache.variant_count("k") == 1
+
+    # тот же текст повторно не занимает слот ротации
+    await cache.put_variant("k", "толкование 1")
+    await cache.get_or_create("k", factory)
+    assert await cache.variant_count("k") == 2
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from services.llm_batch import BatchRunner
+from services.llm_client import close_llm_client
+from services.llm_errors import LLMError
+from services.llm_resilience import ResilientCaller
+from services.llm_standin import StandInServer
+from services.rate_limiter import get_rate_limiter
+
+MESSAGES = [{"role": "user", "text": "Карта дня"}]
+
+
+def _runner(srv: StandInServer, **kw) -> BatchRunner:
+    return BatchRunner(
+        url=srv.async_url, operations_url=srv.operations_url, model_uri="stand-in", api_key="test",
+        poll=0.01, caller=ResilientCaller(attempts=1, hedge=False), **kw,
+    )
+
+
+@pytest_asyncio.fixture
+async def server():
+    srv = StandInServer(reply=lambda p: "ответ: " + p["messages"][0]["text"], async_polls=2)
+    await srv.start()
+    yield srv
+    await srv.stop()
+    await close_llm_client()
+
+
+@pytest.mark.asyncio
+async def test_submit_poll_within_concurrency_budget(server):
+    runner = _runner(server, concurrency=2)
+    admitted = get_rate_limiter().class_stats["batch"].admitted
+    texts = await asyncio.gather(*(
+        runner.run([{"role": "user", "text": f"карта {i}"}], max_tokens=300) for i in range(5)
+    ))
+    assert texts == [f"ответ: карта {i}" for i in range(5)]
+    assert server.async_requests == 5 and server.requests == 0  # синхронный эндпоинт не тронут
+    assert runner.stats.peak_in_flight == 2 and runner.stats.polls >= 5
+    assert get_rate_limiter().class_stats["batch"].admitted == admitted + 5  # отправка — через лимитер
+    await runner.close()
+
+
+@pytest.mark.asyncio
+async def test_result_store_and_failure(server):
+    runner = _runner(server)
+    job_id, future = runner.submit(MESSAGES)
+    assert runner.result(job_id) is None
+    assert await future == "ответ: Карта дня"
+    assert runner.result(job_id) == "ответ: Карта дня"
+
+    server.status = 500
+    with pytest.raises(LLMError):
+        await runner.run(MESSAGES)
+    assert runner.stats.failed == 1
+    await runner.close()
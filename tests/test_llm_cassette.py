@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import gzip
+
+import pytest
+
+from services.llm_cassette import Cassette
+from services.llm_errors import LLMCassetteMiss
+
+MESSAGES = [{"role": "user", "text": "Карта дня"}]
+
+
+@pytest.mark.asyncio
+async def test_record_then_replay_in_order(tmp_path):
+    path = str(tmp_path / "tape.jsonl.gz")
+    rec = Cassette(path, "record")
+    answers = iter(["первый", "второй"])
+
+    async def call() -> str:
+        return next(answers)
+
+    assert await rec.through("daily", MESSAGES, call) == "первый"
+    assert await rec.through("daily", MESSAGES, call) == "второй"
+    rec.close()
+
+    with gzip.open(path, "ab") as f:  # оборванная последняя запись не мешает чтению
+        f.write(b'{"key": "obr')
+    play = Cassette(path, "replay")
+    assert play.stats.loaded == 2
+    assert [await play.through("daily", MESSAGES, call) for _ in range(3)] == ["первый", "второй", "первый"]
+
+    with pytest.raises(LLMCassetteMiss):
+        await play.through("point", MESSAGES, call)
+    assert play.cassette_stats()["misses"] == 1
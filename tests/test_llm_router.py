@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import pytest
+import pytest_asyncio
+
+from services.llm_client import close_llm_client
+from services.llm_errors import LLMOverloaded
+from services.llm_providers import ProviderRouter, YandexProvider, TemplateProvider
+from services.llm_resilience import ResilientCaller
+from services.llm_standin import StandInServer
+
+MESSAGES = [{"role": "user", "text": "Карта дня"}]
+
+
+def _provider(name: str, srv: StandInServer) -> YandexProvider:
+    return YandexProvider(
+        name, model_uri=f"stand-in/{name}", url=srv.url, api_key="test",
+        caller=ResilientCaller(attempts=1, hedge=False),
+    )
+
+
+@pytest_asyncio.fixture
+async def servers():
+    a, b = StandInServer(reply="ответ A"), StandInServer(reply="ответ B")
+    await a.start()
+    await b.start()
+    yield a, b
+    await a.stop()
+    await b.stop()
+    await close_llm_client()
+
+
+@pytest.mark.asyncio
+async def test_failover_and_bypass_of_failing_provider(servers):
+    a, b = servers
+    a.status = 500
+    router = ProviderRouter([_provider("a", a), _provider("b", b)], default_route=["a", "b"])
+
+    for _ in range(2):
+        assert await router.complete(MESSAGES, kind="point") == "ответ B"
+    assert router.failovers == 2
+
+    # «a» сбоит на пунктах — следующий такой вызов сразу идёт в «b»; другие типы не задеты
+    seen = a.requests
+    assert [p.name for p in router.candidates("point")] == ["b", "a"]
+    assert [p.name for p in router.candidates("advice")] == ["a", "b"]
+    assert await router.complete(MESSAGES, kind="point") == "ответ B"
+    assert a.requests == seen
+
+
+@pytest.mark.asyncio
+async def test_local_queue_rejection_is_not_failed_over(servers):
+    a, b = servers
+
+    class Busy(TemplateProvider):
+        async def complete(self, messages, **kw):
+            raise LLMOverloaded("очередь переполнена")
+
+    router = ProviderRouter([Busy("busy"), _provider("b", b)], default_route=["busy", "b"])
+    with pytest.raises(LLMOverloaded):
+        await router.complete(MESSAGES)
+    assert b.requests == 0 and router.failovers == 0 and router.local_rejects == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_provider_is_moved_to_the_end(servers):
+    a, b = servers
+    a.delay = 0.3
+    router = ProviderRouter([_provider("a", a), _provider("b", b)], default_route=["a", "b"], slow_sec=0.1)
+
+    assert await router.complete(MESSAGES) == "ответ A"
+    assert await router.complete(MESSAGES) == "ответ B"
+
+
+@pytest.mark.asyncio
+async def test_stream_and_template_fallback(servers):
+    a, b = servers
+    a.reply = "⭐️ Шут: начало пути.\n\n🌙 Итог: Всё впереди. Путь открыт. Время идти."
+    router = ProviderRouter([_provider("a", a), TemplateProvider()], default_route=["a", "template"])
+
+    chunks = [t async for t in router.stream(MESSAGES)]
+    assert len(chunks) > 1 and chunks[-1] == a.reply
+
+    a.status = 503
+    text = await router.complete(MESSAGES, hints={"cards": ["Шут (перевёрнутая)"]})
+    assert text.startswith("⭐️ Шут (перевёрнутая):") and "🌙 Итог:" in text
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import pytest
+import pytest_asyncio
+
+from services.llm_client import close_llm_client
+from services.llm_errors import LLMOverloaded
+from services.llm_providers import YandexProvider
+from services.llm_resilience import ResilientCaller
+from services.llm_standin import Latency, StandInServer
+from services.tarot_ai import _prediction_prompt
+
+
+def _provider(srv: StandInServer) -> YandexProvider:
+    return YandexProvider(
+        "stand-in", model_uri="stand-in", url=srv.url, api_key="test",
+        caller=ResilientCaller(attempts=1, hedge=False),
+    )
+
+
+@pytest_asyncio.fixture
+async def server():
+    srv = StandInServer(seed=7)
+    await srv.start()
+    yield srv
+    await srv.stop()
+    await close_llm_client()
+
+
+@pytest.mark.asyncio
+async def test_tarot_reply_follows_prompt_and_max_tokens(server):
+    prompt = _prediction_prompt("Что ждёт меня?", "Любовь", "3 карты", "Шут, Маг (перевёрнутая), Солнце")
+    messages = [{"role": "user", "text": prompt}]
+    provider = _provider(server)
+
+    text = await provider.complete(messages)
+    assert [ln.split(":")[0] for ln in text.split("\n\n")] == [
+        "⭐️ Шут", "⭐️ Маг (перевёрнутая)", "⭐️ Солнце", "🌙 Итог",
+    ]
+    chunks = [t async for t in provider.stream(messages)]
+    assert len(chunks) > 1 and chunks[-1].startswith("⭐️ Шут")
+
+    short = await provider.complete(messages, max_tokens=20)
+    assert len(short) < len(text) and server.truncated == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_answers_carry_retry_after(server):
+    server.rate_429, server.retry_after = 1.0, 3
+    with pytest.raises(LLMOverloaded) as exc:
+        await _provider(server).complete([{"role": "user", "text": "Карта дня"}])
+    assert exc.value.retry_after == 3 and server.served_429 == 1
+
+
+def test_latency_specs():
+    assert Latency.parse("0.25").sample() == 0.25
+    assert all(0.5 <= Latency.parse("uniform:0.5:2").sample() <= 2 for _ in range(100))
+    assert all(Latency.parse("lognorm:1.5:0.4").sample() > 0 for _ in range(100))
+    with pytest.raises(ValueError):
+        Latency.parse("gamma:1:2")
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip("transformers")
+
+from services.qwen_worker import TINY_MODEL, QwenWorkerClient
+
+
+@pytest.mark.asyncio
+async def test_concurrent_prompts_are_batched():
+    client = QwenWorkerClient(TINY_MODEL, batch_max=4, batch_wait=0.5, timeout=120)
+    try:
+        prompts = [[{"role": "user", "text": f"карта {w}"}] for w in ("шут", "маг башня", "луна", "мир солнце звезда")]
+        texts = await asyncio.gather(*(client.generate(m, max_tokens=8, temperature=0) for m in prompts))
+        assert len(texts) == 4 and all(isinstance(t, str) for t in texts)
+
+        stats = client.worker_stats()
+        assert stats["starts"] == 1 and stats["completed"] == 4
+        assert stats["max_batch"] > 1 and stats["tokens"] > 0 and stats["tokens_per_sec"] > 0
+    finally:
+        client.close()
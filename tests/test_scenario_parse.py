@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from services.tarot_ai import parse_scenario_reading
+
+BODY = "Карта говорит о переменах, которые уже начались и набирают силу."
+
+
+def test_well_formed_reply():
+    text = f"=== ПУНКТ 1 ===\n{BODY}\n=== ПУНКТ 2 ===\n{BODY} Второй.\n=== ИТОГ ===\nВсё сложится."
+    points, itog = parse_scenario_reading(text, 2)
+    assert points == [BODY, BODY + " Второй."] and itog == "Всё сложится."
+
+
+def test_missing_point_and_duplicate_left_for_fallback():
+    points, itog = parse_scenario_reading(f"=== ПУНКТ 1 ===\n{BODY}\n=== ПУНКТ 3 ===\n{BODY}", 3)
+    assert points == [BODY, None, BODY] and itog is None
+
+    points, _ = parse_scenario_reading(f"=== ПУНКТ 1 ===\n{BODY}\n=== ПУНКТ 1 ===\n{BODY}", 1)
+    assert points == [None]
+
+
+def test_inline_point_markers():
+    text = f"Пункт 1. {BODY}\nПункт 2) {BODY}\nИтог: Всё сложится."
+    points, itog = parse_scenario_reading(text, 2)
+    assert points == [BODY, BODY] and itog == "Всё сложится."
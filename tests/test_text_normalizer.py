@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import json
+from pathlib import Path
+
+import pytest
+
+from services.text_normalizer import PROFILES, normalize
+
+# Эталоны сняты с прежней цепочки regex-проходов (tarot_ai._format_prediction & co,
+# clarify_flow.sanitize_answer/sanitize_summary) — новый нормализатор обязан совпадать байт в байт.
+GOLDEN = json.loads((Path(__file__).parent / "golden" / "normalizer.json").read_text(encoding="utf-8"))
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_matches_golden_output(profile):
+    for case in GOLDEN:
+        assert normalize(case["input"], profile) == case["expected"][profile], case["input"]
+
+
+def test_unknown_profile_rejected():
+    with pytest.raises(KeyError):
+        normalize("текст", "nope")